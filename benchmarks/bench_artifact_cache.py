@@ -0,0 +1,119 @@
+"""
+Benchmark the shared artifact cache against downloading artifacts per step.
+
+Writes a run's artifacts (a model directory and the train, validation and
+test splits, of --model-mib and --split-mib) to a local file store whose file
+downloads are throttled to --latency-ms per file and --bandwidth-mbps, as a
+stand-in for a remote artifact store. It then replays the downloads of
+--pipelines pipeline runs: `train` reads the train and validation splits,
+`evaluate` and `model_validate` each read the test split and the model. The
+legacy version downloads every artifact to a temporary directory, as
+`mlflow.artifacts.download_artifacts` does; the new one is
+`artifact_cache.ArtifactCache`.
+
+    python benchmarks/bench_artifact_cache.py --pipelines 3 --bandwidth-mbps 100
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import click
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "scripts")
+)
+
+from mlflow.store.artifact.local_artifact_repo import LocalArtifactRepository
+
+from artifact_cache import ArtifactCache
+
+STEP_ARTIFACTS = {
+    "train": ["data/train.parquet", "data/validation.parquet"],
+    "evaluate": ["data/test.parquet", "model"],
+    "model_validate": ["data/test.parquet", "model"],
+}
+
+
+def _write_artifacts(root, model_mib, split_mib):
+    files = {
+        "model/model.pkl": model_mib,
+        "model/MLmodel": 0.001,
+        "data/train.parquet": split_mib * 0.7,
+        "data/validation.parquet": split_mib * 0.15,
+        "data/test.parquet": split_mib * 0.15,
+    }
+    for path, mib in files.items():
+        os.makedirs(os.path.dirname(os.path.join(root, path)), exist_ok=True)
+        with open(os.path.join(root, path), "wb") as f:
+            f.write(os.urandom(int(mib * 2**20)))
+
+
+def _throttle(latency_ms, bandwidth_mbps):
+    download_file = LocalArtifactRepository._download_file
+
+    def _download_file(self, remote_file_path, local_path):
+        size = os.path.getsize(os.path.join(self.artifact_dir, remote_file_path))
+        time.sleep(latency_ms / 1000 + size * 8 / (bandwidth_mbps * 1e6))
+        download_file(self, remote_file_path, local_path)
+
+    LocalArtifactRepository._download_file = _download_file
+
+
+def _replay(store_uri, pipelines, fetch):
+    start = time.perf_counter()
+    for _ in range(pipelines):
+        for artifacts in STEP_ARTIFACTS.values():
+            for artifact_path in artifacts:
+                fetch("{}/{}".format(store_uri, artifact_path))
+    return time.perf_counter() - start
+
+
+@click.command(help="Benchmark the artifact cache against per-step downloads")
+@click.option("--pipelines", type=int, default=3)
+@click.option("--model-mib", type=float, default=25.0)
+@click.option("--split-mib", type=float, default=20.0)
+@click.option("--latency-ms", type=float, default=50.0)
+@click.option("--bandwidth-mbps", type=float, default=200.0)
+def bench(pipelines, model_mib, split_mib, latency_ms, bandwidth_mbps):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        store = os.path.join(tmpdir, "store")
+        _write_artifacts(store, model_mib, split_mib)
+        _throttle(latency_ms, bandwidth_mbps)
+        store_uri = "file://" + store
+
+        print(
+            "{} pipelines, {:.0f} MiB model, {:.0f} MiB splits, {:.0f} ms + "
+            "{:.0f} Mbit/s per file".format(
+                pipelines, model_mib, split_mib, latency_ms, bandwidth_mbps
+            )
+        )
+        print(
+            "{:<10}{:>10}{:>10}{:>10}{:>14}".format(
+                "version", "wall s", "hits", "misses", "MiB fetched"
+            )
+        )
+        caches = {
+            "legacy": ArtifactCache(os.path.join(tmpdir, "legacy"), max_bytes=0),
+            "cache": ArtifactCache(os.path.join(tmpdir, "cache")),
+        }
+        for version, cache in caches.items():
+            wall_s = _replay(store_uri, pipelines, cache.fetch)
+            print(
+                "{:<10}{:>10.2f}{:>10}{:>10}{:>14.1f}".format(
+                    version,
+                    wall_s,
+                    cache.hits,
+                    cache.misses,
+                    cache.bytes_downloaded / 2**20,
+                )
+            )
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    bench()
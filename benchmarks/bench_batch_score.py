@@ -0,0 +1,127 @@
+"""
+Benchmark batch scoring of a large file against scoring it in one piece.
+
+Fits the resale model (feature transformer and --engine with --n-estimators
+trees) on --filepath and writes the file --repeat times over to a csv, as a
+stand-in for the full resale history. The legacy version reads the whole csv,
+predicts it with the sklearn estimator and writes it to parquet, as a script
+around `mlflow.pyfunc.load_model` does; the new one is
+`batch_score.score_file` with the flat ensemble, --chunksize rows per chunk and
+--workers processes. Each version runs in a fresh process, whose peak
+resident memory is reported (the scoring workers of the new version are
+excluded, they hold a chunk each).
+
+    python benchmarks/bench_batch_score.py --repeat 200 --chunksize 100000
+"""
+
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import click
+import pandas as pd
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "scripts")
+)
+
+from batch_score import PREDICTION_COLUMN, score_file
+from feature_transformer import TARGET, FeatureTransformer, clean_data, fit_vocabulary
+from resale_model import ResalePriceModel
+from train import make_estimator
+from tree_ensemble import FlatTreeEnsemble
+
+
+def _model(model):
+    return model
+
+
+def _legacy_score(filepath, output, model):
+    data = pd.read_csv(filepath)
+    data[PREDICTION_COLUMN] = model.predict(None, data)
+    data.to_parquet(output, index=False)
+    return len(data)
+
+
+def _run(score, *args):
+    # in a fresh process, to measure its peak memory
+    start = time.perf_counter()
+    rows = score(*args)
+    wall_s = time.perf_counter() - start
+    return rows, wall_s, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@click.command(help="Benchmark chunked batch scoring against in-memory scoring")
+@click.option("--repeat", type=int, default=100)
+@click.option("--engine", type=str, default="rf_mse")
+@click.option("--n-estimators", type=int, default=100)
+@click.option("--chunksize", type=int, default=50000)
+@click.option("--workers", type=int, default=-1)
+@click.option("--filepath", type=str, default="data/resale-flat-prices-2022-jan.csv")
+def bench(repeat, engine, n_estimators, chunksize, workers, filepath):
+    warnings.simplefilter("ignore")
+    raw = pd.read_csv(filepath)
+    cleaned = clean_data(raw)
+    transformer = FeatureTransformer(fit_vocabulary(cleaned))
+    data = transformer.encode(cleaned)
+    estimator = make_estimator(engine, n_estimators, "sqrt", None, 2, 1).fit(
+        data.drop(columns=TARGET), data[TARGET]
+    )
+    legacy_model, new_model = ResalePriceModel(), ResalePriceModel()
+    legacy_model.transformer, legacy_model.estimator = transformer, estimator
+    new_model.transformer = transformer
+    new_model.estimator = FlatTreeEnsemble.from_estimator(estimator)
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        history = os.path.join(tmpdir, "history.csv")
+        pd.concat([raw] * repeat).to_csv(history, index=False)
+        print(
+            "{} rows ({:.0f} MiB csv), {} with {} trees, chunks of {} rows".format(
+                len(raw) * repeat,
+                os.path.getsize(history) / 2**20,
+                engine,
+                n_estimators,
+                chunksize,
+            )
+        )
+        print(
+            "{:<10}{:>10}{:>12}{:>14}".format("version", "wall s", "rows/s", "peak MiB")
+        )
+        versions = {
+            "legacy": (_legacy_score, legacy_model),
+            "chunked": (
+                partial(score_file, chunksize=chunksize, workers=workers),
+                partial(_model, new_model),
+            ),
+        }
+        for version, (score, model) in versions.items():
+            output = os.path.join(tmpdir, version + ".parquet")
+            with ProcessPoolExecutor(1) as executor:
+                rows, wall_s, peak_mib = executor.submit(
+                    _run, score, history, output, model
+                ).result()
+            print(
+                "{:<10}{:>10.2f}{:>12.0f}{:>14.0f}".format(
+                    version, wall_s, rows / wall_s, peak_mib
+                )
+            )
+        legacy = pd.read_parquet(os.path.join(tmpdir, "legacy.parquet"))
+        chunked = pd.read_parquet(os.path.join(tmpdir, "chunked.parquet"))
+        print(
+            "max prediction gap: {:.2e}".format(
+                (legacy[PREDICTION_COLUMN] - chunked[PREDICTION_COLUMN]).abs().max()
+            )
+        )
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    bench()
@@ -0,0 +1,88 @@
+"""
+Benchmark drift checks against the reference bins of the schema.
+
+Resamples the Jan-2022 sample to each row count as new data, and compares
+checking its drift from the sample the raw-data way (reload the reference
+csv, two-sample KS test of each numeric column, PSI over quantile bins of
+the reference) against `compare_drift_to_schema` on the reference bins stored
+in the schema and the profile data validation computes anyway.
+
+    python benchmarks/bench_drift.py --num-rows 100000 --num-rows 1000000
+"""
+
+import json
+import os
+import sys
+import time
+
+import click
+import numpy as np
+import pandas as pd
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "scripts")
+)
+
+from utils import DRIFT_EPSILON, compare_drift_to_schema, infer_schema, profile_data
+
+
+def _legacy_drift(filepath, data, num_bins=10):
+    from scipy.stats import ks_2samp
+
+    reference = pd.read_csv(filepath)
+    scores = {}
+    for col in data.columns:
+        if data[col].dtype.kind not in "iufc":
+            continue
+        edges = np.unique(reference[col].quantile(np.arange(1, num_bins) / num_bins))
+        expected = np.bincount(
+            np.searchsorted(edges, reference[col], side="right"),
+            minlength=len(edges) + 1,
+        ) / len(reference)
+        actual = np.bincount(
+            np.searchsorted(edges, data[col], side="right"), minlength=len(edges) + 1
+        ) / len(data)
+        p = np.clip(actual, DRIFT_EPSILON, None)
+        q = np.clip(expected, DRIFT_EPSILON, None)
+        scores[col] = {
+            "psi": float(np.sum((p - q) * np.log(p / q))),
+            "ks": ks_2samp(reference[col], data[col]).statistic,
+        }
+    return scores
+
+
+def _best(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+@click.command(help="Benchmark drift checks on schema bins against raw data")
+@click.option("--num-rows", type=int, multiple=True, default=[100000, 1000000])
+@click.option("--repeat", type=int, default=3)
+@click.option("--filepath", type=str, default="data/resale-flat-prices-2022-jan.csv")
+def bench(num_rows, repeat, filepath):
+    sample = pd.read_csv(filepath)
+    schema = infer_schema(sample, num_bins=10)
+    bins_kb = len(json.dumps({c: s["bins"] for c, s in schema.items()})) / 1024
+    print("reference bins: {:.1f} KB".format(bins_kb))
+    rng = np.random.default_rng(2023)
+    print("{:>10}{:>14}{:>14}{:>14}".format("rows", "raw s", "profile s", "drift ms"))
+    for n in num_rows:
+        data = sample.iloc[rng.integers(0, len(sample), n)].reset_index(drop=True)
+        profile = profile_data(data)
+        print(
+            "{:>10}{:>14.3f}{:>14.3f}{:>14.2f}".format(
+                n,
+                _best(lambda: _legacy_drift(filepath, data), repeat),
+                _best(lambda: profile_data(data), repeat),
+                _best(lambda: compare_drift_to_schema(schema, profile), repeat) * 1e3,
+            )
+        )
+
+
+if __name__ == "__main__":
+    bench()
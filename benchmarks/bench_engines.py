@@ -0,0 +1,73 @@
+"""
+Benchmark the training engines of `train`.
+
+Holds out 20% of the distinct rows of the Jan-2022 sample as validation rows,
+resamples the other rows to each row count and fits every engine of
+`train.make_estimator` on them with the pipeline's hyperparameters. Reports
+the fit time and the MAE on the held-out rows, none of which are trained on.
+
+The "rf_mae" forest's split search is close to quadratic in the rows of a
+node, so it is skipped above --max-mae-rows.
+
+    python benchmarks/bench_engines.py --num-rows 10000 --num-rows 100000 --num-rows 1000000
+"""
+
+import os
+import sys
+import time
+
+import click
+import numpy as np
+import pandas as pd
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "scripts")
+)
+
+from feature_transformer import TARGET, FeatureTransformer, clean_data, fit_vocabulary
+from train import make_estimator
+from utils import ENGINES
+
+
+@click.command(help="Benchmark fit time and validation MAE of the training engines")
+@click.option("--num-rows", type=int, multiple=True, default=[10000, 100000, 1000000])
+@click.option("--max-mae-rows", type=int, default=100000)
+@click.option("--n-estimators", type=int, default=10)
+@click.option("--max-features", type=str, default="sqrt")
+@click.option("--max-depth", type=int, default=1)
+@click.option("--filepath", type=str, default="data/resale-flat-prices-2022-jan.csv")
+def bench(num_rows, max_mae_rows, n_estimators, max_features, max_depth, filepath):
+    from sklearn.metrics import mean_absolute_error
+
+    sample = pd.read_csv(filepath).drop_duplicates()
+    vocabulary = fit_vocabulary(clean_data(sample))
+    transformer = FeatureTransformer(vocabulary)
+    rng = np.random.default_rng(2023)
+    rows = rng.permutation(len(sample))
+    split = int(0.8 * len(sample))
+    train_sample = sample.iloc[rows[:split]]
+    validation = transformer.encode(clean_data(sample.iloc[rows[split:]]))
+    X_val, y_val = validation.drop(columns=TARGET), validation[TARGET].to_numpy()
+    print(
+        "{:>10}{:>10}{:>12}{:>18}".format("rows", "engine", "fit s", "validation MAE")
+    )
+    for n in num_rows:
+        raw = train_sample.iloc[rng.integers(0, len(train_sample), n)]
+        data = transformer.encode(clean_data(raw.reset_index(drop=True)))
+        X, y = data.drop(columns=TARGET), data[TARGET].to_numpy()
+        for engine in ENGINES:
+            if engine == "rf_mae" and n > max_mae_rows:
+                print("{:>10}{:>10}{:>12}{:>18}".format(n, engine, "skipped", "-"))
+                continue
+            estimator = make_estimator(
+                engine, n_estimators, max_features, max_depth, 2, 1
+            )
+            start = time.perf_counter()
+            estimator.fit(X, y)
+            fit_s = time.perf_counter() - start
+            mae = mean_absolute_error(y_val, estimator.predict(X_val))
+            print("{:>10}{:>10}{:>12.2f}{:>18.0f}".format(n, engine, fit_s, mae))
+
+
+if __name__ == "__main__":
+    bench()
@@ -0,0 +1,97 @@
+"""
+Benchmark the per-row overhead of encoding raw resale rows for serving.
+
+Fits the FeatureTransformer and the pipeline's random forest on the Jan-2022
+sample, saves them as the pyfunc model `train` logs, and reports the time per
+row of `FeatureTransformer.transform` alone and of the pyfunc `predict` (schema
+enforcement, encoding and the forest) for each batch size.
+
+    python benchmarks/bench_feature_transformer.py --batch-size 1 --batch-size 1000
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import click
+import mlflow
+import numpy as np
+import pandas as pd
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "scripts")
+)
+
+from feature_transformer import TARGET, FeatureTransformer, clean_data, fit_vocabulary
+from resale_model import CODE_PATHS, SIGNATURE, ResalePriceModel
+
+
+def _save_model(raw, workdir):
+    from sklearn.ensemble import RandomForestRegressor
+
+    transformer = FeatureTransformer(fit_vocabulary(clean_data(raw)))
+    transformer_path = os.path.join(workdir, "feature_transformer.json")
+    transformer.save(transformer_path)
+
+    rfr = RandomForestRegressor(
+        n_estimators=10,
+        max_features="sqrt",
+        max_depth=1,
+        criterion="absolute_error",
+        n_jobs=-1,
+        random_state=2023,
+    )
+    rfr.fit(transformer.transform(raw), raw[TARGET])
+    estimator_path = os.path.join(workdir, "estimator")
+    mlflow.sklearn.save_model(rfr, estimator_path)
+
+    model_path = os.path.join(workdir, "pyfunc_model")
+    mlflow.pyfunc.save_model(
+        model_path,
+        python_model=ResalePriceModel(),
+        artifacts={
+            "estimator": estimator_path,
+            "feature_transformer": transformer_path,
+        },
+        code_path=CODE_PATHS,
+        signature=SIGNATURE,
+    )
+    return transformer, mlflow.pyfunc.load_model(model_path)
+
+
+def _us_per_row(fn, batch, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(batch)
+        timings.append(time.perf_counter() - start)
+    return min(timings) / len(batch) * 1e6
+
+
+@click.command(help="Benchmark raw-row encoding overhead of the served model")
+@click.option(
+    "--batch-size", type=int, multiple=True, default=[1, 10, 100, 1000, 10000]
+)
+@click.option("--repeat", type=int, default=20)
+@click.option("--filepath", type=str, default="data/resale-flat-prices-2022-jan.csv")
+def bench(batch_size, repeat, filepath):
+    raw = pd.read_csv(filepath)
+    transformer, model = _save_model(raw, tempfile.mkdtemp())
+    rows = raw.drop(columns=TARGET)
+    rng = np.random.default_rng(2023)
+
+    print("{:>10}{:>16}{:>16}".format("batch", "transform us", "predict us"))
+    for n in batch_size:
+        batch = rows.iloc[rng.integers(0, len(rows), n)].reset_index(drop=True)
+        print(
+            "{:>10}{:>16.1f}{:>16.1f}".format(
+                n,
+                _us_per_row(transformer.transform, batch, repeat),
+                _us_per_row(model.predict, batch, repeat),
+            )
+        )
+
+
+if __name__ == "__main__":
+    bench()
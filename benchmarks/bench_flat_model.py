@@ -0,0 +1,162 @@
+"""
+Benchmark the flat tree-ensemble format against the pickled estimator.
+
+Fits each engine on the Jan-2022 sample resampled to --num-rows rows, saves it
+as a pickle (the format of `mlflow.sklearn.log_model`) and as a
+`tree_ensemble.FlatTreeEnsemble`, and reports:
+
+- size on disk
+- load time in this process, and wall time of a fresh python process that
+  imports what it needs, loads the model and predicts one row (cold load)
+- predict latency of one row (median of 200 calls) and of --batch-rows rows
+
+Predictions of both formats are checked to be equal.
+
+    python benchmarks/bench_flat_model.py --n-estimators 100 --max-depth 0
+"""
+
+import os
+import pickle
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+import numpy as np
+import pandas as pd
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "scripts")
+sys.path.append(SCRIPTS_DIR)
+
+from feature_transformer import TARGET, FeatureTransformer, clean_data, fit_vocabulary
+from train import make_estimator
+from tree_ensemble import FlatTreeEnsemble
+
+COLD_PICKLE = """
+import pickle, numpy as np
+with open({path!r}, "rb") as f:
+    model = pickle.load(f)
+model.predict(np.load({row!r}))
+"""
+COLD_FLAT = """
+import sys, numpy as np
+sys.path.append({scripts!r})
+from tree_ensemble import FlatTreeEnsemble
+model = FlatTreeEnsemble.load({path!r})
+model.predict(np.load({row!r}))
+"""
+
+
+def _best(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def _median_latency(fn, calls=200):
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def _cold(code):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], check=True)
+    return time.perf_counter() - start
+
+
+def _dir_size(path):
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+
+@click.command(help="Benchmark the flat tree-ensemble format against pickle")
+@click.option("--num-rows", type=int, default=100000)
+@click.option("--batch-rows", type=int, default=100000)
+@click.option("--engine", type=str, multiple=True, default=["rf_mse", "hgb"])
+@click.option("--n-estimators", type=int, default=100)
+@click.option(
+    "--max-depth", type=int, default=0, help="Depth of the trees, 0 for unlimited"
+)
+@click.option("--filepath", type=str, default="data/resale-flat-prices-2022-jan.csv")
+def bench(num_rows, batch_rows, engine, n_estimators, max_depth, filepath):
+    cleaned = clean_data(pd.read_csv(filepath))
+    data = FeatureTransformer(fit_vocabulary(cleaned)).encode(cleaned)
+    rng = np.random.default_rng(2023)
+    data = data.iloc[rng.integers(0, len(data), num_rows)].reset_index(drop=True)
+    X, y = data.drop(columns=TARGET).to_numpy(), data[TARGET].to_numpy()
+    batch = X[rng.integers(0, num_rows, batch_rows)]
+
+    print(
+        "{} rows, {} estimators, max_depth={}".format(
+            num_rows, n_estimators, max_depth or None
+        )
+    )
+    print(
+        "{:<8}{:<8}{:>10}{:>10}{:>10}{:>12}{:>12}".format(
+            "engine", "format", "MiB", "load s", "cold s", "1 row ms", "batch s"
+        )
+    )
+    for name in engine:
+        estimator = make_estimator(
+            name, n_estimators, "sqrt", max_depth or None, 2, 1
+        ).fit(X, y)
+        if hasattr(estimator, "n_jobs"):
+            # sklearn sums the trees in the order they finish with more jobs
+            estimator.set_params(n_jobs=1)
+        flat = FlatTreeEnsemble.from_estimator(estimator)
+        assert np.array_equal(flat.predict(batch), estimator.predict(batch))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            pickle_path = os.path.join(tmpdir, "model.pkl")
+            flat_path = os.path.join(tmpdir, "flat_model")
+            row_path = os.path.join(tmpdir, "row.npy")
+            with open(pickle_path, "wb") as f:
+                pickle.dump(estimator, f)
+            flat.save(flat_path)
+            np.save(row_path, batch[:1])
+
+            def load_pickle():
+                with open(pickle_path, "rb") as f:
+                    return pickle.load(f)
+
+            loaded = {
+                "pickle": load_pickle(),
+                "flat": FlatTreeEnsemble.load(flat_path),
+            }
+            rows = {
+                "pickle": (
+                    os.path.getsize(pickle_path) / 2**20,
+                    _best(load_pickle),
+                    _cold(COLD_PICKLE.format(path=pickle_path, row=row_path)),
+                ),
+                "flat": (
+                    _dir_size(flat_path) / 2**20,
+                    _best(lambda: FlatTreeEnsemble.load(flat_path)),
+                    _cold(
+                        COLD_FLAT.format(
+                            scripts=SCRIPTS_DIR, path=flat_path, row=row_path
+                        )
+                    ),
+                ),
+            }
+            for fmt, (mib, load_s, cold_s) in rows.items():
+                model = loaded[fmt]
+                row_ms = _median_latency(lambda: model.predict(batch[:1])) * 1000
+                batch_s = _best(lambda: model.predict(batch), repeat=3)
+                print(
+                    "{:<8}{:<8}{:>10.2f}{:>10.4f}{:>10.2f}{:>12.3f}{:>12.3f}".format(
+                        name, fmt, mib, load_s, cold_s, row_ms, batch_s
+                    )
+                )
+
+
+if __name__ == "__main__":
+    bench()
@@ -0,0 +1,100 @@
+"""
+Benchmark compact one-hot features through encoding and training.
+
+Resamples the Jan-2022 sample, encodes it with float64 and uint8 one-hot
+features, and fits the pipeline's random forest on the encoded dataframe and
+on its CSR matrix. Reports the size of the features, the peak memory numpy
+allocates (tracemalloc) while encoding and fitting, and the fit time.
+
+The pipeline fits with criterion="absolute_error", whose cost grows
+quadratically with the rows of a node, so fit times are measured with
+--criterion squared_error by default.
+
+    python benchmarks/bench_onehot_compact.py --num-rows 1000000
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+import click
+import numpy as np
+import pandas as pd
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "scripts")
+)
+
+from feature_transformer import TARGET, FeatureTransformer, clean_data, fit_vocabulary
+from utils import to_csr
+
+VARIANTS = [
+    ("float64 dense", "float64", "dense"),
+    ("uint8 dense", "uint8", "dense"),
+    ("uint8 csr", "uint8", "csr"),
+]
+
+
+def _traced(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak / 2**20
+
+
+def _nbytes(X):
+    if isinstance(X, pd.DataFrame):
+        return X.memory_usage(index=False).sum()
+    return X.data.nbytes + X.indices.nbytes + X.indptr.nbytes
+
+
+@click.command(help="Benchmark compact one-hot features at scale")
+@click.option("--num-rows", type=int, default=1000000)
+@click.option("--criterion", type=str, default="squared_error")
+@click.option("--filepath", type=str, default="data/resale-flat-prices-2022-jan.csv")
+def bench(num_rows, criterion, filepath):
+    from sklearn.ensemble import RandomForestRegressor
+
+    sample = pd.read_csv(filepath)
+    rng = np.random.default_rng(2023)
+    raw = sample.iloc[rng.integers(0, len(sample), num_rows)].reset_index(drop=True)
+    cleaned = clean_data(raw)
+    vocabulary = fit_vocabulary(cleaned)
+    y = cleaned[TARGET].to_numpy()
+
+    print("{} rows, criterion={}".format(num_rows, criterion))
+    print(
+        "{:<16}{:>14}{:>16}{:>14}{:>12}".format(
+            "features", "size MiB", "encode peak MiB", "fit peak MiB", "fit s"
+        )
+    )
+    for name, onehot_dtype, feature_matrix in VARIANTS:
+        transformer = FeatureTransformer(vocabulary, onehot_dtype=onehot_dtype)
+
+        def encode():
+            X = transformer.encode(cleaned.copy()).drop(columns=TARGET)
+            return to_csr(X) if feature_matrix == "csr" else X
+
+        X, _, encode_mib = _traced(encode)
+        rfr = RandomForestRegressor(
+            n_estimators=10,
+            max_features="sqrt",
+            max_depth=1,
+            criterion=criterion,
+            n_jobs=-1,
+            random_state=2023,
+        )
+        _, fit_s, fit_mib = _traced(lambda: rfr.fit(X, y))
+        print(
+            "{:<16}{:>14.1f}{:>16.1f}{:>14.1f}{:>12.2f}".format(
+                name, _nbytes(X) / 2**20, encode_mib, fit_mib, fit_s
+            )
+        )
+
+
+if __name__ == "__main__":
+    bench()
@@ -0,0 +1,161 @@
+"""
+Benchmark the prediction cache of the server on repeated valuations.
+
+Fits the resale model (feature transformer and --engine with --n-estimators
+trees) on --filepath and draws --requests single-row valuations from
+--distinct rows of it, with Zipf(--zipf) popularity, as a stand-in for
+listings valued over and over. --clients concurrent clients send them to a
+`serve.MicroBatcher` scoring on --workers processes with the flat ensemble.
+The legacy version predicts every row; the new one is
+`serve.CachedMicroBatcher` with a PredictionCache of --cache-size rows.
+Reports the throughput, latency quantiles and hit rate.
+
+    python benchmarks/bench_prediction_cache.py --distinct 2000 --zipf 1.1
+"""
+
+import asyncio
+import os
+import sys
+import time
+import warnings
+
+import click
+import numpy as np
+import pandas as pd
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "scripts")
+)
+
+from feature_transformer import TARGET, FeatureTransformer, clean_data, fit_vocabulary
+from prediction_cache import PredictionCache
+from resale_model import ResalePriceModel
+from serve import (
+    INPUT_COLUMNS,
+    CachedMicroBatcher,
+    MicroBatcher,
+    make_executor,
+    score_columns,
+    score_encoded,
+)
+from train import make_estimator
+from tree_ensemble import FlatTreeEnsemble
+
+
+def _model(model):
+    return model
+
+
+async def _client(batcher, requests, latencies):
+    for columns in requests:
+        start = time.perf_counter()
+        await batcher.predict(columns)
+        latencies.append(time.perf_counter() - start)
+
+
+async def _replay(make_batcher, requests, clients):
+    batcher = make_batcher()
+    batcher.start()
+    # start the workers outside the timings
+    await batcher.predict(requests[0])
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(
+        *[_client(batcher, requests[i::clients], latencies) for i in range(clients)]
+    )
+    wall_s = time.perf_counter() - start
+    await batcher.stop()
+    return wall_s, np.array(latencies) * 1000
+
+
+@click.command(help="Benchmark the prediction cache on repeated valuations")
+@click.option("--requests", "num_requests", type=int, default=5000)
+@click.option("--distinct", type=int, default=1000)
+@click.option("--zipf", type=float, default=1.2)
+@click.option("--clients", type=int, default=32)
+@click.option("--cache-size", type=int, default=10000)
+@click.option("--engine", type=str, default="rf_mse")
+@click.option("--n-estimators", type=int, default=100)
+@click.option("--workers", type=int, default=-1)
+@click.option("--filepath", type=str, default="data/resale-flat-prices-2022-jan.csv")
+def bench(
+    num_requests,
+    distinct,
+    zipf,
+    clients,
+    cache_size,
+    engine,
+    n_estimators,
+    workers,
+    filepath,
+):
+    warnings.simplefilter("ignore")
+    raw = pd.read_csv(filepath)
+    cleaned = clean_data(raw)
+    transformer = FeatureTransformer(fit_vocabulary(cleaned))
+    data = transformer.encode(cleaned)
+    estimator = make_estimator(engine, n_estimators, "sqrt", None, 2, 1).fit(
+        data.drop(columns=TARGET), data[TARGET]
+    )
+    model = ResalePriceModel()
+    model.transformer = transformer
+    model.estimator = FlatTreeEnsemble.from_estimator(estimator)
+
+    rng = np.random.default_rng(2023)
+    pool = raw[INPUT_COLUMNS].sample(distinct, random_state=2023)
+    ranks = np.minimum(rng.zipf(zipf, num_requests), distinct) - 1
+    requests = [
+        {col: [value] for col, value in record.items()}
+        for record in pool.iloc[ranks].to_dict("records")
+    ]
+
+    print(
+        "{} single-row requests of {} distinct rows, Zipf({}), {} clients, {} "
+        "with {} trees".format(
+            num_requests, distinct, zipf, clients, engine, n_estimators
+        )
+    )
+    print(
+        "{:<10}{:>10}{:>10}{:>10}{:>10}{:>10}".format(
+            "version", "wall s", "req/s", "p50 ms", "p99 ms", "hit rate"
+        )
+    )
+    executor, in_flight = make_executor(workers, _model, model)
+    cache = PredictionCache(cache_size)
+    versions = {
+        "legacy": lambda: MicroBatcher(
+            score_columns, executor, max_in_flight=in_flight
+        ),
+        "cached": lambda: CachedMicroBatcher(
+            transformer, cache, score_encoded, executor, max_in_flight=in_flight
+        ),
+    }
+    try:
+        for version, make_batcher in versions.items():
+            wall_s, latencies = asyncio.run(_replay(make_batcher, requests, clients))
+            print(
+                "{:<10}{:>10.2f}{:>10.0f}{:>10.1f}{:>10.1f}{:>10}".format(
+                    version,
+                    wall_s,
+                    num_requests / wall_s,
+                    np.quantile(latencies, 0.5),
+                    np.quantile(latencies, 0.99),
+                    (
+                        "{:.2f}".format(cache.stats()["hit_rate"])
+                        if version == "cached"
+                        else "-"
+                    ),
+                )
+            )
+    finally:
+        executor.shutdown()
+    stats = cache.stats()
+    print(
+        "cache: {} entries, {:.2f}s spent on misses, {:.2f}s saved by hits".format(
+            stats["entries"], stats["miss_seconds"], stats["saved_seconds"]
+        )
+    )
+
+
+if __name__ == "__main__":
+    bench()
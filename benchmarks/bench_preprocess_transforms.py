@@ -0,0 +1,179 @@
+"""
+Benchmark the categorical transforms in scripts/preprocess.py.
+
+Resamples the Jan-2022 sample to each row count and compares every transform
+against the per-cell pandas / sklearn version it replaced, reporting the best
+wall time and the peak memory allocated (tracemalloc) of each.
+
+    python benchmarks/bench_preprocess_transforms.py --num-rows 100000 --num-rows 1000000
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+import click
+import numpy as np
+import pandas as pd
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "scripts")
+)
+
+from feature_transformer import (
+    COLUMNS,
+    FLAT_TYPE_MAP,
+    _parse_remaining_lease,
+    clean_data,
+    fit_vocabulary,
+    normalize_category,
+)
+from preprocess import encode_data, split_indices
+from utils import category_codes, map_unique, onehotencode
+
+
+def _legacy_normalize(data):
+    return data.replace(regex=[r".*[mM]aisonette.*", "foo"], value="Maisonette")
+
+
+def _legacy_remaining_lease(data):
+    return data["remaining_lease"].str.extract(r"(\d+)(?= years)")[0].astype("int16")
+
+
+def _legacy_onehotencode(df, col):
+    from sklearn.preprocessing import OneHotEncoder
+
+    ohe = OneHotEncoder(drop="first", handle_unknown="ignore", sparse_output=False)
+    ohe_df = pd.DataFrame(ohe.fit_transform(df[col].values.reshape(-1, 1)))
+    ohe_df.columns = [x.replace("x0_", "") for x in ohe.get_feature_names_out()]
+    df.drop(col, axis=1, inplace=True)
+    return pd.concat([df, ohe_df], axis=1)
+
+
+def _legacy_split(data):
+    from sklearn.model_selection import train_test_split
+
+    data = data.copy()
+    y = data["resale_price"]
+    X = data.drop(["resale_price"], axis=1)
+    X_train, X_val_test, y_train, y_val_test = train_test_split(
+        X, y, test_size=0.3, random_state=2023
+    )
+    X_val, X_test, y_val, y_test = train_test_split(
+        X_val_test, y_val_test, test_size=1 / 3, random_state=2023
+    )
+    return [
+        pd.concat([y_train, X_train], axis=1),
+        pd.concat([y_val, X_val], axis=1),
+        pd.concat([y_test, X_test], axis=1),
+    ]
+
+
+def _legacy_preprocess(data):
+    from sklearn.preprocessing import LabelEncoder
+
+    data = _legacy_normalize(data[COLUMNS])
+    data["remaining_lease"] = _legacy_remaining_lease(data)
+    data = data.replace({"flat_type": FLAT_TYPE_MAP})
+    data["storey_range"] = LabelEncoder().fit_transform(data["storey_range"])
+    data = _legacy_onehotencode(data, "town")
+    data = _legacy_onehotencode(data, "flat_model")
+    return _legacy_split(data)
+
+
+def _split(data):
+    return [data.iloc[indices] for indices in split_indices(len(data)).values()]
+
+
+def _preprocess(data):
+    data = clean_data(data)
+    data, _ = encode_data(data, fit_vocabulary(data))
+    return _split(data)
+
+
+def _measure(fn, make_input, repeat):
+    timings = []
+    for _ in range(repeat):
+        arg = make_input()
+        start = time.perf_counter()
+        fn(arg)
+        timings.append(time.perf_counter() - start)
+    arg = make_input()
+    tracemalloc.start()
+    fn(arg)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak / 2**20
+
+
+def _cases(raw):
+    from sklearn.preprocessing import LabelEncoder
+
+    selected = raw[COLUMNS]
+    cleaned = clean_data(raw)
+    vocabulary = fit_vocabulary(cleaned)
+    encoded, _ = encode_data(cleaned.copy(), vocabulary)
+    return [
+        (
+            "normalize categories",
+            lambda: selected,
+            _legacy_normalize,
+            lambda d: pd.DataFrame({c: normalize_category(d[c]) for c in d}),
+        ),
+        (
+            "remaining_lease",
+            lambda: selected,
+            _legacy_remaining_lease,
+            lambda d: _parse_remaining_lease(d["remaining_lease"]),
+        ),
+        (
+            "flat_type",
+            lambda: cleaned,
+            lambda d: d.replace({"flat_type": FLAT_TYPE_MAP}),
+            lambda d: map_unique(d["flat_type"], lambda s: s.replace(FLAT_TYPE_MAP)),
+        ),
+        (
+            "storey_range",
+            lambda: cleaned,
+            lambda d: LabelEncoder().fit_transform(d["storey_range"]),
+            lambda d: category_codes(d["storey_range"], vocabulary["storey_range"]),
+        ),
+        (
+            "onehotencode town",
+            lambda: cleaned.copy(),
+            lambda d: _legacy_onehotencode(d, "town"),
+            lambda d: onehotencode(d, "town", vocabulary["town"]),
+        ),
+        ("split", lambda: encoded, _legacy_split, _split),
+        ("total", lambda: raw, _legacy_preprocess, _preprocess),
+    ]
+
+
+@click.command(help="Benchmark preprocess transforms against their legacy versions")
+@click.option("--num-rows", type=int, multiple=True, default=[100000, 1000000])
+@click.option("--repeat", type=int, default=3)
+@click.option("--filepath", type=str, default="data/resale-flat-prices-2022-jan.csv")
+def bench(num_rows, repeat, filepath):
+    sample = pd.read_csv(filepath)
+    rng = np.random.default_rng(2023)
+    for n in num_rows:
+        raw = sample.iloc[rng.integers(0, len(sample), n)].reset_index(drop=True)
+        print("\n{} rows".format(n))
+        print(
+            "{:<22}{:>12}{:>12}{:>14}{:>14}".format(
+                "transform", "legacy s", "new s", "legacy MiB", "new MiB"
+            )
+        )
+        for name, make_input, legacy, new in _cases(raw):
+            legacy_s, legacy_mib = _measure(legacy, make_input, repeat)
+            new_s, new_mib = _measure(new, make_input, repeat)
+            print(
+                "{:<22}{:>12.4f}{:>12.4f}{:>14.1f}{:>14.1f}".format(
+                    name, legacy_s, new_s, legacy_mib, new_mib
+                )
+            )
+
+
+if __name__ == "__main__":
+    bench()
@@ -0,0 +1,150 @@
+"""
+Benchmark data validation with a single profiling pass.
+
+Resamples the Jan-2022 sample to each row count and compares the schema
+inference, schema comparison and missing-data check of `data_validate` as
+separate scans of the raw dataset (the versions they replaced) against one
+`profile_data` pass shared by all three. Reports the best wall time and the
+peak memory allocated (tracemalloc) of each.
+
+    python benchmarks/bench_profile.py --num-rows 100000 --num-rows 1000000
+"""
+
+import logging
+import os
+import sys
+import time
+import tracemalloc
+import warnings
+
+import click
+import numpy as np
+import pandas as pd
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "scripts")
+)
+
+from utils import compare_data_to_schema, infer_schema, missing_data, profile_data
+
+
+def _legacy_infer_schema(df):
+    schema = {}
+    for col in df.columns:
+        dt = df[col].dtype
+        if dt.kind in "iufc":
+            schema[col] = {
+                "type": str(dt),
+                "min": float(df[col].min()),
+                "max": float(df[col].max()),
+            }
+        else:  # object
+            schema[col] = {"type": str(dt), "domain": sorted(list(set(df[col])))}
+    return schema
+
+
+def _legacy_compare_data_to_schema(data, schema):
+    for col in data.columns:
+        dt = data[col].dtype
+        if dt.kind in "iufc":
+            d_max, d_min = data[col].max(), data[col].min()
+            if d_max > schema[col]["max"] or d_min < schema[col]["min"]:
+                warnings.warn("Column `{}` out of schema range".format(col))
+        else:
+            diff = sorted(set(data[col]).difference(set(schema[col]["domain"])))
+            if diff:
+                warnings.warn("Column `{}` has values not in domain".format(col))
+    return "Passed"
+
+
+def _legacy_missing_data(data):
+    missing = (
+        pd.concat([data.isnull().any(), data.isnull().sum()], axis=1)
+        .T.apply(tuple)
+        .to_dict("list")
+    )
+    return {col: num for col, [miss, num] in missing.items() if miss}
+
+
+def _legacy_validate(data, schema_old):
+    _legacy_infer_schema(data)
+    _legacy_compare_data_to_schema(data, schema_old)
+    return _legacy_missing_data(data)
+
+
+def _validate(data, schema_old):
+    profile = profile_data(data)
+    infer_schema(data, profile)
+    compare_data_to_schema(data, schema_old, profile)
+    return missing_data(profile)
+
+
+def _measure(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak / 2**20
+
+
+@click.command(help="Benchmark single-pass profiling against separate scans")
+@click.option("--num-rows", type=int, multiple=True, default=[100000, 1000000])
+@click.option("--repeat", type=int, default=3)
+@click.option("--filepath", type=str, default="data/resale-flat-prices-2022-jan.csv")
+def bench(num_rows, repeat, filepath):
+    logging.disable(logging.WARNING)
+    warnings.simplefilter("ignore")
+    sample = pd.read_csv(filepath)
+    schema_old = infer_schema(sample)
+    rng = np.random.default_rng(2023)
+    for n in num_rows:
+        data = sample.iloc[rng.integers(0, len(sample), n)].reset_index(drop=True)
+        assert _legacy_infer_schema(data) == infer_schema(data)
+        assert _legacy_missing_data(data) == missing_data(profile_data(data))
+        print("\n{} rows".format(n))
+        print(
+            "{:<22}{:>12}{:>12}{:>14}{:>14}".format(
+                "step", "legacy s", "new s", "legacy MiB", "new MiB"
+            )
+        )
+        profile = profile_data(data)
+        cases = [
+            (
+                "infer_schema",
+                lambda: _legacy_infer_schema(data),
+                lambda: infer_schema(data, profile),
+            ),
+            (
+                "compare_data_to_schema",
+                lambda: _legacy_compare_data_to_schema(data, schema_old),
+                lambda: compare_data_to_schema(data, schema_old, profile),
+            ),
+            (
+                "missing data",
+                lambda: _legacy_missing_data(data),
+                lambda: missing_data(profile),
+            ),
+            ("profile_data", lambda: None, lambda: profile_data(data)),
+            (
+                "total",
+                lambda: _legacy_validate(data, schema_old),
+                lambda: _validate(data, schema_old),
+            ),
+        ]
+        for name, legacy, new in cases:
+            legacy_s, legacy_mib = _measure(legacy, repeat)
+            new_s, new_mib = _measure(new, repeat)
+            print(
+                "{:<22}{:>12.4f}{:>12.4f}{:>14.1f}{:>14.1f}".format(
+                    name, legacy_s, new_s, legacy_mib, new_mib
+                )
+            )
+
+
+if __name__ == "__main__":
+    bench()
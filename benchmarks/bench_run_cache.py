@@ -0,0 +1,133 @@
+"""
+Benchmark cache lookups for pipeline step runs.
+
+Populates a throwaway sqlite tracking store with synthetic `train` runs and
+compares the legacy `_already_ran` scan (walk every run, compare params and
+tags in Python) against the cache-key lookup in scripts/run_cache.py, both
+through the local index and through the tagged `search_runs` query.
+
+    python benchmarks/bench_run_cache.py --num-runs 10000
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import click
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "scripts")
+)
+
+from mlflow.entities import Param, RunTag, RunStatus
+from mlflow.tracking import MlflowClient
+from mlflow.utils import mlflow_tags
+
+from run_cache import CACHE_KEY_TAG, RunIndex, cache_key, lookup_run
+
+
+def _legacy_lookup(client, experiment_id, entry_point_name, parameters, git_commit):
+    # mirrors the pre-index `_already_ran`, paging through every run since
+    # a single `search_runs` call only returns the first 1000
+    page_token = None
+    while True:
+        page = client.search_runs([experiment_id], page_token=page_token)
+        for run in page:
+            tags = run.data.tags
+            if tags.get(mlflow_tags.MLFLOW_PROJECT_ENTRY_POINT) != entry_point_name:
+                continue
+            if any(
+                str(run.data.params.get(k)) != str(v) for k, v in parameters.items()
+            ):
+                continue
+            if run.info.to_proto().status != RunStatus.FINISHED:
+                continue
+            if tags.get(mlflow_tags.MLFLOW_GIT_COMMIT) != git_commit:
+                continue
+            return run
+        page_token = page.token
+        if not page_token:
+            return None
+
+
+class _NullIndex(RunIndex):
+    # never hits, so every lookup goes through the tagged search_runs query
+    def get(self, experiment_id, key):
+        return None
+
+    def put(self, experiment_id, key, run_id):
+        pass
+
+
+def _populate(client, experiment_id, num_runs):
+    keys = []
+    for i in range(num_runs):
+        params = {"datadir": "runs:/{}/trainvaltest_data".format(i % 50)}
+        git_commit = "{:040x}".format(i)
+        key = cache_key("train", params, "0" * 32, upstream={"preprocess": str(i)})
+        run = client.create_run(experiment_id, start_time=i)
+        client.log_batch(
+            run.info.run_id,
+            params=[Param(k, v) for k, v in params.items()],
+            tags=[
+                RunTag(mlflow_tags.MLFLOW_PROJECT_ENTRY_POINT, "train"),
+                RunTag(mlflow_tags.MLFLOW_GIT_COMMIT, git_commit),
+                RunTag(CACHE_KEY_TAG, key),
+            ],
+        )
+        client.set_terminated(run.info.run_id)
+        keys.append((params, git_commit, key))
+    return keys
+
+
+def _time(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+@click.command(help="Benchmark run-cache lookups against synthetic runs")
+@click.option("--num-runs", type=int, default=10000)
+@click.option("--repeat", type=int, default=3)
+def bench(num_runs, repeat):
+    workdir = tempfile.mkdtemp()
+    client = MlflowClient(
+        tracking_uri="sqlite:///{}".format(os.path.join(workdir, "mlflow.db"))
+    )
+    experiment_id = client.create_experiment(
+        "bench_run_cache", artifact_location=os.path.join(workdir, "artifacts")
+    )
+
+    start = time.perf_counter()
+    keys = _populate(client, experiment_id, num_runs)
+    print("Created {} runs in {:.1f}s".format(num_runs, time.perf_counter() - start))
+
+    # the oldest run is the worst case for the legacy scan
+    params, git_commit, key = keys[0]
+    index = RunIndex(os.path.join(workdir, "index.json"))
+
+    legacy = _time(
+        lambda: _legacy_lookup(client, experiment_id, "train", params, git_commit),
+        repeat,
+    )
+    searched = _time(
+        lambda: lookup_run(experiment_id, key, index=_NullIndex(), client=client),
+        repeat,
+    )
+    lookup_run(experiment_id, key, index=index, client=client)  # warm the index
+    indexed = _time(
+        lambda: lookup_run(experiment_id, key, index=index, client=client), repeat
+    )
+
+    print("{:<28}{:>12}".format("lookup", "seconds"))
+    print("{:<28}{:>12.4f}".format("legacy full scan", legacy))
+    print("{:<28}{:>12.4f}".format("tagged search_runs", searched))
+    print("{:<28}{:>12.4f}".format("local index + get_run", indexed))
+
+
+if __name__ == "__main__":
+    bench()
@@ -0,0 +1,154 @@
+"""
+Benchmark batched, asynchronous run logging against one call per item.
+
+Logs the calls of a pipeline step (--metrics metrics, --params params, --tags
+tags, and --files artifact files of --file-mib each, the last ones as one
+directory) to a throwaway file store, through a client that adds
+--latency-ms to every request and uploads at --bandwidth-mbps, as a stand-in
+for a remote tracking server and artifact store. The legacy version makes one
+blocking call per item, as `mlflow.log_metric`, `mlflow.set_tag` and
+`mlflow.log_artifact` do; the new one queues them on a
+`run_logger.RunLogger` and flushes it.
+
+    python benchmarks/bench_run_logger.py --latency-ms 50
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import click
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "scripts")
+)
+
+from mlflow.tracking import MlflowClient
+
+from run_logger import RunLogger
+
+
+class _RemoteClient(MlflowClient):
+    # sleeps like a round-trip to a remote server for every request
+
+    def __init__(self, tracking_uri, latency_ms, bandwidth_mbps):
+        super().__init__(tracking_uri)
+        self.latency_s = latency_ms / 1000
+        self.bandwidth_mbps = bandwidth_mbps
+        self.requests = 0
+
+    def _request(self, num_bytes=0):
+        self.requests += 1
+        time.sleep(self.latency_s + num_bytes * 8 / (self.bandwidth_mbps * 1e6))
+
+    def log_metric(self, run_id, key, value, *args, **kwargs):
+        self._request()
+        super().log_metric(run_id, key, value, *args, **kwargs)
+
+    def log_param(self, run_id, key, value):
+        self._request()
+        return super().log_param(run_id, key, value)
+
+    def set_tag(self, run_id, key, value):
+        self._request()
+        super().set_tag(run_id, key, value)
+
+    def log_batch(self, run_id, metrics=(), params=(), tags=()):
+        self._request()
+        super().log_batch(run_id, metrics, params, tags)
+
+    def log_artifact(self, run_id, local_path, artifact_path=None):
+        self._request(os.path.getsize(local_path))
+        super().log_artifact(run_id, local_path, artifact_path)
+
+    def log_artifacts(self, run_id, local_dir, artifact_path=None):
+        for name in sorted(os.listdir(local_dir)):
+            self.log_artifact(run_id, os.path.join(local_dir, name), artifact_path)
+
+
+def _legacy_log(client, run_id, metrics, params, tags, files, file_dir):
+    for key, value in metrics.items():
+        client.log_metric(run_id, key, value)
+    for key, value in params.items():
+        client.log_param(run_id, key, value)
+    for key, value in tags.items():
+        client.set_tag(run_id, key, value)
+    for path in files:
+        client.log_artifact(run_id, path, "files")
+    client.log_artifacts(run_id, file_dir, "dir")
+
+
+def _batched_log(client, run_id, metrics, params, tags, files, file_dir):
+    logger = RunLogger(run_id, client)
+    logger.log_metrics(metrics)
+    logger.log_params(params)
+    logger.set_tags(tags)
+    for path in files:
+        logger.log_artifact(path, "files")
+    logger.log_artifacts(file_dir, "dir")
+    logger.flush()
+    logger.close()
+
+
+@click.command(help="Benchmark batched run logging against one call per item")
+@click.option("--metrics", "num_metrics", type=int, default=20)
+@click.option("--params", "num_params", type=int, default=10)
+@click.option("--tags", "num_tags", type=int, default=5)
+@click.option("--files", "num_files", type=int, default=6)
+@click.option("--file-mib", type=float, default=2.0)
+@click.option("--latency-ms", type=float, default=50.0)
+@click.option("--bandwidth-mbps", type=float, default=200.0)
+def bench(
+    num_metrics, num_params, num_tags, num_files, file_mib, latency_ms, bandwidth_mbps
+):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        file_dir = os.path.join(tmpdir, "files")
+        os.makedirs(file_dir)
+        files = []
+        for i in range(num_files):
+            path = os.path.join(file_dir, "file_{}.bin".format(i))
+            with open(path, "wb") as f:
+                f.write(os.urandom(int(file_mib * 2**20)))
+            files.append(path)
+        # the first half is logged file by file, the second as a directory
+        single_files, dir_files = files[: num_files // 2], files[num_files // 2 :]
+        upload_dir = os.path.join(tmpdir, "upload_dir")
+        os.makedirs(upload_dir)
+        for path in dir_files:
+            shutil.move(path, upload_dir)
+
+        print(
+            "{} metrics, {} params, {} tags, {} files of {:.1f} MiB, {:.0f} ms "
+            "per request, {:.0f} Mbit/s".format(
+                num_metrics,
+                num_params,
+                num_tags,
+                num_files,
+                file_mib,
+                latency_ms,
+                bandwidth_mbps,
+            )
+        )
+        print("{:<10}{:>10}{:>10}".format("version", "wall s", "requests"))
+        for version, log in [("legacy", _legacy_log), ("batched", _batched_log)]:
+            client = _RemoteClient(
+                "file://" + os.path.join(tmpdir, "mlruns"), latency_ms, bandwidth_mbps
+            )
+            experiment_id = client.create_experiment(version)
+            run_id = client.create_run(experiment_id).info.run_id
+            metrics = {"metric_{}".format(i): i for i in range(num_metrics)}
+            params = {"param_{}".format(i): i for i in range(num_params)}
+            tags = {"tag_{}".format(i): i for i in range(num_tags)}
+            start = time.perf_counter()
+            log(client, run_id, metrics, params, tags, single_files, upload_dir)
+            wall_s = time.perf_counter() - start
+            print("{:<10}{:>10.2f}{:>10}".format(version, wall_s, client.requests))
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    bench()
@@ -0,0 +1,112 @@
+"""
+Benchmark fetching the reference schema as the experiment history grows.
+
+Fills a file-store experiment with pipeline runs (a main run and the
+data_validate run it tags, which logs the schema) and times the legacy
+`search_runs` scan against `SchemaRegistry.latest`, with a cold and a warm
+local schema cache.
+
+    python benchmarks/bench_schema_registry.py --num-runs 10 --num-runs 100 --num-runs 1000
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import click
+import mlflow
+import pandas as pd
+from mlflow.entities import RunStatus
+from mlflow.tracking import MlflowClient
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "scripts")
+)
+
+from schema_registry import SCHEMA_ARTIFACT_PATH, SchemaCache, SchemaRegistry
+from utils import infer_schema
+
+
+def _legacy_latest(client, exp_id):
+    all_runs = reversed(client.search_runs([exp_id]))
+    for run in all_runs:
+        tags = run.data.tags
+        if tags.get("mlflow.project.entryPoint") == "main" and tags.get(
+            "data_validate"
+        ):
+            run_id = tags.get("data_validate")
+            old_run = client.get_run(run_id)
+            if old_run.info.to_proto().status != RunStatus.FINISHED:
+                break
+            schema_old_path = os.path.join(
+                client.get_run(run_id).info.artifact_uri, SCHEMA_ARTIFACT_PATH
+            )
+            return mlflow.artifacts.load_dict(schema_old_path)
+
+
+def _add_runs(client, exp_id, registry, schema, num_runs):
+    for _ in range(num_runs):
+        with mlflow.start_run(
+            experiment_id=exp_id, tags={"mlflow.project.entryPoint": "data_validate"}
+        ) as run:
+            mlflow.log_dict(schema, SCHEMA_ARTIFACT_PATH)
+            mlflow.set_tag("validation_status", "pass")
+        registry.accept(schema, run.info.run_id)
+        with mlflow.start_run(
+            experiment_id=exp_id,
+            tags={
+                "mlflow.project.entryPoint": "main",
+                "data_validate": run.info.run_id,
+            },
+        ):
+            pass
+
+
+def _best(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+@click.command(help="Benchmark reference schema lookup against experiment size")
+@click.option("--num-runs", type=int, multiple=True, default=[10, 100, 1000])
+@click.option("--repeat", type=int, default=5)
+@click.option("--filepath", type=str, default="data/resale-flat-prices-2022-jan.csv")
+def bench(num_runs, repeat, filepath):
+    schema = infer_schema(pd.read_csv(filepath))
+    workdir = tempfile.mkdtemp()
+    mlflow.set_tracking_uri("file://{}".format(os.path.join(workdir, "mlruns")))
+    client = MlflowClient()
+    exp_id = client.create_experiment("bench_schema_registry")
+    cache_dir = os.path.join(workdir, "cache")
+    registry = SchemaRegistry(exp_id, client, SchemaCache(cache_dir))
+
+    print("{:>10}{:>14}{:>14}{:>14}".format("runs", "legacy ms", "cold ms", "warm ms"))
+    total = 0
+    for n in num_runs:
+        _add_runs(client, exp_id, registry, schema, n - total)
+        total = n
+        assert _legacy_latest(client, exp_id) == registry.latest()[0] == schema
+
+        def cold():
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            registry.latest()
+
+        print(
+            "{:>10}{:>14.1f}{:>14.1f}{:>14.1f}".format(
+                2 * n,
+                _best(lambda: _legacy_latest(client, exp_id), repeat) * 1e3,
+                _best(cold, repeat) * 1e3,
+                _best(registry.latest, repeat) * 1e3,
+            )
+        )
+    shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    bench()
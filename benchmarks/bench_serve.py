@@ -0,0 +1,162 @@
+"""
+Benchmark the micro-batching server against scoring each request on its own.
+
+Fits the resale model (feature transformer and --engine with --n-estimators
+trees) on --filepath and serves it on a local port, then sends --requests
+single-row invocations of raw rows from --clients concurrent keep-alive
+connections. The legacy version scores every request alone with the sklearn
+estimator, as `mlflow models serve` does; the new one is
+`serve.MicroBatcher` with the flat ensemble, --max-batch-size and
+--max-wait-ms. Both score on --workers processes. Reports the throughput and
+the client-side latency quantiles.
+
+    python benchmarks/bench_serve.py --clients 64 --requests 5000
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+import warnings
+
+import click
+import numpy as np
+import pandas as pd
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "scripts")
+)
+
+from feature_transformer import TARGET, FeatureTransformer, clean_data, fit_vocabulary
+from resale_model import ResalePriceModel
+from serve import (
+    INPUT_COLUMNS,
+    InferenceServer,
+    MicroBatcher,
+    make_executor,
+    score_columns,
+)
+from train import make_estimator
+from tree_ensemble import FlatTreeEnsemble
+
+
+def _model(model):
+    return model
+
+
+async def _client(port, bodies, latencies):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    for body in bodies:
+        start = time.perf_counter()
+        writer.write(
+            "POST /invocations HTTP/1.1\r\nContent-Type: application/json\r\n"
+            "Content-Length: {}\r\n\r\n".format(len(body)).encode() + body
+        )
+        length = 0
+        while True:
+            line = await reader.readline()
+            if not line.strip():
+                break
+            if line.lower().startswith(b"content-length"):
+                length = int(line.split(b":")[1])
+        await reader.readexactly(length)
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+    await writer.wait_closed()
+
+
+async def _replay(model, bodies, clients, workers, max_batch_size, max_wait_ms):
+    executor, in_flight = make_executor(workers, _model, model)
+    batcher = MicroBatcher(
+        score_columns, executor, max_batch_size, max_wait_ms, in_flight
+    )
+    server = InferenceServer(batcher)
+    listener = await server.start("127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+    # start the workers outside the timings
+    await asyncio.gather(*[_client(port, bodies[:1], []) for _ in range(in_flight)])
+
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(
+        *[_client(port, bodies[i::clients], latencies) for i in range(clients)]
+    )
+    wall_s = time.perf_counter() - start
+    await server.stop()
+    executor.shutdown()
+    return wall_s, np.array(latencies) * 1000, batcher.metrics
+
+
+@click.command(help="Benchmark micro-batched serving against per-request scoring")
+@click.option("--requests", "num_requests", type=int, default=2000)
+@click.option("--clients", type=int, default=32)
+@click.option("--engine", type=str, default="rf_mse")
+@click.option("--n-estimators", type=int, default=100)
+@click.option("--workers", type=int, default=-1)
+@click.option("--max-batch-size", type=int, default=256)
+@click.option("--max-wait-ms", type=float, default=2.0)
+@click.option("--filepath", type=str, default="data/resale-flat-prices-2022-jan.csv")
+def bench(
+    num_requests,
+    clients,
+    engine,
+    n_estimators,
+    workers,
+    max_batch_size,
+    max_wait_ms,
+    filepath,
+):
+    warnings.simplefilter("ignore")
+    raw = pd.read_csv(filepath)
+    cleaned = clean_data(raw)
+    transformer = FeatureTransformer(fit_vocabulary(cleaned))
+    data = transformer.encode(cleaned)
+    estimator = make_estimator(engine, n_estimators, "sqrt", None, 2, 1).fit(
+        data.drop(columns=TARGET), data[TARGET]
+    )
+    rows = raw[INPUT_COLUMNS].sample(num_requests, replace=True, random_state=2023)
+    bodies = [
+        json.dumps({"dataframe_records": [record]}).encode()
+        for record in rows.to_dict("records")
+    ]
+
+    print(
+        "{} single-row requests from {} clients, {} with {} trees, batches of up "
+        "to {} rows waiting {} ms".format(
+            num_requests, clients, engine, n_estimators, max_batch_size, max_wait_ms
+        )
+    )
+    print(
+        "{:<10}{:>10}{:>10}{:>10}{:>10}{:>12}".format(
+            "version", "wall s", "req/s", "p50 ms", "p99 ms", "mean batch"
+        )
+    )
+    versions = {
+        "legacy": (estimator, 1, 0.0),
+        "batched": (
+            FlatTreeEnsemble.from_estimator(estimator),
+            max_batch_size,
+            max_wait_ms,
+        ),
+    }
+    for version, (regressor, batch_size, wait_ms) in versions.items():
+        model = ResalePriceModel()
+        model.transformer, model.estimator = transformer, regressor
+        wall_s, latencies, metrics = asyncio.run(
+            _replay(model, bodies, clients, workers, batch_size, wait_ms)
+        )
+        print(
+            "{:<10}{:>10.2f}{:>10.0f}{:>10.1f}{:>10.1f}{:>12.1f}".format(
+                version,
+                wall_s,
+                num_requests / wall_s,
+                np.quantile(latencies, 0.5),
+                np.quantile(latencies, 0.99),
+                metrics.snapshot()["mean_batch_rows"],
+            )
+        )
+
+
+if __name__ == "__main__":
+    bench()
@@ -0,0 +1,105 @@
+"""
+Benchmark the SHAP stage of model_validate.
+
+Fits each engine on the encoded Jan-2022 sample and explains --test-rows
+sampled rows. The legacy version is the model-agnostic
+`shap.Explainer(model.predict, X_test)` called on the test rows, with the
+test rows as background too; the new one is `model_validate.shap_explanation`
+on the flat ensemble, with TreeExplainer, --background-rows background rows
+and --workers processes. Reports the wall time of both and the largest gap
+between the sum of the SHAP values and the prediction.
+
+    python benchmarks/bench_shap.py --n-estimators 100 --max-depth 8
+"""
+
+import os
+import sys
+import time
+import warnings
+
+import click
+import numpy as np
+import pandas as pd
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "scripts")
+)
+
+from feature_transformer import TARGET, FeatureTransformer, clean_data, fit_vocabulary
+from model_validate import shap_explanation
+from train import make_estimator
+from tree_ensemble import FlatTreeEnsemble
+
+
+def _legacy_explain(model, X_test):
+    import shap
+
+    explainer = shap.Explainer(model.predict, X_test)
+    return explainer(X_test)
+
+
+def _additivity_gap(explanation, predictions):
+    return np.abs(
+        explanation.values.sum(axis=1) + explanation.base_values - predictions
+    ).max()
+
+
+@click.command(help="Benchmark TreeExplainer against the model-agnostic explainer")
+@click.option("--test-rows", type=int, default=360)
+@click.option("--background-rows", type=int, default=100)
+@click.option("--engine", type=str, multiple=True, default=["rf_mae", "hgb"])
+@click.option("--n-estimators", type=int, default=10)
+@click.option(
+    "--max-depth", type=int, default=1, help="Depth of the trees, 0 for unlimited"
+)
+@click.option("--workers", type=int, default=-1)
+@click.option("--filepath", type=str, default="data/resale-flat-prices-2022-jan.csv")
+def bench(
+    test_rows, background_rows, engine, n_estimators, max_depth, workers, filepath
+):
+    warnings.simplefilter("ignore")
+    cleaned = clean_data(pd.read_csv(filepath))
+    data = FeatureTransformer(fit_vocabulary(cleaned)).encode(cleaned)
+    X, y = data.drop(columns=TARGET), data[TARGET]
+    X_test = X.sample(test_rows, random_state=2023)
+    background = X_test.sample(min(background_rows, test_rows), random_state=2023)
+
+    print(
+        "{} test rows, {} background rows, {} estimators, max_depth={}".format(
+            test_rows, background_rows, n_estimators, max_depth or None
+        )
+    )
+    print(
+        "{:<8}{:>12}{:>12}{:>10}{:>14}{:>14}".format(
+            "engine", "legacy s", "new s", "speedup", "legacy gap", "new gap"
+        )
+    )
+    for name in engine:
+        estimator = make_estimator(
+            name, n_estimators, "sqrt", max_depth or None, 2, 1
+        ).fit(X, y)
+        flat = FlatTreeEnsemble.from_estimator(estimator)
+        predictions = estimator.predict(X_test)
+        # import shap and compile its kernels outside the timings
+        shap_explanation(flat, X_test[:1], background[:1])
+
+        start = time.perf_counter()
+        legacy = _legacy_explain(estimator, X_test)
+        legacy_s = time.perf_counter() - start
+        start = time.perf_counter()
+        new = shap_explanation(flat, X_test, background, workers)
+        new_s = time.perf_counter() - start
+        print(
+            "{:<8}{:>12.2f}{:>12.2f}{:>10.1f}{:>14.2e}{:>14.2e}".format(
+                name,
+                legacy_s,
+                new_s,
+                legacy_s / new_s,
+                _additivity_gap(legacy, predictions),
+                _additivity_gap(new, predictions),
+            )
+        )
+
+
+if __name__ == "__main__":
+    bench()
@@ -0,0 +1,113 @@
+"""
+Benchmark the sliced metrics of evaluate against a loop over slices.
+
+Resamples the Jan-2022 sample to each row count, encodes it and perturbs the
+target as predictions. The legacy version masks the rows of every slice of
+every column and bootstraps each slice's MAE by resampling its rows; the new
+one is `slice_metrics.sliced_metrics`, with bincounts over global slice ids
+and Poisson bootstrap replicates on --workers processes. Reports the best
+wall time of the point metrics and of the metrics with intervals.
+
+    python benchmarks/bench_slice_metrics.py --num-rows 1000000 --workers 4
+"""
+
+import os
+import sys
+import time
+
+import click
+import numpy as np
+import pandas as pd
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "scripts")
+)
+
+from feature_transformer import TARGET, FeatureTransformer, clean_data, fit_vocabulary
+from slice_metrics import SLICE_COLUMNS, slice_codes, sliced_metrics
+
+
+def _legacy_sliced_metrics(X, y, predictions, transformer, num_replicates):
+    rng = np.random.default_rng(2023)
+    codes, labels = slice_codes(X, transformer)
+    errors = predictions - y
+    rows = []
+    for i, col in enumerate(SLICE_COLUMNS):
+        for code, label in enumerate(labels[col]):
+            e = errors[codes[i] == code]
+            if not len(e):
+                continue
+            abs_e = np.abs(e)
+            maes = [
+                abs_e[rng.integers(0, len(e), len(e))].mean()
+                for _ in range(num_replicates)
+            ]
+            low, high = np.percentile(maes, [2.5, 97.5]) if maes else (np.nan,) * 2
+            rows.append((col, str(label), len(e), abs_e.mean(), low, high, e.mean()))
+    return pd.DataFrame(
+        rows,
+        columns=["column", "value", "count", "mae", "mae_low", "mae_high", "bias"],
+    )
+
+
+def _best(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+@click.command(help="Benchmark vectorized sliced metrics against a slice loop")
+@click.option("--num-rows", type=int, multiple=True, default=[100000, 1000000])
+@click.option("--num-replicates", type=int, default=200)
+@click.option("--workers", type=int, default=-1)
+@click.option("--repeat", type=int, default=3)
+@click.option("--filepath", type=str, default="data/resale-flat-prices-2022-jan.csv")
+def bench(num_rows, num_replicates, workers, repeat, filepath):
+    cleaned = clean_data(pd.read_csv(filepath))
+    transformer = FeatureTransformer(fit_vocabulary(cleaned), onehot_dtype="uint8")
+    rng = np.random.default_rng(2023)
+    for n in num_rows:
+        sample = cleaned.iloc[rng.integers(0, len(cleaned), n)].reset_index(drop=True)
+        encoded = transformer.encode(sample)
+        X, y = encoded.drop(columns=TARGET), encoded[TARGET].to_numpy(np.float64)
+        predictions = y + rng.normal(0, 50000, n)
+
+        legacy = _legacy_sliced_metrics(X, y, predictions, transformer, 0)
+        new = sliced_metrics(X, y, predictions, transformer, 0)
+        pd.testing.assert_frame_equal(
+            legacy.drop(columns=["mae_low", "mae_high"]),
+            new.drop(columns=["mae_low", "mae_high"]),
+        )
+        print("\n{} rows, {} slices".format(n, len(new)))
+        print(
+            "{:<26}{:>12}{:>12}{:>10}".format("metrics", "legacy s", "new s", "speedup")
+        )
+        cases = [
+            ("point", 0, repeat),
+            ("{} replicates".format(num_replicates), num_replicates, 1),
+        ]
+        for name, replicates, case_repeat in cases:
+            legacy_s = _best(
+                lambda: _legacy_sliced_metrics(
+                    X, y, predictions, transformer, replicates
+                ),
+                case_repeat,
+            )
+            new_s = _best(
+                lambda: sliced_metrics(
+                    X, y, predictions, transformer, replicates, workers
+                ),
+                case_repeat,
+            )
+            print(
+                "{:<26}{:>12.3f}{:>12.3f}{:>10.1f}".format(
+                    name, legacy_s, new_s, legacy_s / new_s
+                )
+            )
+
+
+if __name__ == "__main__":
+    bench()
@@ -0,0 +1,85 @@
+"""
+Benchmark the throughput of the tune step's hyperparameter search.
+
+Encodes the Jan-2022 sample resampled to --num-rows rows and runs the
+successive-halving search of `tune_model` on the encoded dataframe, which
+joblib pickles into every task, and on the memory-mapped matrix of
+`memmap_features`, which workers open by file name, for each number of
+workers. Reports the search time and trials (candidate x iteration) per second.
+
+The pipeline searches with criterion="absolute_error", whose cost grows
+quadratically with the rows of a node, so the search is timed with
+--criterion squared_error by default.
+
+    python benchmarks/bench_tune.py --num-rows 200000 --workers 1 --workers 4
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import click
+import numpy as np
+import pandas as pd
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "scripts")
+)
+
+from feature_transformer import TARGET, FeatureTransformer, clean_data, fit_vocabulary
+
+
+def _search(X, y, n_candidates, workers, criterion):
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+    from sklearn.model_selection import HalvingRandomSearchCV, KFold
+    from tune import PARAM_DISTRIBUTIONS
+
+    search = HalvingRandomSearchCV(
+        RandomForestRegressor(criterion=criterion, n_jobs=1, random_state=2023),
+        PARAM_DISTRIBUTIONS,
+        n_candidates=n_candidates,
+        cv=KFold(3, shuffle=True, random_state=2023),
+        scoring="neg_mean_absolute_error",
+        refit=False,
+        n_jobs=workers,
+        random_state=2023,
+    )
+    start = time.perf_counter()
+    search.fit(X, y)
+    return time.perf_counter() - start, len(search.cv_results_["params"])
+
+
+@click.command(help="Benchmark hyperparameter search throughput")
+@click.option("--num-rows", type=int, default=200000)
+@click.option("--n-candidates", type=int, default=9)
+@click.option("--workers", type=int, multiple=True, default=[1, 2, 4])
+@click.option("--criterion", type=str, default="squared_error")
+@click.option("--filepath", type=str, default="data/resale-flat-prices-2022-jan.csv")
+def bench(num_rows, n_candidates, workers, criterion, filepath):
+    from tune import memmap_features
+
+    sample = pd.read_csv(filepath)
+    rng = np.random.default_rng(2023)
+    raw = sample.iloc[rng.integers(0, len(sample), num_rows)].reset_index(drop=True)
+    cleaned = clean_data(raw)
+    train = FeatureTransformer(fit_vocabulary(cleaned)).encode(cleaned)
+
+    print("{} rows, {} cpus, criterion={}".format(num_rows, os.cpu_count(), criterion))
+    print("{:<12}{:>10}{:>12}{:>14}".format("X", "workers", "search s", "trials/s"))
+    with tempfile.TemporaryDirectory() as workdir:
+        X_mm, y = memmap_features(train, workdir)
+        variants = [("dataframe", train.drop(columns=TARGET)), ("memmap", X_mm)]
+        for n in workers:
+            for name, X in variants:
+                seconds, trials = _search(X, y, n_candidates, n, criterion)
+                print(
+                    "{:<12}{:>10}{:>12.2f}{:>14.2f}".format(
+                        name, n, seconds, trials / seconds
+                    )
+                )
+
+
+if __name__ == "__main__":
+    bench()
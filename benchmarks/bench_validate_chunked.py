@@ -0,0 +1,70 @@
+"""
+Benchmark out-of-core data validation on a process pool.
+
+Writes a csv of the Jan-2022 sample resampled to --num-rows rows, then
+profiles it the in-memory way (`pd.read_csv` + `profile_data`) and with
+`profile_csv` on each number of workers. Reports the wall time and the peak
+memory allocated (tracemalloc) in the calling process; workers hold one chunk
+each on top of that.
+
+    python benchmarks/bench_validate_chunked.py --num-rows 10000000 --workers 1 --workers 4
+"""
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import click
+import numpy as np
+import pandas as pd
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "scripts")
+)
+
+from data_validate import profile_csv
+from utils import infer_schema, profile_data
+
+
+def _traced(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak / 2**20
+
+
+@click.command(help="Benchmark chunked parallel profiling against read_csv")
+@click.option("--num-rows", type=int, default=2000000)
+@click.option("--chunksize", type=int, default=200000)
+@click.option("--workers", type=int, multiple=True, default=[1, 2, 4])
+@click.option("--filepath", type=str, default="data/resale-flat-prices-2022-jan.csv")
+def bench(num_rows, chunksize, workers, filepath):
+    sample = pd.read_csv(filepath)
+    rng = np.random.default_rng(2023)
+    data = sample.iloc[rng.integers(0, len(sample), num_rows)]
+    path = os.path.join(tempfile.mkdtemp(), "resale.csv")
+    data.to_csv(path, index=False)
+    del data
+    print(
+        "{} rows, {:.0f} MiB csv, {} cpus".format(
+            num_rows, os.path.getsize(path) / 2**20, os.cpu_count()
+        )
+    )
+
+    print("{:<22}{:>10}{:>12}".format("profile", "s", "peak MiB"))
+    expected, seconds, mib = _traced(lambda: profile_data(pd.read_csv(path)))
+    print("{:<22}{:>10.2f}{:>12.1f}".format("read_csv", seconds, mib))
+    for n in workers:
+        profile, seconds, mib = _traced(lambda: profile_csv(path, chunksize, n))
+        assert infer_schema(None, profile) == infer_schema(None, expected)
+        print("{:<22}{:>10.2f}{:>12.1f}".format("chunked x{}".format(n), seconds, mib))
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    bench()
@@ -0,0 +1,109 @@
+"""
+Benchmark continual training on a new month against retraining on all months.
+
+Resamples the Jan-2022 sample into a history of --history-rows rows, a new
+month of --new-rows rows and a holdout set. The baseline refits the engine on
+history + new month with the trees or iterations of the base and the update
+together; the warm start fits the base on the history once, then adds
+--n-estimators trees or iterations fitted on the new month only
+(`train.continue_training`). Reports the fit time of the update and the
+holdout MAE of both.
+
+rf_mae fits are close to quadratic in the rows of a node, so it is left out by
+default:
+
+    python benchmarks/bench_warm_start.py --history-rows 1000000 --new-rows 50000
+"""
+
+import os
+import sys
+import time
+
+import click
+import numpy as np
+import pandas as pd
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "scripts")
+)
+
+from feature_transformer import TARGET, FeatureTransformer, clean_data, fit_vocabulary
+from train import continue_training, make_estimator
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+@click.command(help="Benchmark warm-start training on a new month")
+@click.option("--history-rows", type=int, default=1000000)
+@click.option("--new-rows", type=int, default=50000)
+@click.option("--holdout-rows", type=int, default=20000)
+@click.option("--engine", type=str, multiple=True, default=["rf_mse", "hgb"])
+@click.option("--base-estimators", type=int, default=100)
+@click.option("--n-estimators", type=int, default=20)
+@click.option("--max-depth", type=int, default=8)
+@click.option("--filepath", type=str, default="data/resale-flat-prices-2022-jan.csv")
+def bench(
+    history_rows,
+    new_rows,
+    holdout_rows,
+    engine,
+    base_estimators,
+    n_estimators,
+    max_depth,
+    filepath,
+):
+    from sklearn.metrics import mean_absolute_error
+
+    cleaned = clean_data(pd.read_csv(filepath))
+    data = FeatureTransformer(fit_vocabulary(cleaned)).encode(cleaned)
+    rng = np.random.default_rng(2023)
+    rows = rng.integers(0, len(data), history_rows + new_rows + holdout_rows)
+    data = data.iloc[rows].reset_index(drop=True)
+    X, y = data.drop(columns=TARGET), data[TARGET].to_numpy()
+    history = slice(0, history_rows)
+    new = slice(history_rows, history_rows + new_rows)
+    holdout = slice(history_rows + new_rows, None)
+    everything = slice(0, history_rows + new_rows)
+
+    print(
+        "{} history rows, {} new rows, {} + {} estimators".format(
+            history_rows, new_rows, base_estimators, n_estimators
+        )
+    )
+    print(
+        "{:<8}{:>14}{:>14}{:>12}{:>14}{:>12}".format(
+            "engine", "retrain s", "warm s", "speedup", "retrain MAE", "warm MAE"
+        )
+    )
+    for name in engine:
+
+        def make(n):
+            return make_estimator(name, n, "sqrt", max_depth, 2, 1)
+
+        retrained, retrain_s = _timed(
+            lambda: make(base_estimators + n_estimators).fit(
+                X[everything], y[everything]
+            )
+        )
+        base = make(base_estimators).fit(X[history], y[history])
+        warm, warm_s = _timed(
+            lambda: continue_training(base, X[new], y[new], n_estimators)
+        )
+        print(
+            "{:<8}{:>14.2f}{:>14.2f}{:>12.1f}{:>14.0f}{:>12.0f}".format(
+                name,
+                retrain_s,
+                warm_s,
+                retrain_s / warm_s,
+                mean_absolute_error(y[holdout], retrained.predict(X[holdout])),
+                mean_absolute_error(y[holdout], warm.predict(X[holdout])),
+            )
+        )
+
+
+if __name__ == "__main__":
+    bench()
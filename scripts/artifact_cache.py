@@ -0,0 +1,234 @@
+"""
+Local on-disk cache of artifacts downloaded from the artifact store.
+
+Steps that run on the same machine share one cache directory: an artifact
+file or directory is downloaded once and every later step or rerun reads it
+from disk. Entries are keyed by the run id, the artifact path and a content
+fingerprint of the artifact: artifact stores expose no checksums, so the
+fingerprint is the sha256 of the listing of its files and their sizes, one
+cheap `list_artifacts` call per directory, and a re-logged artifact misses.
+
+Entries are downloaded to a temporary directory and renamed into place, so
+concurrent processes never read a partial entry; if two processes miss on the
+same key, one of them wins the rename and the other drops its copy. The
+cache is capped in size: after a miss, the least recently used entries are
+evicted under a file lock until the cache fits. Hits mark their entry as used
+under the same lock, and eviction skips entries used since it listed them, so
+an entry is not evicted between its hit and its read.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import posixpath
+import shutil
+import tempfile
+from contextlib import contextmanager
+from functools import lru_cache
+
+DEFAULT_CACHE_DIR = ".artifact_cache"
+DEFAULT_MAX_BYTES = 4 * 2**30
+ENTRY_FILENAME = "entry.json"
+DATA_DIRNAME = "data"
+
+
+def _split_uri(artifact_uri):
+    # (run id, artifact root uri, artifact path) of an artifact uri
+    if artifact_uri.startswith("runs:/"):
+        from mlflow.store.artifact.runs_artifact_repo import RunsArtifactRepository
+
+        run_id, artifact_path = RunsArtifactRepository.parse_runs_uri(artifact_uri)
+        root_uri = RunsArtifactRepository.get_underlying_uri("runs:/" + run_id)
+        return run_id, root_uri, (artifact_path or "").strip("/")
+    root_uri, artifact_path = posixpath.split(artifact_uri.rstrip("/"))
+    return "", root_uri, artifact_path
+
+
+def _listing(repo, artifact_path):
+    # [(path, size)] of the files of an artifact, recursing into directories
+    parent = posixpath.dirname(artifact_path) or None
+    infos = [f for f in repo.list_artifacts(parent) if f.path == artifact_path]
+    if not infos:
+        from mlflow.exceptions import MlflowException
+        from mlflow.protos.databricks_pb2 import RESOURCE_DOES_NOT_EXIST
+
+        raise MlflowException(
+            "No artifact at {}".format(artifact_path), RESOURCE_DOES_NOT_EXIST
+        )
+    files, pending = [], infos
+    while pending:
+        info = pending.pop()
+        if info.is_dir:
+            pending.extend(repo.list_artifacts(info.path))
+        else:
+            files.append((info.path, info.file_size))
+    return sorted(files)
+
+
+class ArtifactCache:
+    """Size-capped LRU cache of artifacts, one directory per entry
+
+    Args:
+        cache_dir (str): directory of the cache, shared by processes
+        max_bytes (int): size cap of the cache, 0 to download every artifact
+            to a temporary directory instead
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or os.environ.get(
+            "ARTIFACT_CACHE_DIR", DEFAULT_CACHE_DIR
+        )
+        if max_bytes is None:
+            max_bytes = int(
+                os.environ.get("ARTIFACT_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)
+            )
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes_downloaded = 0
+
+    def fetch(self, artifact_uri):
+        """Local path of an artifact file or directory, downloaded on a miss
+
+        Args:
+            artifact_uri (str): runs:/ or artifact store uri of the artifact
+
+        Returns:
+            path: local path of the artifact, to be read but not modified
+        """
+        from mlflow.store.artifact.artifact_repository_registry import (
+            get_artifact_repository,
+        )
+
+        run_id, root_uri, artifact_path = _split_uri(artifact_uri)
+        repo = get_artifact_repository(root_uri)
+        listing = _listing(repo, artifact_path)
+        size = sum(file_size or 0 for _, file_size in listing)
+        if self.max_bytes <= 0:
+            self.misses += 1
+            self.bytes_downloaded += size
+            return repo.download_artifacts(artifact_path, tempfile.mkdtemp())
+
+        fingerprint = hashlib.sha256(json.dumps(listing).encode("utf-8")).hexdigest()
+        key = hashlib.sha256(
+            json.dumps([run_id or root_uri, artifact_path, fingerprint]).encode("utf-8")
+        ).hexdigest()
+        entry = os.path.join(self.cache_dir, key)
+        path = os.path.join(entry, DATA_DIRNAME, *artifact_path.split("/"))
+        try:
+            # the access time of an entry is the mtime of its entry file
+            with self._lock():
+                os.utime(os.path.join(entry, ENTRY_FILENAME))
+            self.hits += 1
+            return path
+        except FileNotFoundError:
+            pass
+
+        self.misses += 1
+        self.bytes_downloaded += size
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_entry = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp-")
+        try:
+            data_dir = os.path.join(tmp_entry, DATA_DIRNAME)
+            os.mkdir(data_dir)
+            repo.download_artifacts(artifact_path, data_dir)
+            with open(os.path.join(tmp_entry, ENTRY_FILENAME), "w") as f:
+                json.dump(
+                    {
+                        "run_id": run_id,
+                        "root_uri": root_uri,
+                        "artifact_path": artifact_path,
+                        "fingerprint": fingerprint,
+                        "size": size,
+                    },
+                    f,
+                )
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # another process added the entry first
+            if not os.path.exists(os.path.join(entry, ENTRY_FILENAME)):
+                raise
+        finally:
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+        self.evict(keep=key)
+        return path
+
+    @contextmanager
+    def _lock(self):
+        with open(os.path.join(self.cache_dir, ".lock"), "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def entries(self):
+        """(last access time, size, key) of the entries of the cache"""
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry_path = os.path.join(self.cache_dir, key, ENTRY_FILENAME)
+            try:
+                with open(entry_path, "r") as f:
+                    size = json.load(f)["size"]
+                entries.append((os.path.getmtime(entry_path), size, key))
+            except (OSError, ValueError, KeyError):
+                # temporary directories and entries being evicted
+                continue
+        return entries
+
+    def evict(self, keep=None):
+        """Remove the least recently used entries until the cache fits
+
+        Args:
+            keep (str): key of an entry to never evict, eg. the one just
+                downloaded
+
+        Returns:
+            evicted: number of removed entries
+        """
+        evicted = 0
+        with self._lock():
+            entries = sorted(self.entries())
+            total = sum(size for _, size, _ in entries)
+            for mtime, size, key in entries:
+                if total <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                entry_path = os.path.join(self.cache_dir, key, ENTRY_FILENAME)
+                try:
+                    if os.path.getmtime(entry_path) != mtime:
+                        # used since the listing
+                        continue
+                except FileNotFoundError:
+                    continue
+                # rename first, so readers never see a half-deleted entry
+                trash = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp-")
+                os.rename(os.path.join(self.cache_dir, key), os.path.join(trash, key))
+                shutil.rmtree(trash, ignore_errors=True)
+                total -= size
+                evicted += 1
+        return evicted
+
+    def log_metrics(self):
+        """Log the hits, misses and downloaded bytes since the last call to
+        the active run, if the cache was used"""
+        if not self.hits + self.misses:
+            return
+        from run_logger import run_logger
+
+        run_logger().log_metrics(
+            {
+                "artifact_cache_hits": self.hits,
+                "artifact_cache_misses": self.misses,
+                "artifact_cache_bytes_downloaded": self.bytes_downloaded,
+            }
+        )
+        self.hits = self.misses = self.bytes_downloaded = 0
+
+
+@lru_cache(maxsize=1)
+def default_cache():
+    """Cache shared by the entry points of this process"""
+    return ArtifactCache()
@@ -0,0 +1,176 @@
+import logging
+import os
+import time
+from collections import deque
+from functools import partial
+
+import click
+import pandas as pd
+from feature_transformer import TARGET
+from resale_model import SIGNATURE, load_resale_model
+from run_logger import run_logger
+from utils import (
+    REGISTERED_MODEL_NAME,
+    SplitWriter,
+    csv_chunk_offsets,
+    model_uri_run,
+    process_pool,
+    read_csv_range,
+    step_run,
+)
+
+PREDICTION_COLUMN = "predicted_" + TARGET
+CHUNKSIZE = 100000
+OUTPUT_FORMATS = ["parquet", "feather"]
+# model inputs are parsed with the types of the model signature, the target
+# as float and the other columns as strings (eg. `block` is "10" or "10A"), so
+# every chunk of a csv gets the same output schema
+_SIGNATURE_DTYPES = {"string": str, "double": "float64", "long": "int64"}
+CSV_DTYPES = {
+    col.name: _SIGNATURE_DTYPES[col.type.name] for col in SIGNATURE.inputs.inputs
+}
+CSV_DTYPES[TARGET] = "float64"
+
+# model of a worker process, loaded by its initializer
+_worker_model = None
+
+
+def _init_worker(load_model):
+    global _worker_model
+    _worker_model = load_model()
+
+
+def iter_chunks(filepath, chunksize=CHUNKSIZE):
+    """Chunks of a csv or parquet file, for `score_chunk`
+
+    A csv is split into byte ranges of `chunksize` lines, which the workers
+    parse, so lines must be records. A parquet file is read `chunksize` rows
+    at a time.
+    """
+    if filepath.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(filepath).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+        return
+    names = pd.read_csv(filepath, nrows=0).columns.tolist()
+    dtype = {col: CSV_DTYPES.get(col, str) for col in names}
+    offsets = csv_chunk_offsets(filepath, chunksize)
+    for start, end in zip(offsets[:-1], offsets[1:]):
+        yield partial(read_csv_range, filepath, names, start, end, dtype=dtype)
+
+
+def score_chunk(chunk):
+    """Rows of a chunk of `iter_chunks` with the predictions of the worker's
+    model in PREDICTION_COLUMN"""
+    data = chunk if isinstance(chunk, pd.DataFrame) else chunk()
+    data[PREDICTION_COLUMN] = _worker_model.predict(None, data)
+    return data
+
+
+def _ordered(executor, fn, items, max_pending):
+    # executor.map, with at most `max_pending` results held at a time
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def score_file(
+    filepath,
+    output,
+    load_model,
+    chunksize=CHUNKSIZE,
+    workers=1,
+    output_format="parquet",
+):
+    """Predict the rows of a file chunk by chunk and append them, with their
+    predictions, to a columnar file in input order. At most two chunks per
+    worker are in memory at once.
+
+    Args:
+        filepath (str): csv or parquet file of raw resale rows
+        output (str): parquet or feather file to write
+        load_model (callable): picklable function returning the model, called
+            once per worker, eg. `partial(load_resale_model, run_id)`
+        chunksize (int): rows per chunk, one row group / record batch of the
+            output each
+        workers (int): processes scoring chunks, -1 for all cores, 1 to score
+            in this process
+        output_format (str): one of OUTPUT_FORMATS
+
+    Returns:
+        rows: number of rows scored
+    """
+    if workers < 0:
+        workers = os.cpu_count()
+    chunks = iter_chunks(filepath, chunksize)
+    with SplitWriter(output, output_format) as writer:
+        if workers <= 1:
+            _init_worker(load_model)
+            for scored in map(score_chunk, chunks):
+                writer.write(scored)
+        else:
+            with process_pool(
+                workers, initializer=_init_worker, initargs=(load_model,)
+            ) as executor:
+                for scored in _ordered(executor, score_chunk, chunks, 2 * workers):
+                    writer.write(scored)
+        return writer.rows_written
+
+
+@click.command(help="Predict the resale price of every row of a file")
+@click.option("--filepath", type=str, default="data/resale-flat-prices-2022-jan.csv")
+@click.option(
+    "--model-uri",
+    type=str,
+    default="models:/{}/latest".format(REGISTERED_MODEL_NAME),
+    help="models:/ uri of a registered version, or runs:/ uri of a run's model",
+)
+@click.option("--output", type=str, default="predictions.parquet")
+@click.option("--output-format", type=click.Choice(OUTPUT_FORMATS), default="parquet")
+@click.option("--chunksize", type=click.IntRange(1), default=CHUNKSIZE)
+@click.option(
+    "--workers",
+    type=int,
+    default=-1,
+    help="Processes scoring chunks, -1 for all cores",
+)
+def batch_score(filepath, model_uri, output, output_format, chunksize, workers):
+    with step_run("batch_score"):
+        logger = logging.getLogger()
+        run_id = model_uri_run(model_uri)
+        logger.info("Scoring {} with the model of run {}".format(filepath, run_id))
+        run_logger().set_tags({"model_uri": model_uri, "model_run_id": run_id})
+        # downloads the artifacts once, before the workers load them
+        load_resale_model(run_id)
+
+        start = time.perf_counter()
+        rows = score_file(
+            filepath,
+            output,
+            partial(load_resale_model, run_id),
+            chunksize,
+            workers,
+            output_format,
+        )
+        seconds = time.perf_counter() - start
+        logger.info(
+            "Wrote {} predictions to {} in {:.1f}s ({:.0f} rows/s)".format(
+                rows, output, seconds, rows / seconds
+            )
+        )
+        run_logger().log_metrics(
+            {
+                "batch_score_rows": rows,
+                "batch_score_seconds": seconds,
+                "batch_score_rows_per_s": rows / seconds,
+            }
+        )
+
+
+if __name__ == "__main__":
+    batch_score()
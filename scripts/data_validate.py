@@ -1,113 +1,213 @@
 import logging
-import hashlib
-from urllib.parse import unquote, urlparse
-import os
-import sys
+from functools import partial
 import mlflow
-from mlflow.tracking import MlflowClient
-from mlflow.entities import RunStatus
 import click
 import pandas as pd
-from utils import infer_schema, compare_data_to_schema
+from utils import (
+    compare_data_to_schema,
+    compare_drift_to_schema,
+    csv_chunk_offsets,
+    infer_schema,
+    merge_profiles,
+    missing_data,
+    profile_data,
+    process_pool,
+    read_csv_range,
+    step_run,
+)
+from run_logger import run_logger
+from schema_registry import DEFAULT_DATASET_NAME, SCHEMA_ARTIFACT_PATH, SchemaRegistry
+
+# quantiles of the numeric columns logged with the schema
+QUANTILES = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+# reference bins per column stored in the schema for drift checks
+DRIFT_BINS = 10
+# columns that shift with every monthly file by construction
+DRIFT_EXCLUDE = ("month", "remaining_lease")
+
+
+def _profile_range(filepath, names, start, end, max_domain=None):
+    return profile_data(read_csv_range(filepath, names, start, end), max_domain)
+
+
+def profile_csv(filepath, chunksize, workers=1, max_domain=None):
+    """Profile a csv out of core, `chunksize` rows at a time
+
+    The file is split into byte ranges of `chunksize` lines, which are parsed
+    and profiled on a pool of `workers` processes and merged in file order.
+    Lines must be records, ie. values must not contain newlines.
+
+    Args:
+        filepath (str): csv with a header line
+        chunksize (int): rows per chunk
+        workers (int): number of processes, 1 to profile in this process
+        max_domain (int): bound of the category domains, None for exact domains
+
+    Returns:
+        profile: column name -> ColumnProfile of the whole csv
+    """
+    names = pd.read_csv(filepath, nrows=0).columns.tolist()
+    offsets = csv_chunk_offsets(filepath, chunksize)
+    profile_range = partial(_profile_range, filepath, names, max_domain=max_domain)
+    starts, ends = offsets[:-1], offsets[1:]
+    if workers <= 1:
+        return merge_profiles(map(profile_range, starts, ends), max_domain)
+    with process_pool(workers) as executor:
+        return merge_profiles(executor.map(profile_range, starts, ends), max_domain)
+
+
+def validate_data(data, dataset_name=DEFAULT_DATASET_NAME, **drift_options):
+    """Validate data against the latest accepted schema of the dataset, check
+    its drift from the schema's reference bins and check for missing data. If
+    all pass, the schema of the data becomes the latest accepted one. Must be
+    called inside an active run; tags it with `validation_status`.
+
+    Args:
+        data (pd.DataFrame): raw HDB resale dataset
+        dataset_name (str): name the schemas are registered under
+        drift_options: drift options of `validate_profile`
+    """
+    validate_profile(profile_data(data), dataset_name, **drift_options)
+
+
+def validate_profile(
+    profile,
+    dataset_name=DEFAULT_DATASET_NAME,
+    drift_bins=DRIFT_BINS,
+    drift_warn=0.1,
+    drift_fail=0.25,
+    drift_exclude=DRIFT_EXCLUDE,
+):
+    """`validate_data` with the profile of the data, eg. from `profile_csv`
+
+    Args:
+        profile (dict): column name -> ColumnProfile of the raw dataset
+        dataset_name (str): name the schemas are registered under
+        drift_bins (int): reference bins per column stored in the schema
+        drift_warn (float): PSI of a column above which drift is warned about
+        drift_fail (float): PSI of a column above which validation fails
+        drift_exclude (tuple): columns not checked for drift
+    """
+    logger = logging.getLogger()
+    mlrun = mlflow.active_run()
+    registry = SchemaRegistry(mlrun.info.experiment_id)
+
+    schema_curr = infer_schema(None, profile, num_bins=drift_bins)
+    # validate current data with the latest accepted schema of the dataset
+    schema_old, old_run_id = registry.latest(dataset_name)
+    if schema_old is not None:
+        # data.at[0, "resale_price"] = 10000000 # for testing
+        # data.rename({"month": "date"}, axis=1, inplace=True) # for testing
+        # data.at[0, "flat_type"] = "Bungalow" # for testing
+        data_val_status = compare_data_to_schema(None, schema_old, profile)
+        if data_val_status == "Failed":
+            logger.error("Data validation with previous schema failed!")
+            raise RuntimeError("Data validation with previous schema failed!")
+        logger.info(
+            "Data validation with previous schema from run {} passed!".format(
+                old_run_id
+            )
+        )
+        drift_status, scores = compare_drift_to_schema(
+            schema_old, profile, drift_warn, drift_fail, drift_exclude
+        )
+        run_logger().log_metrics(
+            {
+                "drift_{}_{}".format(name, col): score
+                for col, col_scores in scores.items()
+                for name, score in col_scores.items()
+            }
+        )
+        if drift_status == "Failed":
+            logger.error("Data drift from previous schema check failed!")
+            raise RuntimeError("Data drift from previous schema check failed!")
+        logger.info("Data drift check on {} columns passed!".format(len(scores)))
+        logger.info("Logging current schema ...")
+    else:
+        logger.info(
+            "Found no previous schema from successful data validation runs. Proceeding to log current schema ..."
+        )
+    run_logger().log_dict(schema_curr, SCHEMA_ARTIFACT_PATH)
+    quantiles = {
+        col: {str(q): p.quantile(q) for q in QUANTILES}
+        for col, p in profile.items()
+        if p.sketch is not None
+    }
+    run_logger().log_dict(quantiles, "data_schema/quantiles.json")
+
+    # check for missing data
+    for col, num in missing_data(profile).items():
+        logger.error("Column `{}` has ({}) missing data".format(col, num))
+        logger.error("Data validation for missing data has failed!")
+        raise RuntimeError("Data validation for missing data has failed!")
+    logger.info("Data validation for missing data has passed!")
+
+    digest = registry.accept(schema_curr, mlrun.info.run_id, dataset_name)
+    logger.info("Accepted schema {} for dataset `{}`".format(digest, dataset_name))
+    run_logger().set_tags({"validation_status": "pass"})
 
 
 @click.command(help="Preprocess HDB resale dataset and saves it as mlflow artifact")
 @click.option("--filepath", type=str, default="data/resale-flat-prices-2022-jan.csv")
-def data_validate(filepath):
-    with mlflow.start_run() as mlrun:
-        artifact_uri = mlrun.info.artifact_uri
-
-        # logging
+@click.option(
+    "--chunksize",
+    default=0,
+    type=click.IntRange(0),
+    help="Rows per chunk to validate out of core, 0 to load the whole csv",
+)
+@click.option(
+    "--workers",
+    default=1,
+    type=click.IntRange(1),
+    help="Number of processes profiling chunks when validating out of core",
+)
+@click.option(
+    "--dataset-name",
+    type=str,
+    default=DEFAULT_DATASET_NAME,
+    help="Name the accepted schemas of the dataset are registered under",
+)
+@click.option(
+    "--drift-warn",
+    default=0.1,
+    type=float,
+    help="PSI of a column from the previous schema above which drift is warned about",
+)
+@click.option(
+    "--drift-fail",
+    default=0.25,
+    type=float,
+    help="PSI of a column from the previous schema above which validation fails",
+)
+@click.option(
+    "--drift-exclude",
+    default=",".join(DRIFT_EXCLUDE),
+    type=str,
+    help="Comma-separated columns not checked for drift",
+)
+def data_validate(
+    filepath, chunksize, workers, dataset_name, drift_warn, drift_fail, drift_exclude
+):
+    drift_options = {
+        "drift_warn": drift_warn,
+        "drift_fail": drift_fail,
+        "drift_exclude": tuple(col for col in drift_exclude.split(",") if col),
+    }
+    with step_run("data_validate"):
         logger = logging.getLogger()
-        logger.setLevel(logging.DEBUG)
-        logging.captureWarnings(True)
-        formatter = logging.Formatter(
-            "%(asctime)s - %(levelname)s - %(message)s", "%Y-%m-%d %H:%M:%S"
-        )
-
-        file_handler = logging.FileHandler(
-            unquote(urlparse(os.path.join(artifact_uri, "log.log")).path)
-        )
-        file_handler.setLevel(logging.DEBUG)
-        file_handler.setFormatter(formatter)
-
-        stdout_handler = logging.StreamHandler(sys.stdout)
-        stdout_handler.setLevel(logging.DEBUG)
-        stdout_handler.setFormatter(formatter)
-
-        logger.addHandler(file_handler)
-        logger.addHandler(stdout_handler)
-
-        # hash current file and log it as artifact
-        curr_file_hash = hashlib.md5(
-            open("scripts/data_validate.py", "rb").read()
-        ).hexdigest()
-        mlflow.log_text(curr_file_hash, "entrypoint_hash/hash.txt")
-
-        logger.info("Reading data from {}".format(filepath))
-        data = pd.read_csv(filepath)
-
-        exp_id = mlrun.info.experiment_id
-        client = MlflowClient()
-        all_runs = reversed(client.search_runs([exp_id]))
-
-        # infer schema
-        schema_curr = infer_schema(data)
-        found_old_schema = False
-
-        if all_runs:  # experiment have previous runs:
-            # validate current data with newest schema
-            # get latest main run, get its data_validate run, and check for the schema, if any
-            for run in all_runs:
-                tags = run.data.tags
-                if tags.get("mlflow.project.entryPoint") == "main" and tags.get(
-                    "data_validate"
-                ):
-                    run_id = tags.get("data_validate")
-                    old_run = client.get_run(run_id)
-                    if old_run.info.to_proto().status != RunStatus.FINISHED:
-                        break
-                    schema_old_path = os.path.join(
-                        client.get_run(run_id).info.artifact_uri,
-                        "data_schema/schema.json",
-                    )
-                    # might fail here if there is no schema dict found
-                    schema_old = mlflow.artifacts.load_dict(schema_old_path)
-                    found_old_schema = True
-                    # data.at[0, "resale_price"] = 10000000 # for testing
-                    # data.rename({"month": "date"}, axis=1, inplace=True) # for testing
-                    # data.at[0, "flat_type"] = "Bungalow" # for testing
-                    data_val_status = compare_data_to_schema(data, schema_old)
-                    if data_val_status == "Failed":
-                        logger.error("Data validation with previous schema failed!")
-                        raise RuntimeError(
-                            "Data validation with previous schema failed!"
-                        )
-                    logger.info("Data validation with previous schema passed!")
-                    break
-
-        if not found_old_schema:
+        if chunksize > 0:
             logger.info(
-                "Found no previous schema from successful data validation runs. Proceeding to log current schema ..."
+                "Profiling {} in chunks of {} rows on {} workers".format(
+                    filepath, chunksize, workers
+                )
             )
-        else:
-            logger.info("Logging current schema ...")
-        mlflow.log_dict(schema_curr, "data_schema/schema.json")
-
-        # check for missing data
-        missing = (
-            pd.concat([data.isnull().any(), data.isnull().sum()], axis=1)
-            .T.apply(tuple)
-            .to_dict("list")
-        )
-        for col, [miss, num] in missing.items():
-            if miss:
-                logger.error("Column `{}` has ({}) missing data".format(col, num))
-                logger.error("Data validation for missing data has failed!")
-                raise RuntimeError("Data validation for missing data has failed!")
-        logger.info("Data validation for missing data has passed!")
-
-        mlflow.set_tags({"validation_status": "pass"})
+            validate_profile(
+                profile_csv(filepath, chunksize, workers), dataset_name, **drift_options
+            )
+            return
+        logger.info("Reading data from {}".format(filepath))
+        data = pd.read_csv(filepath)
+        validate_data(data, dataset_name, **drift_options)
 
 
 if __name__ == "__main__":
@@ -1,63 +1,124 @@
 import logging
-import hashlib
-from urllib.parse import unquote, urlparse
 import os
-import sys
-import mlflow
 import click
-import pandas as pd
-from sklearn.metrics import mean_absolute_error
+from feature_transformer import FeatureTransformer, find_transformer
+from run_logger import run_logger
+from tree_ensemble import load_model
+from utils import FEATURE_MATRICES, load_split, step_run, to_csr
 
+SLICE_METRICS_PATH = "slice_metrics.parquet"
 
-@click.command(help="Evaluate the trained model")
-@click.option("--datadir", type=str)
-@click.option("--modeldir", type=str)
-def evaluate(datadir, modeldir):
-    with mlflow.start_run() as mlrun:
-        artifact_uri = mlrun.info.artifact_uri
 
-        # logging
-        logger = logging.getLogger()
-        logger.setLevel(logging.DEBUG)
-        logging.captureWarnings(True)
-        formatter = logging.Formatter(
-            "%(asctime)s - %(levelname)s - %(message)s", "%Y-%m-%d %H:%M:%S"
-        )
+def evaluate_model(
+    test,
+    model,
+    feature_matrix="dense",
+    transformer=None,
+    num_replicates=200,
+    workers=1,
+):
+    """Log the test MAE of a model, and its metrics per slice of the test
+    split if the transformer of the splits is given. Must be called inside an
+    active run.
+
+    Args:
+        test (pd.DataFrame): test split with `resale_price` column
+        model: fitted regressor
+        feature_matrix (str): "dense" to predict on the dataframe, "csr" on a
+            sparse matrix, see train.train_model
+        transformer (FeatureTransformer): transformer of the splits, to
+            decode the slices of the rows, see slice_metrics.py
+        num_replicates (int): bootstrap replicates of the slice MAE
+            intervals, 0 to skip them
+        workers (int): processes computing the replicates, -1 for all cores
+
+    Returns:
+        test_mae: mean absolute error on the test split
+    """
+    from sklearn.metrics import mean_absolute_error
+
+    logger = logging.getLogger()
+
+    y_test = test[["resale_price"]]
+    X_test = test.drop(["resale_price"], axis=1)
+    X_predict = to_csr(X_test) if feature_matrix == "csr" else X_test
 
-        file_handler = logging.FileHandler(
-            unquote(urlparse(os.path.join(artifact_uri, "log.log")).path)
+    # evaluate on test set
+    predictions = model.predict(X_predict)
+    test_mae = mean_absolute_error(y_test, predictions)
+    logger.info("Test MAE: %.2f" % test_mae)
+    run_logger().log_metric("test_mae", test_mae)
+
+    if transformer is not None:
+        log_slice_metrics(
+            X_test,
+            y_test["resale_price"].to_numpy(),
+            predictions,
+            transformer,
+            num_replicates,
+            workers,
         )
-        file_handler.setLevel(logging.DEBUG)
-        file_handler.setFormatter(formatter)
 
-        stdout_handler = logging.StreamHandler(sys.stdout)
-        stdout_handler.setLevel(logging.DEBUG)
-        stdout_handler.setFormatter(formatter)
+    return test_mae
+
+
+def log_slice_metrics(X, y, predictions, transformer, num_replicates, workers):
+    """Log the table of `slice_metrics.sliced_metrics` as a parquet artifact"""
+    from slice_metrics import sliced_metrics
+
+    logger = logging.getLogger()
+
+    logger.debug("Computing metrics per slice")
+    table = sliced_metrics(X, y, predictions, transformer, num_replicates, workers)
+    worst = table.loc[table["mae"].idxmax()]
+    logger.info(
+        "Highest slice MAE: %.2f for %s=%s (%d rows)"
+        % (worst["mae"], worst["column"], worst["value"], worst["count"])
+    )
+    with run_logger().staging_dir() as tmpdir:
+        table.to_parquet(os.path.join(tmpdir, SLICE_METRICS_PATH), index=False)
+    return table
 
-        logger.addHandler(file_handler)
-        logger.addHandler(stdout_handler)
 
-        # hash current file and log it as artifact
-        curr_file_hash = hashlib.md5(
-            open("scripts/evaluate.py", "rb").read()
-        ).hexdigest()
-        mlflow.log_text(curr_file_hash, "entrypoint_hash/hash.txt")
+@click.command(help="Evaluate the trained model")
+@click.option("--datadir", type=str)
+@click.option("--modeldir", type=str)
+@click.option(
+    "--feature-matrix",
+    type=click.Choice(FEATURE_MATRICES),
+    default="dense",
+    help="Predict on the dataframe or on a sparse CSR matrix",
+)
+@click.option(
+    "--bootstrap",
+    type=click.IntRange(0),
+    default=200,
+    help="Bootstrap replicates of the slice MAE intervals, 0 to skip them",
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=-1,
+    help="Processes computing the bootstrap replicates, -1 for all cores",
+)
+def evaluate(datadir, modeldir, feature_matrix, bootstrap, workers):
+    with step_run("evaluate"):
+        logger = logging.getLogger()
 
         # load test data
-        test_path = os.path.join(datadir, "test.csv")
-        logger.info("Reading test data from {}".format(test_path))
-        test = pd.read_csv(test_path)
-        y_test = test[["resale_price"]]
-        X_test = test.drop(["resale_price"], axis=1)
+        logger.info("Reading test data from {}".format(datadir))
+        test = load_split(datadir, "test")
 
         # load model
         logger.info("Loading model from {}".format(modeldir))
-        model = mlflow.sklearn.load_model(modeldir)
+        model = load_model(modeldir)
 
-        # evaluate on test set
-        test_mae = mean_absolute_error(y_test, model.predict(X_test))
-        logger.info("Test MAE: %.2f" % test_mae)
-        mlflow.log_metric("test_mae", test_mae)
+        transformer_path = find_transformer(datadir)
+        if transformer_path is not None:
+            transformer = FeatureTransformer.load(transformer_path)
+        else:
+            transformer = None
+        evaluate_model(test, model, feature_matrix, transformer, bootstrap, workers)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,233 @@
+"""
+Feature encoding shared by preprocess and the served model.
+
+`preprocess` fits the category vocabularies on the cleaned dataset and
+compiles them into a `FeatureTransformer`: a set of lookup tables that encode
+a batch of rows with array indexing. The transformer is saved as JSON next to
+the train/validation/test splits, and `train` bundles it with the fitted
+estimator into a pyfunc model that takes raw resale rows (see resale_model.py).
+"""
+
+import json
+import os
+import re
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from utils import category_codes, local_path, map_unique
+
+TARGET = "resale_price"
+RAW_FEATURES = [
+    "town",
+    "flat_type",
+    "storey_range",
+    "floor_area_sqm",
+    "flat_model",
+    "lease_commence_date",
+    "remaining_lease",
+]
+COLUMNS = [TARGET] + RAW_FEATURES
+TRANSFORMER_FILENAME = "feature_transformer.json"
+VOCABULARY_COLUMNS = ["town", "storey_range", "flat_model"]
+ONEHOT_COLUMNS = ["town", "flat_model"]
+FLAT_TYPE_MAP = {
+    "1 ROOM": 0,
+    "2 ROOM": 1,
+    "3 ROOM": 2,
+    "4 ROOM": 3,
+    "5 ROOM": 4,
+    "MULTI-GENERATION": 5,
+    "EXECUTIVE": 6,
+}
+
+
+def normalize_category(values):
+    """Normalize the raw values of a categorical column: every maisonette
+    flat_model becomes `Maisonette`"""
+    # only string columns can match, and each distinct value is matched once
+    if values.dtype != object:
+        return values
+    return map_unique(
+        values,
+        lambda s: s.replace(regex=[r".*[mM]aisonette.*", "foo"], value="Maisonette"),
+    )
+
+
+def _parse_remaining_lease(values):
+    return map_unique(
+        values,
+        lambda s: s.str.extract(r"(\d+)(?= years)", expand=False).astype("int16"),
+    )
+
+
+def clean_data(data):
+    """Select the model columns and normalize their raw values. Row-wise, so
+    cleaning chunks gives the same rows as cleaning the whole dataset. The
+    target column is kept if present."""
+    columns = COLUMNS if TARGET in data else RAW_FEATURES
+    cleaned = {col: normalize_category(data[col]) for col in columns}
+    cleaned["remaining_lease"] = _parse_remaining_lease(cleaned["remaining_lease"])
+    return pd.DataFrame(cleaned)
+
+
+def fit_vocabulary(data):
+    """Sorted categories of each encoded categorical column of cleaned data"""
+    return {col: sorted(data[col].unique().tolist()) for col in VOCABULARY_COLUMNS}
+
+
+@lru_cache(maxsize=4096)
+def _lease_years(remaining_lease):
+    # same as the `str.extract` in `_parse_remaining_lease`, for a single value
+    match = re.search(r"(\d+)(?= years)", remaining_lease)
+    if match is None:
+        raise ValueError("Cannot parse remaining_lease `{}`".format(remaining_lease))
+    return int(match.group(1))
+
+
+class FeatureTransformer:
+    """Encodes resale rows with lookup tables compiled from fitted vocabularies
+
+    flat_type is mapped with `flat_type_map`, storey_range is label encoded
+    by its sorted categories, town and flat_model are one-hot encoded without
+    their first category. Unknown town and flat_model values are encoded as
+    all zeros, unknown flat_type and storey_range values raise a ValueError.
+
+    Args:
+        vocabulary (dict): output of `fit_vocabulary` on the full dataset
+        flat_type_map (dict): flat_type -> ordinal
+        onehot_dtype (str): dtype of the one-hot features `encode` writes,
+            eg. "uint8" for 1 byte per value. `transform` always returns
+            float64 features.
+    """
+
+    def __init__(self, vocabulary, flat_type_map=None, onehot_dtype="float64"):
+        self.vocabulary = {col: list(vocabulary[col]) for col in VOCABULARY_COLUMNS}
+        self.flat_type_map = dict(flat_type_map or FLAT_TYPE_MAP)
+        self.onehot_dtype = onehot_dtype
+
+        # categories of each column, in the order of their codes
+        self._categories = dict(self.vocabulary, flat_type=list(self.flat_type_map))
+        # code -> encoded value(s) tables
+        self._flat_type_table = np.array(
+            list(self.flat_type_map.values()), dtype=np.int64
+        )
+        # columns of the encoded features, in the order the model expects
+        self.feature_names = [col for col in RAW_FEATURES if col not in ONEHOT_COLUMNS]
+        self._onehot_tables = {}
+        for col in ONEHOT_COLUMNS:
+            k = len(self.vocabulary[col])
+            # the first category is dropped, the last row is for unknown values
+            self._onehot_tables[col] = np.vstack([np.eye(k)[:, 1:], np.zeros(k - 1)])
+            self.feature_names += [str(c) for c in self.vocabulary[col][1:]]
+
+    def cat_features_schema(self):
+        """Categories and ohe feature names of each one-hot encoded column"""
+        return {
+            col: {
+                "categories": self.vocabulary[col],
+                "ohe_features": [str(c) for c in self.vocabulary[col][1:]],
+            }
+            for col in ONEHOT_COLUMNS
+        }
+
+    def _codes(self, col, values):
+        categories = self._categories[col]
+        codes = category_codes(values, categories)
+        missing = codes < 0
+        if missing.any():
+            # raw values that clean to a known category, eg. "Model A-Maisonette".
+            # Only the distinct unmatched values are cleaned.
+            codes[missing] = category_codes(
+                normalize_category(values[missing]), categories
+            )
+        if col not in ONEHOT_COLUMNS and (codes < 0).any():
+            unknown = values[codes < 0].unique().tolist()
+            raise ValueError("Unknown {} values: {}".format(col, unknown))
+        return codes
+
+    def encode(self, data):
+        """Encode the output of `clean_data`, modified in place. The one-hot
+        features are appended without copying the frame.
+
+        Returns:
+            data: encoded dataframe, the target first if present followed by
+                `feature_names`
+        """
+        data["flat_type"] = self._flat_type_table[
+            self._codes("flat_type", data["flat_type"])
+        ]
+        data["storey_range"] = self._codes("storey_range", data["storey_range"])
+        for col in ONEHOT_COLUMNS:
+            codes = self._codes(col, data.pop(col))
+            table = self._onehot_tables[col].astype(self.onehot_dtype)
+            onehot = pd.DataFrame(
+                table[codes],
+                index=data.index,
+                columns=[str(c) for c in self.vocabulary[col][1:]],
+                copy=False,
+            )
+            data = pd.concat([data, onehot], axis=1, copy=False)
+        return data
+
+    def transform(self, data):
+        """Encode raw resale rows into model features. Fills one float64
+        matrix with table lookups, so the cost per batch is a few lookups per
+        column rather than a few dataframe operations per column.
+
+        Args:
+            data (pd.DataFrame): rows with the raw `RAW_FEATURES` columns
+
+        Returns:
+            X: float64 dataframe of `feature_names`
+        """
+        X = np.empty((len(data), len(self.feature_names)))
+        # the label encoded and numeric features come first
+        X[:, 0] = self._flat_type_table[self._codes("flat_type", data["flat_type"])]
+        X[:, 1] = self._codes("storey_range", data["storey_range"])
+        X[:, 2] = data["floor_area_sqm"]
+        X[:, 3] = data["lease_commence_date"]
+        X[:, 4] = map_unique(
+            data["remaining_lease"], lambda s: s.map(_lease_years)
+        ).to_numpy()
+        start = 5
+        for col in ONEHOT_COLUMNS:
+            table = self._onehot_tables[col]
+            end = start + table.shape[1]
+            X[:, start:end] = table[self._codes(col, data[col])]
+            start = end
+        return pd.DataFrame(X, columns=self.feature_names, index=data.index)
+
+    def to_dict(self):
+        return {
+            "flat_type_map": self.flat_type_map,
+            "vocabulary": self.vocabulary,
+            "onehot_dtype": self.onehot_dtype,
+            "feature_names": self.feature_names,
+        }
+
+    @classmethod
+    def from_dict(cls, spec):
+        return cls(
+            spec["vocabulary"],
+            spec["flat_type_map"],
+            spec.get("onehot_dtype", "float64"),
+        )
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            return cls.from_dict(json.load(f))
+
+
+def find_transformer(datadir):
+    """Local path of the FeatureTransformer logged with the splits in
+    `datadir`, None if they were logged without one"""
+    try:
+        path = local_path(datadir, TRANSFORMER_FILENAME)
+    except Exception:
+        return None
+    return path if os.path.exists(path) else None
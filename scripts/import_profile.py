@@ -0,0 +1,115 @@
+"""
+Startup cost of each MLproject entry point.
+
+Runs every entry point script with `python -X importtime <script> --help`,
+which imports everything the script needs at startup and exits as soon as
+click has parsed the arguments. Logs the wall time and the import time of
+each entry point as metrics, and the slowest top-level imports as artifacts.
+"""
+
+import logging
+import os
+import re
+import subprocess
+import sys
+import time
+import click
+import yaml
+from run_logger import run_logger
+from utils import step_run
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def entry_point_scripts():
+    """Map MLproject entry point names to the script they run"""
+    with open(os.path.join(PROJECT_DIR, "MLproject"), "r") as f:
+        project = yaml.safe_load(f)
+    scripts = {}
+    for name, entry_point in project["entry_points"].items():
+        match = re.search(r"python\s+(\S+\.py)", entry_point["command"])
+        if match and os.path.isfile(os.path.join(PROJECT_DIR, match.group(1))):
+            scripts[name] = match.group(1)
+    return scripts
+
+
+def parse_importtime(stderr):
+    """Parse `-X importtime` output
+
+    Returns:
+        total_s: import time summed over top-level imports
+        top_level: (module, cumulative seconds) of each top-level import
+    """
+    top_level = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        # nested imports are indented by two spaces per level
+        if len(name) - len(name.lstrip()) == 1:
+            top_level.append((name.strip(), int(cumulative) / 1e6))
+    return sum(s for _, s in top_level), top_level
+
+
+def profile_entry_point(script):
+    """Startup cost of an entry point script
+
+    Args:
+        script (str): path of the script relative to the project directory
+
+    Returns:
+        profile: dict with `startup_s` (wall time to start the interpreter,
+            import and parse arguments), `import_s` and `top_imports`
+    """
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", script, "--help"],
+        cwd=PROJECT_DIR,
+        capture_output=True,
+        text=True,
+    )
+    startup_s = time.perf_counter() - start
+    import_s, top_level = parse_importtime(proc.stderr)
+    return {
+        "startup_s": startup_s,
+        "import_s": import_s,
+        "top_imports": sorted(top_level, key=lambda x: -x[1]),
+    }
+
+
+def log_import_profile(top=10):
+    """Profile every entry point and log the results to the active run
+
+    Returns:
+        report: entry point name -> profile
+    """
+    logger = logging.getLogger()
+    report = {}
+    for name, script in entry_point_scripts().items():
+        profile = profile_entry_point(script)
+        profile["top_imports"] = profile["top_imports"][:top]
+        report[name] = profile
+        logger.info(
+            "{}: startup {:.2f}s, imports {:.2f}s".format(
+                name, profile["startup_s"], profile["import_s"]
+            )
+        )
+        run_logger().log_metrics(
+            {
+                "startup_s_{}".format(name): profile["startup_s"],
+                "import_s_{}".format(name): profile["import_s"],
+            }
+        )
+    run_logger().log_dict(report, "import_profile/report.json")
+    return report
+
+
+@click.command(help="Profile the startup time of every MLproject entry point")
+@click.option("--top", type=int, default=10, help="Slowest imports to keep")
+def import_profile(top):
+    with step_run("import_profile"):
+        log_import_profile(top)
+
+
+if __name__ == "__main__":
+    import_profile()
@@ -5,167 +5,791 @@ ALS model, and uses the ALS model to train a Keras neural network.
 See README.rst for more details.
 """
 
+import ast
 import click
 import os
 import hashlib
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from functools import lru_cache
 
 import mlflow
 from mlflow.tracking import MlflowClient
 from mlflow.utils import mlflow_tags
-from mlflow.entities import RunStatus
 from mlflow.utils.logging_utils import eprint
 
 from mlflow.tracking.fluent import _get_experiment_id
+from run_cache import CACHE_KEY_TAG, cache_key, hash_file, lookup_run, record_run
+from run_logger import batched_logging, run_logger
+from schema_registry import DEFAULT_DATASET_NAME
+from utils import ENGINES, REGISTERED_MODEL_NAME, latest_version_run, step_run
 
+SCRIPTS_DIR = os.path.dirname(os.path.realpath(__file__))
 
-def _already_ran(entry_point_name, parameters, git_commit, experiment_id=None):
-    """Best-effort detection of if a run with the given entrypoint name,
-    parameters, and experiment id already ran. The run must have completed
-    successfully and have at least the parameters provided.
-    """
-    experiment_id = experiment_id if experiment_id is not None else _get_experiment_id()
-    curr_file_hash = hashlib.md5(
-        open("scripts/" + entry_point_name + ".py", "rb").read()
-    ).hexdigest()
-    client = MlflowClient()
-    all_runs = client.search_runs([experiment_id])  # default is sorted by runtime desc
-    for run in all_runs:
-        tags = run.data.tags
-        if tags.get(mlflow_tags.MLFLOW_PROJECT_ENTRY_POINT, None) != entry_point_name:
-            continue
-        match_failed = False
-        for param_key, param_value in parameters.items():
-            run_value = run.data.params.get(param_key)
-            if str(run_value) != str(param_value):
-                match_failed = True
-                break
-        if match_failed:
-            continue
+# pipeline steps in execution order, mapped to the upstream steps whose
+# outputs they consume. Entrypoint names are defined in MLproject. Steps
+# without parameters (eg. tune unless --tune-candidates) are left out.
+PIPELINE_STEPS = {
+    "data_validate": [],
+    "preprocess": [],
+    "tune": ["preprocess"],
+    "train": ["preprocess", "tune"],
+    "evaluate": ["preprocess", "train"],
+    "model_validate": ["preprocess", "train", "evaluate"],
+}
+# steps whose `validation_status` tag must be "pass" to keep the results
+# of the other steps and register the model
+VALIDATION_STEPS = ["data_validate", "model_validate"]
 
-        if run.info.to_proto().status != RunStatus.FINISHED:
-            eprint(
-                ("Run matched, but is not FINISHED, so skipping (run_id=%s, status=%s)")
-                % (run.info.run_id, run.info.status)
-            )
-            continue
 
-        previous_version = tags.get(mlflow_tags.MLFLOW_GIT_COMMIT, None)
-        if git_commit != previous_version:
-            eprint(
-                (
-                    "Run matched, but has a different source version, so skipping "
-                    "(found=%s, expected=%s)"
-                )
-                % (previous_version, git_commit)
-            )
-            continue
+def _local_imports(path):
+    with open(path, "rb") as f:
+        tree = ast.parse(f.read())
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module)
+    return sorted(
+        name
+        for name in names
+        if os.path.isfile(os.path.join(SCRIPTS_DIR, name + ".py"))
+    )
 
-        # checking git commit above does not work for locally changed files.
-        # so check hash of previous run's entrypoint file with with current entrypoint file hash
-        try:
-            previous_hash = mlflow.artifacts.load_text(
-                os.path.join(run.info.artifact_uri, "entrypoint_hash/hash.txt")
-            )
-        except Exception:
-            continue
-        if curr_file_hash != previous_hash:
+
+@lru_cache(maxsize=None)
+def _code_hash(entry_point_name):
+    """Hash of an entrypoint file and the local modules it (transitively) imports"""
+    h = hashlib.md5()
+    seen, pending = set(), [entry_point_name]
+    while pending:
+        module = pending.pop()
+        if module in seen:
             continue
+        seen.add(module)
+        path = os.path.join(SCRIPTS_DIR, module + ".py")
+        with open(path, "rb") as f:
+            h.update(module.encode("utf-8"))
+            h.update(f.read())
+        pending.extend(_local_imports(path))
+    return h.hexdigest()
 
-        return client.get_run(run.info.run_id)
 
-    eprint("No matching run has been found.")
-    return None
+@lru_cache(maxsize=None)
+def _data_hash(filepath):
+    return hash_file(filepath)
 
 
-# TODO(aaron): This is not great because it doesn't account for:
-# - changes in code (can save .py files as artifacts and compare hashes against current one)
-# - changes in dependant steps
-def _get_or_run(entrypoint, parameters, git_commit, use_cache=True):
-    # get hash of current run entrypoint file
-    existing_run = _already_ran(entrypoint, parameters, git_commit)
+def _step_fingerprint(entry_point_name, parameters, upstream):
+    """Input fingerprint of a step: its code, the parameters that do not derive
+    from upstream runs, the content of its input data file and the fingerprints
+    of the upstream steps it consumes.
+    """
+    data_hashes = {}
+    if "filepath" in parameters:
+        data_hashes["filepath"] = _data_hash(parameters["filepath"])
+    return cache_key(
+        entry_point_name,
+        parameters,
+        _code_hash(entry_point_name),
+        data_hashes,
+        upstream,
+    )
+
+
+def _pipeline_steps(step_parameters):
+    # the steps of PIPELINE_STEPS that run with these parameters
+    return {
+        step: [u for u in upstream if u in step_parameters]
+        for step, upstream in PIPELINE_STEPS.items()
+        if step in step_parameters
+    }
+
+
+def _pipeline_fingerprints(step_parameters):
+    fingerprints = {}
+    for step, upstream_steps in _pipeline_steps(step_parameters).items():
+        fingerprints[step] = _step_fingerprint(
+            step,
+            step_parameters[step],
+            {name: fingerprints[name] for name in upstream_steps},
+        )
+    return fingerprints
+
+
+def _already_ran(entry_point_name, fingerprint, experiment_id=None):
+    """Best-effort detection of if a run with the given entrypoint name and
+    input fingerprint already ran in the experiment. The run must have
+    completed successfully.
+    """
+    experiment_id = experiment_id if experiment_id is not None else _get_experiment_id()
+    run = lookup_run(experiment_id, fingerprint)
+    if run is None or (
+        run.data.tags.get(mlflow_tags.MLFLOW_PROJECT_ENTRY_POINT) != entry_point_name
+    ):
+        eprint("No matching run has been found.")
+        return None
+    return run
+
+
+def _get_or_run(entrypoint, parameters, fingerprint, experiment_id, use_cache=True):
+    """Launch a step with `mlflow run` in its own process unless a run with
+    the same fingerprint exists. The new run is recorded under its fingerprint
+    by the scheduler once it has kept the result.
+
+    Returns:
+        run_id, output: id of the step's run, and None as the step's outputs
+            are only available as artifacts
+    """
+    existing_run = _already_ran(entrypoint, fingerprint, experiment_id)
     if use_cache and existing_run:
         print(
             "Found existing run for entrypoint={} and parameters={}".format(
                 entrypoint, parameters
             )
         )
-        mlflow.set_tag(entrypoint, existing_run.info.run_id)
-        return existing_run
+        return existing_run.info.run_id, None
     print(
         "Launching new run for entrypoint={} and parameters={}".format(
             entrypoint, parameters
         )
     )
     submitted_run = mlflow.run(
-        ".", entrypoint, parameters=parameters, env_manager="local"
+        ".",
+        entrypoint,
+        parameters=parameters,
+        env_manager="local",
+        experiment_id=experiment_id,
     )
     print("\n" * 3)
+    return submitted_run.run_id, None
+
 
-    mlflow.set_tag(entrypoint, submitted_run.run_id)
+class _StepInputs:
+    """Inputs of in-process steps. Outputs of upstream steps that ran in this
+    pipeline are kept in memory, outputs of cached steps are loaded from their
+    run's artifacts when first needed.
+    """
 
-    return MlflowClient().get_run(submitted_run.run_id)
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.datadir_uri = None
+        self.modeldir_uri = None
+        self.loaded = {}
 
+    def raw_data(self):
+        import pandas as pd
 
-@click.command()
-@click.option("--eval-mae-threshold", default=150000, type=int)
-@click.option("--keras-hidden-units", default=20, type=int)
-@click.option("--max-row-limit", default=100000, type=int)
-def pipeline(eval_mae_threshold, keras_hidden_units, max_row_limit):
-    # Note: The entrypoint names are defined in MLproject. The artifact directories
-    # are documented by each step's .py file.
-    with mlflow.start_run() as active_run:
-        git_commit = active_run.data.tags.get(mlflow_tags.MLFLOW_GIT_COMMIT)
-
-        # data validation run
-        data_validate_run = _get_or_run(
-            "data_validate",
-            {"filepath": "data/resale-flat-prices-2022-jan.csv"},
-            git_commit,
+        if "raw" not in self.loaded:
+            self.loaded["raw"] = pd.read_csv(self.filepath)
+        return self.loaded["raw"]
+
+    def split(self, name):
+        from utils import load_split
+
+        if name not in self.loaded:
+            self.loaded[name] = load_split(self.datadir_uri, name)
+        return self.loaded[name]
+
+    def model(self):
+        if "model" not in self.loaded:
+            from tree_ensemble import load_model
+
+            self.loaded["model"] = load_model(self.modeldir_uri)
+        return self.loaded["model"]
+
+    def estimator(self):
+        """The sklearn regressor, even if `model` is its flat ensemble"""
+        if "estimator" not in self.loaded:
+            from utils import local_artifact
+
+            self.loaded["estimator"] = mlflow.sklearn.load_model(
+                local_artifact(self.modeldir_uri)
+            )
+        return self.loaded["estimator"]
+
+
+def _data_validate_step(inputs, parameters):
+    from data_validate import profile_csv, validate_data, validate_profile
+
+    if parameters["chunksize"] > 0:
+        validate_profile(
+            profile_csv(
+                parameters["filepath"], parameters["chunksize"], parameters["workers"]
+            ),
+            parameters["dataset_name"],
+            drift_warn=parameters["drift_warn"],
+            drift_fail=parameters["drift_fail"],
         )
-        if data_validate_run.data.tags.get("validation_status") != "pass":
-            return
+        return
+    validate_data(
+        inputs.raw_data(),
+        parameters["dataset_name"],
+        drift_warn=parameters["drift_warn"],
+        drift_fail=parameters["drift_fail"],
+    )
+
+
+def _preprocess_step(inputs, parameters):
+    from preprocess import base_vocabulary, preprocess_data, preprocess_data_chunked
+
+    vocabulary = base_vocabulary(parameters.get("base_run", ""))
+    if parameters["chunksize"] > 0:
+        # the splits are not kept in memory, later steps load them
+        return preprocess_data_chunked(
+            parameters["filepath"],
+            parameters["chunksize"],
+            parameters["train_ratio"],
+            parameters["val_ratio"],
+            parameters["test_ratio"],
+            parameters["data_format"],
+            parameters["compression"],
+            parameters["onehot_dtype"],
+            vocabulary,
+        )
+    return preprocess_data(
+        inputs.raw_data(),
+        parameters["train_ratio"],
+        parameters["val_ratio"],
+        parameters["test_ratio"],
+        parameters["data_format"],
+        parameters["compression"],
+        parameters["onehot_dtype"],
+        vocabulary,
+    )
+
+
+def _tune_step(inputs, parameters):
+    import tempfile
+    from tune import memmap_features, tune_model
+
+    options = {k: v for k, v in parameters.items() if k != "datadir"}
+    with tempfile.TemporaryDirectory() as workdir:
+        X, y = memmap_features(inputs.split("train"), workdir)
+        return tune_model(X, y, **options)
+
+
+def _train_step(inputs, parameters):
+    from feature_transformer import find_transformer
+    from train import load_base_model, train_model, tuned_hyperparameters
+
+    hyperparameters = {
+        k: v
+        for k, v in parameters.items()
+        if k not in ("datadir", "tune_run", "base_run")
+    }
+    if "tune_run" in parameters:
+        hyperparameters = tuned_hyperparameters(hyperparameters, parameters["tune_run"])
+    if "base_run" in parameters:
+        hyperparameters["base_model"] = load_base_model(parameters["base_run"])
+    return train_model(
+        inputs.split("train"),
+        inputs.split("validation"),
+        transformer_path=find_transformer(inputs.datadir_uri),
+        **hyperparameters,
+    )
+
+
+def _evaluate_step(inputs, parameters):
+    from evaluate import evaluate_model
+    from feature_transformer import FeatureTransformer, find_transformer
 
-        # preprocess run
-        preprocess_run = _get_or_run(
-            "preprocess",
-            {"filepath": "data/resale-flat-prices-2022-jan.csv"},
-            git_commit,
+    transformer_path = find_transformer(inputs.datadir_uri)
+    if transformer_path is not None:
+        transformer = FeatureTransformer.load(transformer_path)
+    else:
+        transformer = None
+    evaluate_model(
+        inputs.split("test"),
+        inputs.model(),
+        parameters["feature_matrix"],
+        transformer,
+        parameters["bootstrap"],
+        parameters["workers"],
+    )
+
+
+def _model_validate_step(inputs, parameters):
+    from model_validate import check_threshold, explain_model
+
+    if check_threshold(parameters["test_score"], parameters["eval_threshold"]):
+        explain_model(
+            inputs.split("test"),
+            inputs.estimator(),
+            parameters["background_rows"],
+            parameters["max_rows"],
+            parameters["workers"],
+            parameters["time_budget"],
         )
-        datadir_uri = os.path.join(
-            preprocess_run.info.artifact_uri, "trainvaltest_data"
+
+
+IN_PROCESS_STEPS = {
+    "data_validate": _data_validate_step,
+    "preprocess": _preprocess_step,
+    "tune": _tune_step,
+    "train": _train_step,
+    "evaluate": _evaluate_step,
+    "model_validate": _model_validate_step,
+}
+
+
+def _get_or_run_in_process(
+    entrypoint,
+    parameters,
+    fingerprint,
+    experiment_id,
+    parent_run_id,
+    inputs,
+    use_cache=True,
+):
+    """In-process counterpart of `_get_or_run`. Calls the step's function in a
+    run nested under the pipeline run instead of launching `mlflow run`.
+
+    Returns:
+        run_id, output: id of the step's run and the step function's return
+            value, None if an existing run was found
+    """
+    existing_run = _already_ran(entrypoint, fingerprint, experiment_id)
+    if use_cache and existing_run:
+        print(
+            "Found existing run for entrypoint={} and parameters={}".format(
+                entrypoint, parameters
+            )
         )
+        return existing_run.info.run_id, None
+    print(
+        "Running entrypoint={} in-process with parameters={}".format(
+            entrypoint, parameters
+        )
+    )
+    logger_name = "model_validate" if entrypoint == "model_validate" else None
+    with step_run(entrypoint, logger_name, parent_run_id) as step:
+        run_logger().log_params(parameters)
+        output = IN_PROCESS_STEPS[entrypoint](inputs, parameters)
+    return step.info.run_id, output
+
 
-        # train run
-        train_run = _get_or_run("train", {"datadir": datadir_uri}, git_commit)
-        # modeldir_uri = os.path.join(train_run.info.artifact_uri, "model")
-        modeldir_uri = "runs:/{}/model".format(train_run.info.run_id)
+class _SerialExecutor:
+    """Executor that runs each task in this process as it is submitted"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
 
-        # evaluate run
-        evaluate_run = _get_or_run(
-            "evaluate", {"datadir": datadir_uri, "modeldir": modeldir_uri}, git_commit
+
+def _init_worker():
+    # `mlflow run` exports the pipeline's run id, which would make every
+    # `mlflow.start_run` in the worker resume the pipeline run
+    os.environ.pop("MLFLOW_RUN_ID", None)
+
+
+def _step_executor(executor, max_workers):
+    # in-process steps share the loaded inputs, which a worker process would
+    # reload or unpickle, and mlflow's stack of active runs, which is global
+    # to the process, so they run one after another
+    if executor == "in-process" or max_workers <= 1:
+        return _SerialExecutor()
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+    )
+
+
+def _launch_parameters(step, step_parameters, runs):
+    # add the parameters that derive from upstream runs
+    parameters = {}
+    if "preprocess" in PIPELINE_STEPS[step]:
+        parameters["datadir"] = os.path.join(
+            runs["preprocess"].info.artifact_uri, "trainvaltest_data"
         )
+    if "tune" in PIPELINE_STEPS[step] and "tune" in runs:
+        parameters["tune_run"] = runs["tune"].info.run_id
+    if "train" in PIPELINE_STEPS[step]:
+        parameters["modeldir"] = "runs:/{}/model".format(runs["train"].info.run_id)
+    if "evaluate" in PIPELINE_STEPS[step]:
+        test_mae = runs["evaluate"].data.metrics.get("test_mae", float("inf"))
+        parameters["test_score"] = round(test_mae, 2)
+    parameters.update(step_parameters[step])
+    return parameters
+
 
-        # model validation run
-        test_mae = round(evaluate_run.data.metrics.get("test_mae", float("inf")), 2)
-        model_validation_run = _get_or_run(
-            "model_validate",
+def _critical_path(timeline):
+    # longest chain of dependent steps by wall time
+    finish = {}
+    for step in timeline:
+        upstream = [u for u in PIPELINE_STEPS[step] if u in finish]
+        prev = max(upstream, key=lambda u: finish[u][0], default=None)
+        prev_time, prev_path = finish[prev] if prev else (0.0, [])
+        finish[step] = (prev_time + timeline[step]["duration_s"], prev_path + [step])
+    return max(finish.values(), default=(0.0, []))
+
+
+def _log_timeline(timeline, pipeline_start):
+    for step, times in timeline.items():
+        times["start_offset_s"] = times["start"] - pipeline_start
+        times["duration_s"] = times["end"] - times["start"]
+        run_logger().log_metrics(
             {
-                "datadir": datadir_uri,
-                "modeldir": modeldir_uri,
-                "test_score": test_mae,
-                "eval_threshold": eval_mae_threshold,
-            },
-            git_commit,
+                "{}_start_s".format(step): times["start_offset_s"],
+                "{}_end_s".format(step): times["end"] - pipeline_start,
+            }
         )
+    critical_time, critical_steps = _critical_path(timeline)
+    run_logger().log_metric("critical_path_s", critical_time)
+    run_logger().set_tag("critical_path", " > ".join(critical_steps))
+    run_logger().log_dict(timeline, "pipeline_timeline.json")
+
+
+def _run_pipeline(step_parameters, fingerprints, executor, max_workers):
+    """Run each step as soon as the upstream steps it consumes have finished,
+    running ready steps concurrently with the subprocess executor. A validation
+    step fails when it raises or does not tag its run `validation_status=pass`.
+    Steps downstream of a failed validation step are not launched, queued steps
+    are cancelled and the results of steps still running are discarded: they
+    are not recorded in the run cache.
+
+    Returns:
+        model_uri: uri of the validated pyfunc model that takes raw resale
+            rows, None if validation failed
+    """
+    experiment_id = _get_experiment_id()
+    parent_run_id = mlflow.active_run().info.run_id
+    client = MlflowClient()
+    inputs = _StepInputs(step_parameters["preprocess"]["filepath"])
+
+    pending = _pipeline_steps(step_parameters)
+    running, runs, timeline = {}, {}, {}
+    failed_validation = []
 
-        # register model based on condition (checked in validation run)
-        if model_validation_run.data.tags.get("validation_status") != "pass":
+    def fail_validation(step):
+        print("Step {} did not pass validation".format(step))
+        failed_validation.append(step)
+        for future in list(running):
+            if future.cancel():
+                del running[future]
+
+    def finish(future):
+        step = running.pop(future)
+        try:
+            run_id, output = future.result()
+        except Exception:
+            if failed_validation:
+                return
+            if step not in VALIDATION_STEPS:
+                raise
+            timeline[step]["end"] = time.time()
+            fail_validation(step)
             return
-        # register
-        model_version = mlflow.register_model(
-            modeldir_uri,
-            "random_forest_regressor_HDB_Resale_Price",
+        timeline[step]["end"] = time.time()
+        timeline[step]["run_id"] = run_id
+        if failed_validation:
+            return
+        run = client.get_run(run_id)
+        if run.data.tags.get(CACHE_KEY_TAG) != fingerprints[step]:
+            record_run(experiment_id, fingerprints[step], run_id, client=client)
+        runs[step] = run
+        run_logger().set_tag(step, run_id)
+        if step == "preprocess":
+            inputs.datadir_uri = os.path.join(
+                run.info.artifact_uri, "trainvaltest_data"
+            )
+            if output is not None:
+                train, validation, test = output
+                inputs.loaded.update(train=train, validation=validation, test=test)
+        elif step == "train":
+            inputs.modeldir_uri = "runs:/{}/model".format(run_id)
+            if output is not None:
+                inputs.loaded.update(model=output, estimator=output)
+        if (
+            step in VALIDATION_STEPS
+            and run.data.tags.get("validation_status") != "pass"
+        ):
+            fail_validation(step)
+
+    pipeline_start = time.time()
+    try:
+        with _step_executor(executor, max_workers) as pool:
+            while pending or running:
+                ready = [
+                    step
+                    for step, upstream in pending.items()
+                    if all(u in runs for u in upstream)
+                ]
+                for step in ready:
+                    if failed_validation:
+                        break
+                    parameters = _launch_parameters(step, step_parameters, runs)
+                    timeline[step] = {"start": time.time()}
+                    if executor == "in-process":
+                        future = pool.submit(
+                            _get_or_run_in_process,
+                            step,
+                            parameters,
+                            fingerprints[step],
+                            experiment_id,
+                            parent_run_id,
+                            inputs,
+                        )
+                    else:
+                        future = pool.submit(
+                            _get_or_run,
+                            step,
+                            parameters,
+                            fingerprints[step],
+                            experiment_id,
+                        )
+                    running[future] = step
+                    del pending[step]
+                    # serial executor: finish before launching the next step
+                    if future.done():
+                        finish(future)
+                if failed_validation:
+                    pending.clear()
+                if running:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finish(future)
+    finally:
+        _log_timeline(
+            {step: t for step, t in timeline.items() if "end" in t}, pipeline_start
         )
+
+    if failed_validation:
+        return None
+    return "runs:/{}/pyfunc_model".format(runs["train"].info.run_id)
+
+
+def _print_dry_run(fingerprints):
+    for step, fingerprint in fingerprints.items():
+        existing_run = _already_ran(step, fingerprint)
+        if existing_run:
+            print("{:<16} cached   (run_id={})".format(step, existing_run.info.run_id))
+        else:
+            print("{:<16} rerun    (fingerprint={})".format(step, fingerprint[:12]))
+
+
+@click.command()
+@click.option("--eval-mae-threshold", default=150000, type=int)
+@click.option("--keras-hidden-units", default=20, type=int)
+@click.option("--max-row-limit", default=100000, type=int)
+@click.option("--filepath", default="data/resale-flat-prices-2022-jan.csv", type=str)
+@click.option(
+    "--dataset-name",
+    default=DEFAULT_DATASET_NAME,
+    type=str,
+    help="Name the accepted data schemas are registered under",
+)
+@click.option(
+    "--drift-warn",
+    default=0.1,
+    type=float,
+    help="PSI of a column from the accepted schema above which drift is warned about",
+)
+@click.option(
+    "--drift-fail",
+    default=0.25,
+    type=float,
+    help="PSI of a column from the accepted schema above which data validation fails",
+)
+@click.option(
+    "--data-format",
+    type=click.Choice(["csv", "parquet", "feather", "npy"]),
+    default="parquet",
+    help="File format of the train/validation/test splits",
+)
+@click.option(
+    "--chunksize",
+    default=0,
+    type=click.IntRange(0),
+    help="Rows per chunk to validate and preprocess out of core, 0 to load the whole csv",
+)
+@click.option(
+    "--validate-workers",
+    default=1,
+    type=click.IntRange(1),
+    help="Number of processes profiling chunks when validating out of core",
+)
+@click.option(
+    "--onehot-dtype",
+    type=click.Choice(["float64", "uint8"]),
+    default="float64",
+    help="dtype of the one-hot encoded features in the splits",
+)
+@click.option(
+    "--feature-matrix",
+    type=click.Choice(["dense", "csr"]),
+    default="dense",
+    help="Train and evaluate on dataframes or on sparse CSR matrices",
+)
+@click.option(
+    "--engine",
+    type=click.Choice(ENGINES),
+    default="rf_mae",
+    help="Regressor train fits, see train.make_estimator",
+)
+@click.option(
+    "--tune-candidates",
+    default=0,
+    type=click.IntRange(0),
+    help="Search this many hyperparameter configurations for train with the "
+    "tune step, 0 to train with the default configuration",
+)
+@click.option(
+    "--warm-start",
+    default=False,
+    type=bool,
+    help="Continue training the latest registered model on --filepath, eg. the "
+    "data of a new month, instead of fitting a new one",
+)
+@click.option(
+    "--max-estimators",
+    default=0,
+    type=click.IntRange(0),
+    help="Most recent trees a warm-started forest keeps, 0 to keep all. "
+    "Must be 0 for gradient boosting",
+)
+@click.option(
+    "--executor",
+    type=click.Choice(["subprocess", "in-process"]),
+    default="subprocess",
+    help="Launch each step with `mlflow run` or call it in this process",
+)
+@click.option(
+    "--max-workers",
+    default=2,
+    type=click.IntRange(1),
+    help="Number of steps run concurrently, 1 runs steps one after another. "
+    "In-process steps always run one after another",
+)
+@click.option(
+    "--profile-startup",
+    is_flag=True,
+    help="Log the import-time startup cost of every entry point as metrics",
+)
+@click.option(
+    "--dry-run",
+    is_flag=True,
+    help="Print which steps would rerun without launching any runs",
+)
+def pipeline(
+    eval_mae_threshold,
+    keras_hidden_units,
+    max_row_limit,
+    filepath,
+    dataset_name,
+    drift_warn,
+    drift_fail,
+    data_format,
+    chunksize,
+    validate_workers,
+    onehot_dtype,
+    feature_matrix,
+    engine,
+    tune_candidates,
+    warm_start,
+    max_estimators,
+    executor,
+    max_workers,
+    profile_startup,
+    dry_run,
+):
+    # Note: The artifact directories are documented by each step's .py file.
+    # Parameters that derive from upstream runs (datadir, modeldir, test_score)
+    # are covered by the upstream fingerprints and added when launching.
+    step_parameters = {
+        "data_validate": {
+            "filepath": filepath,
+            "chunksize": chunksize,
+            "workers": validate_workers,
+            "dataset_name": dataset_name,
+            "drift_warn": drift_warn,
+            "drift_fail": drift_fail,
+        },
+        "preprocess": {
+            "filepath": filepath,
+            "train_ratio": 0.7,
+            "val_ratio": 0.2,
+            "test_ratio": 0.1,
+            "data_format": data_format,
+            "compression": "zstd",
+            "chunksize": chunksize,
+            "onehot_dtype": onehot_dtype,
+        },
+        "train": {
+            "n_estimators": 10,
+            "max_features": "sqrt",
+            "max_depth": 1,
+            "min_samples_split": 2,
+            "min_samples_leaf": 1,
+            "feature_matrix": feature_matrix,
+            "engine": engine,
+        },
+        "evaluate": {"feature_matrix": feature_matrix, "bootstrap": 200, "workers": -1},
+        "model_validate": {
+            "eval_threshold": eval_mae_threshold,
+            "background_rows": 100,
+            "max_rows": 2000,
+            "workers": -1,
+            "time_budget": 0,
+        },
+    }
+    if tune_candidates:
+        step_parameters["tune"] = {
+            "n_candidates": tune_candidates,
+            "cv": 3,
+            "factor": 3,
+            "workers": -1,
+            "engine": engine,
+            "random_state": 2023,
+        }
+    base_run = latest_version_run(REGISTERED_MODEL_NAME) if warm_start else None
+    if base_run is not None:
+        # the continued model keeps the engine of the registered one
+        base_engine = MlflowClient().get_run(base_run).data.params.get("engine")
+        if base_engine == "hgb" and max_estimators:
+            raise click.BadParameter(
+                "the registered model is gradient boosting, whose iterations "
+                "cannot be retired; use 0",
+                param_hint="--max-estimators",
+            )
+        # encode with the categories the registered model was trained on
+        step_parameters["preprocess"]["base_run"] = base_run
+        step_parameters["train"].update(
+            {"base_run": base_run, "max_estimators": max_estimators}
+        )
+        if base_engine is not None:
+            step_parameters["train"]["engine"] = base_engine
+    elif warm_start:
+        print("No registered model to warm start, training a new one")
+    fingerprints = _pipeline_fingerprints(step_parameters)
+    if dry_run:
+        _print_dry_run(fingerprints)
+        return
+
+    with mlflow.start_run() as mlrun, batched_logging(mlrun.info.run_id):
+        if profile_startup:
+            from import_profile import log_import_profile
+
+            log_import_profile()
+        model_uri = _run_pipeline(step_parameters, fingerprints, executor, max_workers)
+        if model_uri is None:
+            return
+
+        # register
+        model_version = mlflow.register_model(model_uri, REGISTERED_MODEL_NAME)
         # print("Name: {}, Version: {}".format(model_version.name, model_version.version))
 
 
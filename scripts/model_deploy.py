@@ -1,19 +1,55 @@
-import os
+import json
+import urllib.error
+import urllib.request
+
 import click
-import yaml
 from mlflow.tracking import MlflowClient
 
+from serve import DEFAULT_PORT, serve_model
+
+
+def _reload_server(port):
+    # answer of the server on `port` to POST /reload, None if none is running
+    request = urllib.request.Request(
+        "http://127.0.0.1:{}/reload".format(port), data=b"", method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            return json.load(response)
+    except urllib.error.HTTPError as e:
+        raise click.ClickException(
+            "The server on port {} failed to reload: {}".format(port, e.read())
+        )
+    except urllib.error.URLError:
+        return None
+
 
 @click.command(help="Deploy a model to staging or production or archive it")
 @click.option("--modelname", type=str)
 @click.option("--version", type=int)
 @click.option("--stage", type=str)
 @click.option("--archive_existing", type=bool, default=False)
+@click.option("--port", type=int, default=DEFAULT_PORT)
+@click.option(
+    "--workers",
+    type=int,
+    default=-1,
+    help="Processes scoring the served model, -1 for one per core",
+)
+@click.option(
+    "--cache-size",
+    type=click.IntRange(0),
+    default=0,
+    help="Encoded rows whose predictions the server caches, 0 for no cache",
+)
 def model_transition(
     modelname: str,
     version: int,
     stage: str,
     archive_existing: bool = False,
+    port: int = DEFAULT_PORT,
+    workers: int = -1,
+    cache_size: int = 0,
 ):
     client = MlflowClient()
     client.transition_model_version_stage(
@@ -23,13 +59,19 @@ def model_transition(
         archive_existing_versions=archive_existing,
     )
 
-    if stage in ["Staging", "Production"]:
-        model_yaml = "mlruns/models/{}/version-{}/meta.yaml".format(modelname, version)
-        with open(model_yaml, "r") as f:
-            meta = yaml.safe_load(f)
-        model_uri = meta.get("source")
-        os.system(
-            "mlflow models serve -m models:/{}/{} -p 1234".format(modelname, stage)
+    # a server already running on the port serves the version its stage
+    # resolves to now, and drops the predictions it cached
+    answer = _reload_server(port)
+    if answer is not None:
+        print("Server on port {} reloaded: {}".format(port, answer))
+    elif stage in ["Staging", "Production"]:
+        # micro-batching server of the latest version in the stage
+        serve_model(
+            modelname,
+            stage=stage,
+            port=port,
+            workers=workers,
+            cache_size=cache_size,
         )
 
 
@@ -1,97 +1,246 @@
 import logging
-import hashlib
-from urllib.parse import unquote, urlparse
 import os
-import sys
+import time
 import mlflow
 import click
-import pandas as pd
-import shap
-import tempfile
-import matplotlib.pyplot as plt
+import numpy as np
+from concurrent.futures import TimeoutError
+from run_logger import run_logger
+from tree_ensemble import FlatTreeEnsemble
+from utils import load_split, local_artifact, process_pool, step_run
 
+# rows explained per task
+SHAP_CHUNK_ROWS = 256
 
-@click.command(help="Validate the trained model")
-@click.option("--datadir", type=str)
-@click.option("--modeldir", type=str)
-@click.option("--test-score", type=float)
-@click.option("--eval-threshold", type=float)
-def model_validate(datadir, modeldir, test_score, eval_threshold):
-    with mlflow.start_run() as mlrun:
-        artifact_uri = mlrun.info.artifact_uri
+# explainer of the worker processes, built once per process
+_explainer = None
 
-        # logging
-        logger = logging.getLogger("model_validate")
-        logger.setLevel(logging.DEBUG)
-        logging.captureWarnings(True)
-        formatter = logging.Formatter(
-            "%(asctime)s - %(levelname)s - %(message)s", "%Y-%m-%d %H:%M:%S"
+
+def check_threshold(test_score, eval_threshold):
+    """Tag the active run with whether the test score satisfies the threshold
+
+    Returns:
+        passed: True if the model passed the threshold
+    """
+    logger = logging.getLogger("model_validate")
+
+    # check if test score satisfy threshold, if no, end model validation
+    if test_score > eval_threshold:
+        logger.info(
+            "Model did not pass threshold. Model performance score {} is larger than {}".format(
+                test_score, eval_threshold
+            )
         )
+        run_logger().set_tags({"validation_status": "fail"})
+        return False
+
+    logger.info("Model has passed threshold")
+    run_logger().set_tags({"validation_status": "pass"})
+    return True
+
+
+def _tree_model(model):
+    # shap.TreeExplainer model of a tree ensemble, None for other models
+    if not isinstance(model, FlatTreeEnsemble):
+        try:
+            model = FlatTreeEnsemble.from_estimator(model)
+        except ValueError:
+            return None
+    return model.shap_model()
 
-        file_handler = logging.FileHandler(
-            unquote(urlparse(os.path.join(artifact_uri, "log.log")).path)
+
+def _init_explainer(model, background):
+    global _explainer
+    import shap
+
+    tree_model = _tree_model(model)
+    if tree_model is not None:
+        # exact SHAP values of the trees, interventional on the background
+        _explainer = shap.TreeExplainer(tree_model, background)
+    else:
+        _explainer = shap.Explainer(model.predict, background)
+
+
+def _explain_chunk(X):
+    explanation = _explainer(X)
+    return explanation.values, explanation.base_values
+
+
+def shap_explanation(model, X, background, workers=1, time_budget=0):
+    """SHAP values of a model on the rows of X, in chunks of SHAP_CHUNK_ROWS
+
+    Tree ensembles are explained with TreeExplainer, other models with the
+    model-agnostic explainer of shap.
+
+    Args:
+        model: fitted regressor or FlatTreeEnsemble
+        X (pd.DataFrame): rows to explain
+        background (pd.DataFrame): rows the features are masked with
+        workers (int): processes explaining the chunks, -1 for all cores
+        time_budget (float): seconds after which no more chunks are explained,
+            0 for no limit. The first chunk is always explained.
+
+    Returns:
+        explanation: shap.Explanation of the first rows of X explained within
+            the budget
+    """
+    import shap
+
+    chunks = [
+        X.iloc[start : start + SHAP_CHUNK_ROWS]
+        for start in range(0, len(X), SHAP_CHUNK_ROWS)
+    ]
+    deadline = time.monotonic() + time_budget if time_budget else None
+    if workers < 0:
+        workers = os.cpu_count()
+    workers = min(workers, len(chunks))
+    results = []
+    if workers <= 1:
+        _init_explainer(model, background)
+        for chunk in chunks:
+            if results and deadline is not None and time.monotonic() > deadline:
+                break
+            results.append(_explain_chunk(chunk))
+    else:
+        executor = process_pool(
+            workers, initializer=_init_explainer, initargs=(model, background)
         )
-        file_handler.setLevel(logging.DEBUG)
-        file_handler.setFormatter(formatter)
-
-        stdout_handler = logging.StreamHandler(sys.stdout)
-        stdout_handler.setLevel(logging.DEBUG)
-        stdout_handler.setFormatter(formatter)
-
-        logger.addHandler(file_handler)
-        logger.addHandler(stdout_handler)
-
-        # hash current file and log it as artifact
-        curr_file_hash = hashlib.md5(
-            open("scripts/model_validate.py", "rb").read()
-        ).hexdigest()
-        mlflow.log_text(curr_file_hash, "entrypoint_hash/hash.txt")
-
-        # check if test score satisfy threshold, if no, end model validation
-        if test_score > eval_threshold:
-            logger.info(
-                "Model did not pass threshold. Model performance score {} is larger than {}".format(
-                    test_score, eval_threshold
-                )
-            )
-            mlflow.set_tags({"validation_status": "fail"})
-            return
+        try:
+            futures = [executor.submit(_explain_chunk, chunk) for chunk in chunks]
+            for future in futures:
+                timeout = None
+                if results and deadline is not None:
+                    timeout = max(0, deadline - time.monotonic())
+                try:
+                    results.append(future.result(timeout=timeout))
+                except TimeoutError:
+                    break
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
 
-        logger.info("Model has passed threshold")
-        mlflow.set_tags({"validation_status": "pass"})
+    num_rows = sum(len(values) for values, _ in results)
+    return shap.Explanation(
+        np.concatenate([values for values, _ in results]),
+        np.concatenate([base_values for _, base_values in results]),
+        data=X.iloc[:num_rows].to_numpy(),
+        feature_names=list(X.columns),
+    )
 
-        # load test data
-        test_path = os.path.join(datadir, "test.csv")
-        logger.info("Reading test data from {}".format(test_path))
-        test = pd.read_csv(test_path)
-        y_test = test[["resale_price"]]
-        X_test = test.drop(["resale_price"], axis=1)
 
-        # load model
-        logger.info("Loading model from {}".format(modeldir))
-        model = mlflow.sklearn.load_model(modeldir)
+def explain_model(
+    test, model, background_rows=100, max_rows=2000, workers=1, time_budget=0
+):
+    """Log SHAP plots and explainer for a model. Must be called inside an active run.
+
+    The plots are drawn from the SHAP values of `max_rows` sampled test rows,
+    computed with TreeExplainer for tree ensembles. The logged explainer is
+    the model-agnostic explainer of the regressor on the whole test split.
+
+    Args:
+        test (pd.DataFrame): test split with `resale_price` column
+        model: fitted sklearn regressor
+        background_rows (int): test rows sampled as the background of the
+            SHAP values of the plots
+        max_rows (int): test rows sampled to explain
+        workers (int): processes computing the SHAP values, -1 for all cores
+        time_budget (float): seconds after which the remaining rows are not
+            explained, 0 for no limit
+    """
+    # shap and matplotlib take seconds to import, only pay for them when
+    # the model has passed the threshold
+    import shap
+    import matplotlib.pyplot as plt
+
+    logger = logging.getLogger("model_validate")
 
-        # model bias check
+    y_test = test[["resale_price"]]
+    X_test = test.drop(["resale_price"], axis=1)
 
-        # model explanability check
-        # shap not working with numpy > 1.24
-        # check whether to use log_explainer, log_explanation, or save_explainer
-        logger.debug("Performing SHAP computations for model explanability")
-        explainer = shap.Explainer(model.predict, X_test)
-        shap_values = explainer(X_test)
-        # log the shap plots
+    # model bias check
+
+    # model explanability check
+    # shap not working with numpy > 1.24
+    # check whether to use log_explainer, log_explanation, or save_explainer
+    logger.debug("Performing SHAP computations for model explanability")
+    background = X_test.sample(min(background_rows, len(X_test)), random_state=2023)
+    explained = X_test.sample(min(max_rows, len(X_test)), random_state=2023)
+    start = time.perf_counter()
+    shap_values = shap_explanation(model, explained, background, workers, time_budget)
+    run_logger().log_metrics(
+        {"shap_rows": len(shap_values), "shap_s": time.perf_counter() - start}
+    )
+    logger.info("Explained {} test rows".format(len(shap_values)))
+    # TreeExplainer cannot be logged by mlflow.shap, log the model-agnostic
+    # explainer, which is cheap to build
+    explainer = shap.Explainer(model.predict, X_test)
+    # log the shap plots
+    with run_logger().staging_dir("model_explanations_shap") as tmpdir:
         shap.plots.beeswarm(shap_values, show=False)
         fig = plt.gcf()
         fig.tight_layout()
-        tmpdir = tempfile.mkdtemp()
         fig.savefig(os.path.join(tmpdir, "beeswarm_plot.png"))
         plt.clf()
         shap.plots.bar(shap_values, show=False)
         fig = plt.gcf()
         fig.tight_layout()
         fig.savefig(os.path.join(tmpdir, "summary_bar_plot.png"))
-        mlflow.log_artifacts(tmpdir, artifact_path="model_explanations_shap")
-        mlflow.shap.log_explainer(explainer, "model_explanations_shap/explainer")
+        plt.clf()
+    run_logger().log_model(
+        mlflow.shap.save_explainer,
+        "model_explanations_shap/explainer",
+        explainer=explainer,
+    )
+
+
+@click.command(help="Validate the trained model")
+@click.option("--datadir", type=str)
+@click.option("--modeldir", type=str)
+@click.option("--test-score", type=float)
+@click.option("--eval-threshold", type=float)
+@click.option(
+    "--background-rows",
+    type=int,
+    default=100,
+    help="Test rows sampled as the background of the SHAP values of the plots",
+)
+@click.option("--max-rows", type=int, default=2000, help="Test rows sampled to explain")
+@click.option(
+    "--workers",
+    type=int,
+    default=-1,
+    help="Processes computing the SHAP values, -1 for all cores",
+)
+@click.option(
+    "--time-budget",
+    type=float,
+    default=0,
+    help="Seconds after which the remaining rows are not explained, 0 for no limit",
+)
+def model_validate(
+    datadir,
+    modeldir,
+    test_score,
+    eval_threshold,
+    background_rows,
+    max_rows,
+    workers,
+    time_budget,
+):
+    with step_run("model_validate", logger_name="model_validate"):
+        logger = logging.getLogger("model_validate")
+
+        if not check_threshold(test_score, eval_threshold):
+            return
+
+        # load test data
+        logger.info("Reading test data from {}".format(datadir))
+        test = load_split(datadir, "test")
+
+        # load model
+        logger.info("Loading model from {}".format(modeldir))
+        model = mlflow.sklearn.load_model(local_artifact(modeldir))
+
+        explain_model(test, model, background_rows, max_rows, workers, time_budget)
 
 
 # check new model performs better than current model or baseline model
@@ -0,0 +1,168 @@
+"""
+In-memory cache of a model's predictions, keyed by encoded feature rows.
+
+Valuation requests for the same block, flat type, storey range and floor
+area come in over and over, and each pays a full traversal of the forest.
+The server looks up the encoded rows of a batch in a PredictionCache and
+only sends the rows it misses to the model. Rows are keyed after encoding,
+so raw rows with the same features share an entry, eg. remaining leases of
+"63 years 02 months" and "63 years 05 months". Entries expire `ttl_s`
+seconds after they were stored, the least recently used ones are evicted
+beyond `max_entries`, and all of them are dropped when the served model
+version changes.
+"""
+
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+MAX_ENTRIES = 100000
+TTL_S = 3600.0
+# weight of the latest model call in the estimate of the time of a call
+CALL_COST_DECAY = 0.05
+
+
+def row_keys(X):
+    """Hashable keys of encoded feature rows: the bytes of each row as
+    float64, with -0.0 and NaNs made canonical
+
+    Args:
+        X: pd.DataFrame or np.ndarray of encoded rows
+
+    Returns:
+        keys: list of bytes, one per row
+    """
+    # adding 0.0 turns -0.0 into 0.0
+    X = np.array(X, dtype=np.float64, order="C") + 0.0
+    X[np.isnan(X)] = np.nan
+    return X.view(np.dtype((np.void, X.shape[1] * X.itemsize))).ravel().tolist()
+
+
+class PredictionCache:
+    """LRU of predictions with a time to live
+
+    Args:
+        max_entries (int): rows kept, the least recently used are evicted
+        ttl_s (float): seconds an entry is served after it was stored
+        clock (callable): monotonic time in seconds
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl_s=TTL_S, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.clock = clock
+        self.version = None
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.miss_seconds = 0.0
+        self.saved_calls = 0
+        self.saved_seconds = 0.0
+        # exponentially weighted sums of 1, rows, seconds, rows**2 and
+        # rows * seconds of the model calls, to fit their seconds as
+        # call cost + row cost * rows
+        self._call_sums = np.zeros(5)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def call_costs(self):
+        """Estimated fixed seconds of a model call and seconds per row"""
+        weight, rows, seconds, rows_sq, rows_seconds = self._call_sums
+        if weight == 0:
+            return 0.0, 0.0
+        mean_rows, mean_seconds = rows / weight, seconds / weight
+        var = rows_sq / weight - mean_rows**2
+        if var > 1e-9:
+            row_cost = max((rows_seconds / weight - mean_rows * mean_seconds) / var, 0)
+        else:
+            row_cost = mean_seconds / mean_rows
+        return max(mean_seconds - row_cost * mean_rows, 0.0), row_cost
+
+    def lookup(self, keys):
+        """Cached predictions of rows. Every hit saves the time of a row in a
+        model call, and a lookup that finds every row saves the call, which
+        `saved_seconds` and `saved_calls` estimate and count
+
+        Args:
+            keys (list): `row_keys` of the rows
+
+        Returns:
+            predictions, found: float64 arrays of the predictions (NaN where
+                missed) and of whether each row was found
+        """
+        now = self.clock()
+        predictions = np.full(len(keys), np.nan)
+        found = np.zeros(len(keys), dtype=bool)
+        for i, key in enumerate(keys):
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            if entry[1] <= now:
+                del self._entries[key]
+                self.expirations += 1
+                continue
+            self._entries.move_to_end(key)
+            predictions[i] = entry[0]
+            found[i] = True
+        hits = int(found.sum())
+        self.hits += hits
+        self.misses += len(keys) - hits
+        call_cost, row_cost = self.call_costs()
+        self.saved_seconds += hits * row_cost
+        if hits and hits == len(keys):
+            self.saved_calls += 1
+            self.saved_seconds += call_cost
+        return predictions, found
+
+    def store(self, keys, predictions, seconds=None):
+        """Cache the predictions of rows
+
+        Args:
+            keys (list): `row_keys` of the rows
+            predictions: their predictions
+            seconds (float): time of the model call that predicted them, for
+                the estimate of the time saved by hits
+        """
+        expires = self.clock() + self.ttl_s
+        for key, prediction in zip(keys, predictions):
+            self._entries[key] = (float(prediction), expires)
+            self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        if seconds is not None and len(keys):
+            self.miss_seconds += seconds
+            rows = len(keys)
+            call = np.array([1, rows, seconds, rows**2, rows * seconds])
+            self._call_sums = (1 - CALL_COST_DECAY) * self._call_sums + call
+
+    def set_version(self, version):
+        """Drop every entry if the predictions now come from another model
+        version"""
+        if version == self.version:
+            return
+        if self.version is not None:
+            self._entries.clear()
+            self.invalidations += 1
+        self.version = version
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "version": self.version,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "miss_seconds": self.miss_seconds,
+            "saved_calls": self.saved_calls,
+            "saved_seconds": self.saved_seconds,
+        }
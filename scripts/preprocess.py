@@ -1,170 +1,343 @@
 import logging
-import hashlib
-from urllib.parse import unquote, urlparse
 import os
-import sys
 import tempfile
 import mlflow
 import click
+import numpy as np
 import pandas as pd
-from utils import onehotencode
-from sklearn.preprocessing import LabelEncoder
-from sklearn.model_selection import train_test_split
+from feature_transformer import (
+    TRANSFORMER_FILENAME,
+    VOCABULARY_COLUMNS,
+    FeatureTransformer,
+    clean_data,
+    fit_vocabulary,
+    normalize_category,
+)
+from run_logger import run_logger
+from utils import (
+    DATA_FORMATS,
+    ONEHOT_DTYPES,
+    SplitWriter,
+    save_splits,
+    step_run,
+    write_manifest,
+)
 
 
-@click.command(help="Preprocess HDB resale dataset and saves it as mlflow artifact")
-@click.option("--filepath", type=str, default="data/resale-flat-prices-2022-jan.csv")
-@click.option("--train-ratio", type=float, default=0.7)
-@click.option("--val-ratio", type=float, default=0.2)
-@click.option("--test-ratio", type=float, default=0.1)
-def preprocess(filepath, train_ratio, val_ratio, test_ratio):
-    with mlflow.start_run() as mlrun:
-        artifact_uri = mlrun.info.artifact_uri
+def encode_data(data, vocabulary, onehot_dtype="float64"):
+    """Label and one-hot encode cleaned data with fitted vocabularies
 
-        # logging
-        logger = logging.getLogger()
-        logger.setLevel(logging.DEBUG)
-        logging.captureWarnings(True)
-        formatter = logging.Formatter(
-            "%(asctime)s - %(levelname)s - %(message)s", "%Y-%m-%d %H:%M:%S"
-        )
+    Args:
+        data (pd.DataFrame): output of `clean_data`
+        vocabulary (dict): output of `fit_vocabulary` on the full dataset
+        onehot_dtype (str): dtype of the one-hot features, one of ONEHOT_DTYPES
 
-        file_handler = logging.FileHandler(
-            unquote(urlparse(os.path.join(artifact_uri, "log.log")).path)
+    Returns:
+        data: encoded dataframe
+        transformer: FeatureTransformer compiled from the vocabularies
+    """
+    logging.getLogger().debug("Encoding categorical features")
+    transformer = FeatureTransformer(vocabulary, onehot_dtype=onehot_dtype)
+    return transformer.encode(data), transformer
+
+
+def _log_outputs(output_paths, transformer):
+    logger = logging.getLogger()
+    artifact_uri = mlflow.active_run().info.artifact_uri
+
+    # log categorical features schema
+    run_logger().log_dict(
+        transformer.cat_features_schema(),
+        os.path.join("schemas", "cat_features_schema.json"),
+    )
+
+    # log train, validation, test df, their manifest and the fitted feature
+    # transformer to artifact store
+    transformer_path = os.path.join(
+        os.path.dirname(output_paths[0]), TRANSFORMER_FILENAME
+    )
+    transformer.save(transformer_path)
+    for output_path in output_paths + [transformer_path]:
+        run_logger().log_artifact(output_path, "trainvaltest_data")
+        logger.debug(
+            "Uploaded to artifact store: %s"
+            % os.path.join(
+                artifact_uri, "trainvaltest_data", os.path.basename(output_path)
+            )
         )
-        file_handler.setLevel(logging.DEBUG)
-        file_handler.setFormatter(formatter)
 
-        stdout_handler = logging.StreamHandler(sys.stdout)
-        stdout_handler.setLevel(logging.DEBUG)
-        stdout_handler.setFormatter(formatter)
 
-        logger.addHandler(file_handler)
-        logger.addHandler(stdout_handler)
+def preprocess_data(
+    data,
+    train_ratio=0.7,
+    val_ratio=0.2,
+    test_ratio=0.1,
+    data_format="parquet",
+    compression="zstd",
+    onehot_dtype="float64",
+    vocabulary=None,
+):
+    """Encode and split the raw dataset and log the splits as artifacts.
+    Must be called inside an active run.
 
-        # hash current file and log it as artifact
-        curr_file_hash = hashlib.md5(
-            open("scripts/preprocess.py", "rb").read()
-        ).hexdigest()
-        mlflow.log_text(curr_file_hash, "entrypoint_hash/hash.txt")
+    Args:
+        data (pd.DataFrame): raw HDB resale dataset
+        train_ratio (float): fraction of rows for the train set
+        val_ratio (float): fraction of rows for the validation set
+        test_ratio (float): fraction of rows for the test set
+        data_format (str): file format of the logged splits, see utils.save_splits
+        compression (str): codec for parquet and feather splits
+        onehot_dtype (str): dtype of the one-hot features, one of
+            ONEHOT_DTYPES. uint8 stores them in 1 byte instead of 8.
+        vocabulary (dict): categories to encode with instead of the ones of
+            `data`, see `base_vocabulary`
 
-        logger.info("Reading data from {}".format(filepath))
-        data = pd.read_csv(filepath)
+    Returns:
+        train_df, val_df, test_df: splits with `resale_price` as first column
+    """
+    logger = logging.getLogger()
 
-        tmpdir = tempfile.mkdtemp()
-        train_output_path = os.path.join(tmpdir, "train.csv")
-        validation_output_path = os.path.join(tmpdir, "validation.csv")
-        test_output_path = os.path.join(tmpdir, "test.csv")
-
-        columns = [
-            "resale_price",
-            "town",
-            "flat_type",
-            "storey_range",
-            "floor_area_sqm",
-            "flat_model",
-            "lease_commence_date",
-            "remaining_lease",
-        ]
-        data = data[columns]
-
-        data = data.replace(regex=[r".*[mM]aisonette.*", "foo"], value="Maisonette")
-        data["remaining_lease"] = data["remaining_lease"].str.extract(
-            r"(\d+)(?= years)"
-        )
-        data = data.astype({"remaining_lease": "int16"})
-
-        logger.debug("Label encoding categorical columns - flat_type")
-        flat_type_map = {
-            "1 ROOM": 0,
-            "2 ROOM": 1,
-            "3 ROOM": 2,
-            "4 ROOM": 3,
-            "5 ROOM": 4,
-            "MULTI-GENERATION": 5,
-            "EXECUTIVE": 6,
-        }
-        data = data.replace({"flat_type": flat_type_map})
-        # save mappings as artifacts!!!
-
-        logger.debug("Label encoding categorical columns - storey_range")
-        storey_range_le = LabelEncoder()
-        data["storey_range"] = storey_range_le.fit_transform(data["storey_range"])
-        # print(storey_range_le.classes_)
-
-        logger.debug("One hot encoding categorical features")
-        data, town_features, town_cat = onehotencode(data, "town")
-        data, flat_model_features, flat_model_cat = onehotencode(data, "flat_model")
-        # print(data.columns)
-        # save encoders as artifacts!!!
-
-        # log categorical features schema
-        mlflow.log_dict(
-            {
-                "town": {
-                    "categories": town_cat,
-                    "ohe_features": town_features,
-                },
-                "flat_model": {
-                    "categories": flat_model_cat,
-                    "ohe_features": flat_model_features,
-                },
-            },
-            os.path.join("schemas", "cat_features_schema.json"),
-        )
+    data = clean_data(data)
+    data, transformer = encode_data(
+        data, vocabulary or fit_vocabulary(data), onehot_dtype
+    )
+
+    # Split into train, val, test with `resale_price` as first column
+    logger.debug("Splitting data into train, validation, and test sets")
+    splits = split_indices(len(data), train_ratio, val_ratio, test_ratio)
+    train_df, val_df, test_df = (data.iloc[splits[name]] for name in splits)
+
+    logger.info("Train data shape after preprocessing: {}".format(train_df.shape))
+    logger.info("Validation data shape after preprocessing: {}".format(val_df.shape))
+    logger.info("Test data shape after preprocessing: {}".format(test_df.shape))
+
+    output_paths = save_splits(
+        {"train": train_df, "validation": val_df, "test": test_df},
+        tempfile.mkdtemp(),
+        data_format,
+        compression,
+    )
+    _log_outputs(output_paths, transformer)
+
+    return train_df, val_df, test_df
+
+
+def base_vocabulary(base_run):
+    """Categories of the feature transformer of a `train` run's pyfunc model.
+    Splits encoded with them have the features of that run's regressor, so
+    it can continue training on them: categories the run did not see are
+    encoded as unknown.
+
+    Returns:
+        vocabulary: output of `fit_vocabulary`, None if `base_run` is empty
+    """
+    if not base_run:
+        return None
+    from resale_model import load_transformer
+
+    run_logger().set_tag("base_run", base_run)
+    return load_transformer(base_run).vocabulary
 
-        data_processed = data.copy()
-        # Split into train, val, test
-        y = data_processed["resale_price"]
-        X = data_processed.drop(["resale_price"], axis=1)
-
-        logger.debug("Splitting data into train, validation, and test sets")
-        X_train, X_val_test, y_train, y_val_test = train_test_split(
-            X,
-            y,
-            test_size=1 - train_ratio,
-            random_state=2023,
-        )
-        X_val, X_test, y_val, y_test = train_test_split(
-            X_val_test,
-            y_val_test,
-            test_size=(test_ratio / (test_ratio + val_ratio)),
-            random_state=2023,
-        )
 
-        # set y as first column
-        train_df = pd.concat([y_train, X_train], axis=1)
-        val_df = pd.concat([y_val, X_val], axis=1)
-        test_df = pd.concat([y_test, X_test], axis=1)
-        # dataset_df = pd.concat([y, X], axis=1)
+def split_indices(num_rows, train_ratio=0.7, val_ratio=0.2, test_ratio=0.1):
+    """Row positions of each split, the same rows `preprocess_data` picks
 
-        logger.info("Train data shape after preprocessing: {}".format(train_df.shape))
+    Returns:
+        indices: split name -> row positions, in split order
+    """
+    from sklearn.model_selection import train_test_split
+
+    train_idx, val_test_idx = train_test_split(
+        np.arange(num_rows), test_size=1 - train_ratio, random_state=2023
+    )
+    val_idx, test_idx = train_test_split(
+        val_test_idx,
+        test_size=(test_ratio / (test_ratio + val_ratio)),
+        random_state=2023,
+    )
+    return {"train": train_idx, "validation": val_idx, "test": test_idx}
+
+
+def write_splits_chunked(
+    filepath,
+    outdir,
+    chunksize,
+    train_ratio=0.7,
+    val_ratio=0.2,
+    test_ratio=0.1,
+    data_format="parquet",
+    compression="zstd",
+    onehot_dtype="float64",
+    vocabulary=None,
+):
+    """Encode and split a raw csv without loading it into memory
+
+    The first pass reads only the categorical columns to fit the vocabularies
+    and count rows, or only counts rows if `vocabulary` is given. The second
+    pass encodes `chunksize` rows at a time into a float64 matrix
+    memory-mapped in `outdir`, then each split gathers its rows from it
+    `chunksize` at a time and appends them to its file. Peak memory is a few
+    chunks plus the split indices, 8 bytes per row.
+
+    csv and npy outputs are byte-identical to `save_splits` on the output of
+    `preprocess_data`; parquet and feather outputs hold the same frames, with
+    one row group / record batch per chunk.
+
+    Returns:
+        output_paths: paths of the written files, manifest last
+        transformer: FeatureTransformer compiled from the vocabularies
+    """
+    logger = logging.getLogger()
+
+    logger.debug("Fitting category vocabularies")
+    fitted = {col: set() for col in VOCABULARY_COLUMNS}
+    num_rows = 0
+    for chunk in pd.read_csv(filepath, usecols=VOCABULARY_COLUMNS, chunksize=chunksize):
+        if vocabulary is None:
+            for col in VOCABULARY_COLUMNS:
+                fitted[col].update(normalize_category(chunk[col]).unique().tolist())
+        num_rows += len(chunk)
+    transformer = FeatureTransformer(
+        vocabulary or {col: sorted(values) for col, values in fitted.items()},
+        onehot_dtype=onehot_dtype,
+    )
+
+    logger.debug("Encoding {} rows in chunks of {}".format(num_rows, chunksize))
+    encoded_path = os.path.join(outdir, "encoded.npy")
+    encoded = None
+    for chunk in pd.read_csv(filepath, chunksize=chunksize):
+        chunk = transformer.encode(clean_data(chunk))
+        if encoded is None:
+            columns, dtypes = chunk.columns, chunk.dtypes
+            encoded = np.lib.format.open_memmap(
+                encoded_path,
+                mode="w+",
+                dtype=np.float64,
+                shape=(num_rows, len(columns)),
+            )
+        start = chunk.index[0]
+        encoded[start : start + len(chunk)] = chunk.to_numpy(dtype=np.float64)
+
+    files, output_paths = {}, []
+    for name, indices in split_indices(
+        num_rows, train_ratio, val_ratio, test_ratio
+    ).items():
+        filename = "{}.{}".format(name, data_format)
+        path = os.path.join(outdir, filename)
+        with SplitWriter(path, data_format, compression, len(indices)) as writer:
+            for start in range(0, len(indices), chunksize):
+                rows = indices[start : start + chunksize]
+                # read the memmap in row order, then restore the split order
+                order = np.argsort(rows)
+                block = np.empty((len(rows), len(columns)))
+                block[order] = encoded[rows[order]]
+                writer.write(pd.DataFrame(block, columns=columns).astype(dtypes))
         logger.info(
-            "Validation data shape after preprocessing: {}".format(val_df.shape)
+            "{} data shape after preprocessing: {}".format(
+                name.capitalize(), (len(indices), len(columns))
+            )
         )
-        logger.info("Test data shape after preprocessing: {}".format(test_df.shape))
+        files[name] = filename
+        output_paths.append(path)
 
-        train_df.to_csv(train_output_path, index=False)
-        val_df.to_csv(validation_output_path, index=False)
-        test_df.to_csv(test_output_path, index=False)
+    del encoded
+    os.remove(encoded_path)
+    output_paths.append(write_manifest(outdir, data_format, columns, dtypes, files))
+    return output_paths, transformer
 
-        # log train, validation, test df to artifact store
-        train_artifact_uri = os.path.join(
-            artifact_uri, "trainvaltest_data", "train.csv"
-        )
-        mlflow.log_artifact(train_output_path, "trainvaltest_data")
-        logger.debug("Uploaded train data to artifact store: %s" % train_artifact_uri)
-        val_artifact_uri = os.path.join(
-            artifact_uri, "trainvaltest_data", "validation.csv"
-        )
-        mlflow.log_artifact(validation_output_path, "trainvaltest_data")
-        logger.debug(
-            "Uploaded validation data to artifact store: %s" % val_artifact_uri
-        )
-        test_artifact_uri = os.path.join(artifact_uri, "trainvaltest_data", "test.csv")
-        mlflow.log_artifact(test_output_path, "trainvaltest_data")
-        logger.debug(
-            "Uploaded validation data to artifact store: %s" % test_artifact_uri
+
+def preprocess_data_chunked(
+    filepath,
+    chunksize,
+    train_ratio=0.7,
+    val_ratio=0.2,
+    test_ratio=0.1,
+    data_format="parquet",
+    compression="zstd",
+    onehot_dtype="float64",
+    vocabulary=None,
+):
+    """Out-of-core `preprocess_data` on a csv, see `write_splits_chunked`.
+    Must be called inside an active run."""
+    output_paths, transformer = write_splits_chunked(
+        filepath,
+        tempfile.mkdtemp(),
+        chunksize,
+        train_ratio,
+        val_ratio,
+        test_ratio,
+        data_format,
+        compression,
+        onehot_dtype,
+        vocabulary,
+    )
+    _log_outputs(output_paths, transformer)
+
+
+@click.command(help="Preprocess HDB resale dataset and saves it as mlflow artifact")
+@click.option("--filepath", type=str, default="data/resale-flat-prices-2022-jan.csv")
+@click.option("--train-ratio", type=float, default=0.7)
+@click.option("--val-ratio", type=float, default=0.2)
+@click.option("--test-ratio", type=float, default=0.1)
+@click.option("--data-format", type=click.Choice(DATA_FORMATS), default="parquet")
+@click.option("--compression", type=str, default="zstd")
+@click.option(
+    "--chunksize",
+    type=int,
+    default=0,
+    help="Rows per chunk to preprocess out of core, 0 to load the whole csv",
+)
+@click.option(
+    "--onehot-dtype",
+    type=click.Choice(ONEHOT_DTYPES),
+    default="float64",
+    help="dtype of the one-hot encoded town and flat_model features",
+)
+@click.option(
+    "--base-run",
+    type=str,
+    default="",
+    help="Run id of a `train` run to encode with the categories of, so its "
+    "regressor can continue training on the splits",
+)
+def preprocess(
+    filepath,
+    train_ratio,
+    val_ratio,
+    test_ratio,
+    data_format,
+    compression,
+    chunksize,
+    onehot_dtype,
+    base_run,
+):
+    with step_run("preprocess"):
+        logger = logging.getLogger()
+        vocabulary = base_vocabulary(base_run)
+        logger.info("Reading data from {}".format(filepath))
+        if chunksize > 0:
+            preprocess_data_chunked(
+                filepath,
+                chunksize,
+                train_ratio,
+                val_ratio,
+                test_ratio,
+                data_format,
+                compression,
+                onehot_dtype,
+                vocabulary,
+            )
+            return
+        data = pd.read_csv(filepath)
+        preprocess_data(
+            data,
+            train_ratio,
+            val_ratio,
+            test_ratio,
+            data_format,
+            compression,
+            onehot_dtype,
+            vocabulary,
         )
 
 
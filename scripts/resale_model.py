@@ -0,0 +1,112 @@
+"""
+Pyfunc model that predicts resale prices from raw resale rows.
+
+Bundles the estimator logged by `train` with the FeatureTransformer fitted by
+`preprocess`, so clients send the columns of the raw dataset (eg. town
+"ANG MO KIO", remaining_lease "61 years 04 months") instead of the one-hot
+encoded features the estimator was trained on.
+"""
+
+import os
+import mlflow
+from mlflow.models.signature import ModelSignature
+from mlflow.types.schema import ColSpec, Schema
+
+SCRIPTS_DIR = os.path.dirname(os.path.realpath(__file__))
+# modules the pickled model needs at load time
+CODE_PATHS = [
+    os.path.join(SCRIPTS_DIR, filename)
+    for filename in ["resale_model.py", "feature_transformer.py", "utils.py"]
+]
+SIGNATURE = ModelSignature(
+    inputs=Schema(
+        [
+            ColSpec("string", "town"),
+            ColSpec("string", "flat_type"),
+            ColSpec("string", "storey_range"),
+            ColSpec("double", "floor_area_sqm"),
+            ColSpec("string", "flat_model"),
+            ColSpec("long", "lease_commence_date"),
+            ColSpec("string", "remaining_lease"),
+        ]
+    ),
+    outputs=Schema([ColSpec("double")]),
+)
+
+
+class ResalePriceModel(mlflow.pyfunc.PythonModel):
+    """Encodes raw resale rows with the fitted FeatureTransformer and predicts
+    with the estimator"""
+
+    def load_context(self, context):
+        from feature_transformer import FeatureTransformer
+
+        self.transformer = FeatureTransformer.load(
+            context.artifacts["feature_transformer"]
+        )
+        self.estimator = mlflow.sklearn.load_model(context.artifacts["estimator"])
+
+    def predict(self, context, model_input):
+        return self.predict_encoded(self.transformer.transform(model_input))
+
+    def predict_encoded(self, X):
+        """Predictions of rows encoded by the transformer"""
+        if not hasattr(self.estimator, "feature_names_in_"):
+            # fitted on a sparse matrix, which has no column names
+            X = X.to_numpy()
+        return self.estimator.predict(X)
+
+
+def log_resale_model(estimator_uri, transformer_path, artifact_path="pyfunc_model"):
+    """Log the estimator and feature transformer as a pyfunc model to the
+    active run
+
+    Args:
+        estimator_uri (str): uri or local path of a saved sklearn model
+        transformer_path (str): local path of a saved FeatureTransformer
+        artifact_path (str): run-relative artifact path of the pyfunc model
+    """
+    from run_logger import run_logger
+
+    return run_logger().log_model(
+        mlflow.pyfunc.save_model,
+        artifact_path,
+        python_model=ResalePriceModel(),
+        artifacts={
+            "estimator": estimator_uri,
+            "feature_transformer": transformer_path,
+        },
+        code_path=CODE_PATHS,
+        signature=SIGNATURE,
+    )
+
+
+def load_transformer(run_id, artifact_path="pyfunc_model"):
+    """FeatureTransformer of the pyfunc model logged by a run"""
+    from feature_transformer import TRANSFORMER_FILENAME, FeatureTransformer
+    from utils import local_artifact
+
+    return FeatureTransformer.load(
+        local_artifact(
+            "runs:/{}/{}/artifacts/{}".format(
+                run_id, artifact_path, TRANSFORMER_FILENAME
+            )
+        )
+    )
+
+
+def load_resale_model(run_id, artifact_path="pyfunc_model"):
+    """ResalePriceModel of a run, loaded without the pyfunc wrapper: its
+    transformer and the flat ensemble of its estimator, if `train` logged one
+
+    Args:
+        run_id (str): run that logged the pyfunc model, eg. the run of a
+            registered model version
+        artifact_path (str): run-relative artifact path of the pyfunc model
+    """
+    from tree_ensemble import load_model
+
+    model = ResalePriceModel()
+    model.transformer = load_transformer(run_id, artifact_path)
+    model.estimator = load_model("runs:/{}/model".format(run_id))
+    return model
@@ -0,0 +1,181 @@
+"""
+Cache-key index for pipeline step runs.
+
+Every step run launched by main.py is tagged with a deterministic cache key,
+the step's input fingerprint: its entry point, code hash, parameters, a
+content hash of its input data files and the fingerprints of the upstream
+steps it consumes. A small JSON index on local disk maps cache keys to run
+ids, so a cache hit costs one `get_run` call. On an index miss we fall back to
+a single filtered `search_runs` query on the cache key tag instead of scanning
+every run.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+from mlflow.entities import LifecycleStage, RunStatus
+from mlflow.exceptions import MlflowException
+from mlflow.protos.databricks_pb2 import RESOURCE_DOES_NOT_EXIST, ErrorCode
+from mlflow.tracking import MlflowClient
+
+CACHE_KEY_TAG = "cache_key"
+DEFAULT_INDEX_PATH = os.path.join(".run_cache", "index.json")
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """Streaming sha256 of a file's content
+
+    Args:
+        path (str): file to hash
+        chunk_size (int): bytes read per chunk
+
+    Returns:
+        digest: hex digest of the file content
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_key(entry_point, parameters, code_hash, data_hashes=None, upstream=None):
+    """Deterministic input fingerprint of a step run, used as its cache key
+
+    Args:
+        entry_point (str): MLproject entry point name
+        parameters (dict): parameters that do not derive from upstream runs
+        code_hash (str): hash of the entry point's source code
+        data_hashes (dict): content hashes of the step's input data files
+        upstream (dict): fingerprints of the upstream steps it consumes
+
+    Returns:
+        key: hex digest identifying the run inputs
+    """
+    payload = json.dumps(
+        {
+            "entry_point": entry_point,
+            "parameters": {k: str(v) for k, v in parameters.items()},
+            "code_hash": code_hash,
+            "data_hashes": data_hashes or {},
+            "upstream": upstream or {},
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RunIndex:
+    """Local key -> run id index backed by a JSON file. Updates hold a file
+    lock, as steps running in other processes record their runs at the same
+    time.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get("RUN_CACHE_INDEX", DEFAULT_INDEX_PATH)
+
+    def _read(self):
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, experiment_id, key):
+        return self._read().get("{}:{}".format(experiment_id, key))
+
+    def _write(self, index):
+        # write to a temp file and swap it in so concurrent readers never see
+        # a partially written index
+        dirname = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(index, f, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    @contextmanager
+    def _lock(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path + ".lock", "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def put(self, experiment_id, key, run_id):
+        with self._lock():
+            index = self._read()
+            index["{}:{}".format(experiment_id, key)] = run_id
+            self._write(index)
+
+    def remove(self, experiment_id, key):
+        with self._lock():
+            index = self._read()
+            if index.pop("{}:{}".format(experiment_id, key), None) is not None:
+                self._write(index)
+
+
+def _is_cache_hit(run, key):
+    return (
+        run.info.to_proto().status == RunStatus.FINISHED
+        and run.info.lifecycle_stage == LifecycleStage.ACTIVE
+        and run.data.tags.get(CACHE_KEY_TAG) == key
+    )
+
+
+def lookup_run(experiment_id, key, index=None, client=None):
+    """Find a finished run tagged with the given cache key
+
+    Args:
+        experiment_id (str): experiment to look in
+        key (str): cache key from `cache_key`
+        index (RunIndex): local index, consulted before the tracking server
+        client (MlflowClient): tracking client
+
+    Returns:
+        run: matching mlflow Run, or None
+    """
+    index = index or RunIndex()
+    client = client or MlflowClient()
+
+    run_id = index.get(experiment_id, key)
+    if run_id is not None:
+        try:
+            run = client.get_run(run_id)
+        except MlflowException as e:
+            # other errors, eg. of an unreachable tracking server, do not
+            # make the entry stale
+            if e.error_code != ErrorCode.Name(RESOURCE_DOES_NOT_EXIST):
+                raise
+            run = None
+        if run is not None and _is_cache_hit(run, key):
+            return run
+        # stale entry, eg. the run was deleted
+        index.remove(experiment_id, key)
+
+    runs = client.search_runs(
+        [experiment_id],
+        filter_string="tags.{} = '{}' and attributes.status = 'FINISHED'".format(
+            CACHE_KEY_TAG, key
+        ),
+        max_results=1,
+    )
+    if not runs:
+        return None
+    run = runs[0]
+    index.put(experiment_id, key, run.info.run_id)
+    return run
+
+
+def record_run(experiment_id, key, run_id, index=None, client=None):
+    """Tag a finished run with its cache key and add it to the local index"""
+    index = index or RunIndex()
+    client = client or MlflowClient()
+    client.set_tag(run_id, CACHE_KEY_TAG, key)
+    index.put(experiment_id, key, run_id)
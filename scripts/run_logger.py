@@ -0,0 +1,270 @@
+"""
+Batched, asynchronous logging of a run's metrics, params, tags and artifacts.
+
+Every `mlflow.log_*` call is a blocking request to the tracking server or the
+artifact store, so short steps that log a few metrics, tags and files spend
+most of their time in round-trips. Within a `batched_logging` block,
+`run_logger()` returns the RunLogger of the run, which queues metrics, params
+and tags and sends them with `log_batch` (in order, on one thread), and
+uploads artifacts on a pool of threads while the step goes on. Models are
+logged right away with `mlflow.models.Model.log`.
+The block waits for every queued call when it ends and raises the first
+error, so a run whose logging failed is marked as failed.
+
+Outside a block, `run_logger()` logs each call to the active run right away.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+# limits of one log_batch request
+MAX_BATCH_METRICS = 1000
+MAX_BATCH_PARAMS = 100
+MAX_BATCH_TAGS = 100
+UPLOAD_WORKERS = 4
+
+# run id -> RunLogger of the open `batched_logging` blocks
+_loggers = {}
+
+
+class RunLogger:
+    """Logging facade of a run
+
+    Args:
+        run_id (str): run to log to
+        client (MlflowClient): tracking client
+        synchronous (bool): log each call before returning instead of queueing
+            it
+        upload_workers (int): threads uploading artifacts
+    """
+
+    def __init__(
+        self, run_id, client=None, synchronous=False, upload_workers=UPLOAD_WORKERS
+    ):
+        from mlflow.tracking import MlflowClient
+
+        self.run_id = run_id
+        self.client = client or MlflowClient()
+        self.synchronous = synchronous
+        self._lock = threading.Lock()
+        self._metrics, self._params, self._tags = [], [], []
+        self._futures = []
+        # batches are sent one at a time, so later values of a param or tag
+        # are logged after earlier ones
+        self._batch_executor = ThreadPoolExecutor(1)
+        self._upload_executor = ThreadPoolExecutor(upload_workers)
+        self._staging_dir = None
+
+    def log_metric(self, key, value, step=None):
+        self.log_metrics({key: value}, step)
+
+    def log_metrics(self, metrics, step=None):
+        from mlflow.entities import Metric
+
+        timestamp = int(time.time() * 1000)
+        self._queue(
+            metrics=[
+                Metric(key, float(value), timestamp, step or 0)
+                for key, value in metrics.items()
+            ]
+        )
+
+    def log_param(self, key, value):
+        self.log_params({key: value})
+
+    def log_params(self, params):
+        from mlflow.entities import Param
+
+        self._queue(params=[Param(key, str(value)) for key, value in params.items()])
+
+    def set_tag(self, key, value):
+        self.set_tags({key: value})
+
+    def set_tags(self, tags):
+        from mlflow.entities import RunTag
+
+        self._queue(tags=[RunTag(key, str(value)) for key, value in tags.items()])
+
+    def _queue(self, metrics=(), params=(), tags=()):
+        with self._lock:
+            self._metrics.extend(metrics)
+            self._params.extend(params)
+            self._tags.extend(tags)
+            full = (
+                len(self._metrics) >= MAX_BATCH_METRICS
+                or len(self._params) >= MAX_BATCH_PARAMS
+                or len(self._tags) >= MAX_BATCH_TAGS
+            )
+        if full or self.synchronous:
+            self._send_batches()
+
+    def _send_batches(self):
+        with self._lock:
+            metrics, params, tags = self._metrics, self._params, self._tags
+            self._metrics, self._params, self._tags = [], [], []
+        while metrics or params or tags:
+            self._submit(
+                self._batch_executor,
+                self.client.log_batch,
+                self.run_id,
+                metrics=metrics[:MAX_BATCH_METRICS],
+                params=params[:MAX_BATCH_PARAMS],
+                tags=tags[:MAX_BATCH_TAGS],
+            )
+            metrics = metrics[MAX_BATCH_METRICS:]
+            params = params[MAX_BATCH_PARAMS:]
+            tags = tags[MAX_BATCH_TAGS:]
+
+    def _submit(self, executor, fn, *args, **kwargs):
+        if self.synchronous:
+            fn(*args, **kwargs)
+            return
+        future = executor.submit(fn, *args, **kwargs)
+        with self._lock:
+            self._futures.append(future)
+
+    def _new_staging_dir(self):
+        if self.synchronous:
+            # uploaded before staging_dir returns, and no close() deletes a
+            # parent directory of the throwaway loggers of `run_logger()`
+            return tempfile.mkdtemp(prefix="run_logger-")
+        with self._lock:
+            if self._staging_dir is None:
+                self._staging_dir = tempfile.mkdtemp(prefix="run_logger-")
+        return tempfile.mkdtemp(dir=self._staging_dir)
+
+    @contextmanager
+    def staging_dir(self, artifact_path=None):
+        """Directory whose files are uploaded to `artifact_path` when the
+        block exits. The files must not change afterwards."""
+        tmpdir = self._new_staging_dir()
+        try:
+            yield tmpdir
+            self.log_artifacts(tmpdir, artifact_path)
+        finally:
+            if self.synchronous:
+                shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def log_artifact(self, local_path, artifact_path=None):
+        """Upload a file, which must not change until the logger is flushed"""
+        self._submit(
+            self._upload_executor,
+            self.client.log_artifact,
+            self.run_id,
+            local_path,
+            artifact_path,
+        )
+
+    def log_artifacts(self, local_dir, artifact_path=None):
+        """Upload the files of a directory, which must not change until the
+        logger is flushed"""
+        self._submit(
+            self._upload_executor,
+            self.client.log_artifacts,
+            self.run_id,
+            local_dir,
+            artifact_path,
+        )
+
+    def log_text(self, text, artifact_file):
+        artifact_path, filename = os.path.split(artifact_file)
+        with self.staging_dir(artifact_path or None) as tmpdir:
+            with open(os.path.join(tmpdir, filename), "w") as f:
+                f.write(text)
+
+    def log_dict(self, dictionary, artifact_file):
+        self.log_text(json.dumps(dictionary, indent=2), artifact_file)
+
+    def log_model(self, save_model, artifact_path, **kwargs):
+        """Save and log a model, as `mlflow.<flavor>.log_model`, in the calling
+        thread. `Model.log` logs to the active run, which must be the run of
+        the logger.
+
+        Args:
+            save_model (callable): save function of the flavor, eg.
+                `mlflow.sklearn.save_model`
+            artifact_path (str): run-relative artifact path of the model
+            kwargs: arguments of `save_model` other than `path`
+
+        Returns:
+            model_uri: runs:/ uri of the logged model
+        """
+        import mlflow
+        from mlflow.models import Model
+
+        active_run = mlflow.active_run()
+        if active_run is None or active_run.info.run_id != self.run_id:
+            raise ValueError(
+                "Models are logged to the active run, not run {}".format(self.run_id)
+            )
+        # `Model.log` only needs the `save_model` of the flavor module
+        flavor = SimpleNamespace(save_model=save_model)
+        return Model.log(artifact_path, flavor, **kwargs).model_uri
+
+    def flush(self):
+        """Send the queued metrics, params and tags and wait for every upload
+
+        Raises:
+            the first error of the queued calls
+        """
+        self._send_batches()
+        error = None
+        while True:
+            with self._lock:
+                futures, self._futures = self._futures, []
+            if not futures:
+                break
+            for future in futures:
+                if future.exception() is not None and error is None:
+                    error = future.exception()
+        if error is not None:
+            raise error
+
+    def close(self):
+        """Wait for the queued calls, ignoring their errors, and delete the
+        staged files"""
+        try:
+            self.flush()
+        except Exception:
+            pass
+        self._batch_executor.shutdown()
+        self._upload_executor.shutdown()
+        if self._staging_dir is not None:
+            shutil.rmtree(self._staging_dir, ignore_errors=True)
+
+
+@contextmanager
+def batched_logging(run_id, client=None):
+    """Queue the logging calls of `run_logger()` to a run in the block and
+    wait for them when it exits
+
+    Raises:
+        the first error of the queued calls, when the block exits without
+        an error of its own
+    """
+    logger = RunLogger(run_id, client)
+    _loggers[run_id] = logger
+    try:
+        yield logger
+        logger.flush()
+    finally:
+        del _loggers[run_id]
+        logger.close()
+
+
+def run_logger(run_id=None):
+    """RunLogger of a run, the active run by default"""
+    if run_id is None:
+        import mlflow
+
+        run_id = mlflow.tracking.fluent._get_or_start_run().info.run_id
+    if run_id in _loggers:
+        return _loggers[run_id]
+    return RunLogger(run_id, synchronous=True)
@@ -0,0 +1,137 @@
+"""
+Versioned registry of the accepted data schemas of each dataset.
+
+Schemas are content-addressed by the sha256 of their canonical JSON and
+logged by the data_validate run that accepted them. An experiment tag per
+dataset points at the latest accepted schema, so fetching the reference
+schema is one `get_experiment` call whatever the number of runs in the
+experiment, and schema documents are read from a local on-disk cache keyed by
+their digest, which never goes stale.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+import mlflow
+from mlflow.tracking import MlflowClient
+from mlflow.utils import mlflow_tags
+
+SCHEMA_ARTIFACT_PATH = "data_schema/schema.json"
+SCHEMA_DIGEST_TAG = "schema_digest"
+LATEST_TAG_PREFIX = "schema_registry.latest."
+DEFAULT_DATASET_NAME = "hdb_resale"
+DEFAULT_CACHE_DIR = os.path.join(".schema_registry", "schemas")
+
+
+def schema_digest(schema):
+    """Content address of a schema: sha256 of its canonical JSON"""
+    payload = json.dumps(schema, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SchemaCache:
+    """Local digest -> schema store, one JSON file per schema"""
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or os.environ.get(
+            "SCHEMA_REGISTRY_CACHE", DEFAULT_CACHE_DIR
+        )
+
+    def _path(self, digest):
+        return os.path.join(self.cache_dir, "{}.json".format(digest))
+
+    def get(self, digest):
+        try:
+            with open(self._path(digest), "r") as f:
+                schema = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # a corrupted file does not match its address
+        return schema if schema_digest(schema) == digest else None
+
+    def put(self, digest, schema):
+        # write to a temp file and swap it in so concurrent readers never see
+        # a partially written schema
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(schema, f, sort_keys=True)
+        os.replace(tmp_path, self._path(digest))
+
+
+class SchemaRegistry:
+    """Latest accepted schema of each dataset of an experiment
+
+    Args:
+        experiment_id (str): experiment holding the data_validate runs
+        client (MlflowClient): tracking client
+        cache (SchemaCache): local schema store
+    """
+
+    def __init__(self, experiment_id, client=None, cache=None):
+        self.experiment_id = experiment_id
+        self.client = client or MlflowClient()
+        self.cache = cache or SchemaCache()
+
+    def _pointer(self, dataset_name):
+        experiment = self.client.get_experiment(self.experiment_id)
+        value = experiment.tags.get(LATEST_TAG_PREFIX + dataset_name)
+        return json.loads(value) if value else None
+
+    def _legacy_pointer(self):
+        # experiments from before the registry, which only validated the
+        # default dataset: one filtered query for the latest passed
+        # data_validate run instead of scanning every run
+        runs = self.client.search_runs(
+            [self.experiment_id],
+            filter_string="tags.`{}` = 'data_validate' and tags.validation_status = 'pass'".format(
+                mlflow_tags.MLFLOW_PROJECT_ENTRY_POINT
+            ),
+            order_by=["attributes.start_time DESC"],
+            max_results=1,
+        )
+        if not runs:
+            return None
+        return {"digest": None, "run_id": runs[0].info.run_id}
+
+    def _load(self, pointer):
+        schema = self.cache.get(pointer["digest"]) if pointer["digest"] else None
+        if schema is None:
+            schema = mlflow.artifacts.load_dict(
+                "runs:/{}/{}".format(pointer["run_id"], SCHEMA_ARTIFACT_PATH)
+            )
+            self.cache.put(schema_digest(schema), schema)
+        return schema
+
+    def latest(self, dataset_name=DEFAULT_DATASET_NAME):
+        """Latest accepted schema of a dataset
+
+        Returns:
+            schema, run_id: the schema and the run that accepted it, or
+                None, None if no schema was accepted yet
+        """
+        pointer = self._pointer(dataset_name)
+        if pointer is None and dataset_name == DEFAULT_DATASET_NAME:
+            pointer = self._legacy_pointer()
+        if pointer is None:
+            return None, None
+        return self._load(pointer), pointer["run_id"]
+
+    def accept(self, schema, run_id, dataset_name=DEFAULT_DATASET_NAME):
+        """Make a schema, logged by `run_id` at SCHEMA_ARTIFACT_PATH, the
+        latest accepted schema of a dataset
+
+        Returns:
+            digest: content address of the schema
+        """
+        digest = schema_digest(schema)
+        self.cache.put(digest, schema)
+        self.client.set_tag(run_id, SCHEMA_DIGEST_TAG, digest)
+        self.client.set_experiment_tag(
+            self.experiment_id,
+            LATEST_TAG_PREFIX + dataset_name,
+            json.dumps({"digest": digest, "run_id": run_id}),
+        )
+        return digest
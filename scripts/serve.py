@@ -0,0 +1,783 @@
+"""
+Micro-batching HTTP server of a registered resale price model.
+
+`mlflow models serve` scores every request on its own, so under concurrent
+traffic most of its time goes to the per-call overhead of pandas and the
+model rather than to the rows. This server accepts requests on an asyncio
+event loop and coalesces the rows of concurrent requests into one batch, of
+up to --max-batch-size rows or whatever arrived within --max-wait-ms of the
+batch's first request. Batches are scored on --workers processes, each of
+which loads the model's feature transformer and flat ensemble once, while the
+loop goes on accepting requests.
+
+Endpoints, on the port `mlflow models serve` used:
+    POST /invocations   raw rows as `dataframe_split` or `dataframe_records`
+                        json, answers {"predictions": [...]}, 400 for rows
+                        that cannot be scored and 500 for server errors
+    GET /ping           200 once the workers have loaded the model
+    GET /metrics        latency quantiles, throughput and batch sizes
+    POST /reload        serve the version the --version and --stage options
+                        resolve to now, eg. after a stage transition
+
+With --cache-size, the predictions of encoded rows are memoized in front of
+the workers, see prediction_cache.py.
+
+    python scripts/serve.py --stage Production --max-batch-size 256
+"""
+
+import asyncio
+import json
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+
+import click
+import numpy as np
+import pandas as pd
+from mlflow.tracking import MlflowClient
+
+from prediction_cache import TTL_S, PredictionCache, row_keys
+from resale_model import SIGNATURE, load_resale_model
+from utils import REGISTERED_MODEL_NAME, latest_version_run, process_pool
+
+DEFAULT_PORT = 1234
+MAX_BATCH_SIZE = 256
+MAX_WAIT_MS = 2.0
+# latencies of the last requests, which /metrics reports quantiles of
+LATENCY_WINDOW = 10000
+MAX_BODY_BYTES = 16 * 2**20
+INPUT_COLUMNS = SIGNATURE.inputs.input_names()
+
+STATUS_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class BadRequest(ValueError):
+    """Invocation whose rows cannot be scored"""
+
+
+# errors of the rows of an invocation rather than of the server: BadRequest of
+# parse_payload, and the ValueError the feature transformer raises for unknown
+# categories or unparseable values, which reaches the loop from the workers
+INPUT_ERRORS = (ValueError,)
+
+
+def parse_payload(body):
+    """Columns of the raw rows of an invocation
+
+    Args:
+        body (bytes): `dataframe_split` or `dataframe_records` json
+
+    Returns:
+        columns: dict of INPUT_COLUMNS -> list of values, in that order
+
+    Raises:
+        BadRequest: if the body is not such json or lacks input columns
+    """
+    try:
+        payload = json.loads(body)
+    except ValueError as e:
+        raise BadRequest("Invalid json: {}".format(e))
+    if not isinstance(payload, dict):
+        raise BadRequest("Expected a json object")
+
+    if "dataframe_split" in payload:
+        split = payload["dataframe_split"]
+        names, data = split.get("columns"), split.get("data")
+        if not isinstance(names, list) or not isinstance(data, list):
+            raise BadRequest("`dataframe_split` needs `columns` and `data` lists")
+        if any(not isinstance(row, list) or len(row) != len(names) for row in data):
+            raise BadRequest("Every row needs a value per column")
+        columns = {name: [row[i] for row in data] for i, name in enumerate(names)}
+    elif "dataframe_records" in payload:
+        records = payload["dataframe_records"]
+        if not isinstance(records, list) or not all(
+            isinstance(record, dict) for record in records
+        ):
+            raise BadRequest("`dataframe_records` needs a list of objects")
+        names = set(chain.from_iterable(records))
+        columns = {
+            name: [record.get(name) for record in records]
+            for name in INPUT_COLUMNS
+            if name in names
+        }
+    else:
+        raise BadRequest("Expected `dataframe_split` or `dataframe_records`")
+
+    missing = [name for name in INPUT_COLUMNS if name not in columns]
+    if missing:
+        raise BadRequest("Missing columns: {}".format(", ".join(missing)))
+    return {name: columns[name] for name in INPUT_COLUMNS}
+
+
+class ServingMetrics:
+    """Request and batch counters of a server
+
+    Args:
+        window (int): latencies kept for the quantiles
+    """
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.started = time.monotonic()
+        self.requests = 0
+        self.errors = 0
+        self.server_errors = 0
+        self.rows = 0
+        self.batches = 0
+        self.batch_seconds = 0.0
+        self.latencies = deque(maxlen=window)
+        # batches by the power of two their number of rows rounds up to
+        self.batch_sizes = Counter()
+        # PredictionCache of the server, if any
+        self.cache = None
+
+    def record_request(self, latency_s, rows, status=200):
+        self.requests += 1
+        self.errors += int(status >= 400)
+        self.server_errors += int(status >= 500)
+        self.rows += rows
+        self.latencies.append(latency_s)
+
+    def record_batch(self, rows, seconds):
+        self.batches += 1
+        self.batch_seconds += seconds
+        self.batch_sizes[1 << max(rows - 1, 0).bit_length()] += 1
+
+    def snapshot(self):
+        uptime = time.monotonic() - self.started
+        latencies = np.array(self.latencies) * 1000
+        quantiles = (
+            np.quantile(latencies, [0.5, 0.95, 0.99]) if len(latencies) else [0] * 3
+        )
+        snapshot = {
+            "uptime_s": uptime,
+            "requests": self.requests,
+            "errors": self.errors,
+            "server_errors": self.server_errors,
+            "rows": self.rows,
+            "requests_per_s": self.requests / uptime,
+            "rows_per_s": self.rows / uptime,
+            "latency_ms": {
+                "p50": float(quantiles[0]),
+                "p95": float(quantiles[1]),
+                "p99": float(quantiles[2]),
+                "max": float(latencies.max()) if len(latencies) else 0.0,
+            },
+            "batches": self.batches,
+            "mean_batch_rows": self.rows / self.batches if self.batches else 0.0,
+            "mean_batch_ms": (
+                1000 * self.batch_seconds / self.batches if self.batches else 0.0
+            ),
+            "batch_rows": {
+                "<={}".format(size): count
+                for size, count in sorted(self.batch_sizes.items())
+            },
+        }
+        if self.cache is not None:
+            snapshot["cache"] = self.cache.stats()
+        return snapshot
+
+
+class MicroBatcher:
+    """Scores the rows of concurrent requests in shared batches
+
+    Args:
+        score (callable): predictions of a dict of columns, run on `executor`
+            (a module-level function if it is a process pool)
+        executor (Executor): pool the batches are scored on
+        max_batch_size (int): rows of a batch. A larger request is a batch of
+            its own
+        max_wait_ms (float): time the first request of a batch waits for
+            others to join it
+        max_in_flight (int): batches scored at once, usually the workers of
+            `executor`. Requests arriving while all are busy join the next
+            batch
+        metrics (ServingMetrics): counters to record the batches in
+    """
+
+    def __init__(
+        self,
+        score,
+        executor,
+        max_batch_size=MAX_BATCH_SIZE,
+        max_wait_ms=MAX_WAIT_MS,
+        max_in_flight=1,
+        metrics=None,
+    ):
+        self.score = score
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max_wait_ms / 1000
+        self.max_in_flight = max_in_flight
+        self.metrics = metrics or ServingMetrics()
+        self._queue = None
+        self._task = None
+        self._carry = None
+
+    def start(self):
+        """Start batching on the running event loop"""
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def set_model(self, executor, transformer=None, version=None):
+        """Score the next batches on `executor`, whose workers loaded another
+        model version"""
+        self.executor = executor
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def predict(self, columns):
+        """Predictions of the rows of a request
+
+        Args:
+            columns (dict): column -> list of values, as `parse_payload`
+                returns
+
+        Returns:
+            predictions: list of floats
+        """
+        num_rows = len(next(iter(columns.values())))
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((columns, num_rows, future))
+        return await future
+
+    async def _next_request(self, timeout=None):
+        if self._carry is not None:
+            request, self._carry = self._carry, None
+            return request
+        if timeout is None:
+            return await self._queue.get()
+        if not self._queue.empty():
+            return self._queue.get_nowait()
+        if timeout <= 0:
+            return None
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def _fill(self, batch, rows):
+        # adds the requests already queued that fit in the batch
+        while rows < self.max_batch_size and (
+            self._carry is not None or not self._queue.empty()
+        ):
+            request = self._carry or self._queue.get_nowait()
+            self._carry = None
+            if rows + request[1] > self.max_batch_size:
+                self._carry = request
+                break
+            batch.append(request)
+            rows += request[1]
+        return rows
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            first = await self._next_request()
+            batch, rows = [first], first[1]
+            deadline = loop.time() + self.max_wait_s
+            while rows < self.max_batch_size:
+                request = await self._next_request(deadline - loop.time())
+                if request is None:
+                    break
+                if rows + request[1] > self.max_batch_size:
+                    self._carry = request
+                    break
+                batch.append(request)
+                rows += request[1]
+            await self._slots.acquire()
+            # requests that came while waiting for a worker join this batch
+            rows = self._fill(batch, rows)
+            loop.create_task(self._dispatch(batch, rows))
+
+    async def _dispatch(self, batch, rows):
+        start = time.perf_counter()
+        try:
+            await self._score(batch)
+        finally:
+            self._slots.release()
+            self.metrics.record_batch(rows, time.perf_counter() - start)
+
+    async def _predict(self, columns):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.score, columns)
+
+    async def _score(self, batch):
+        if len(batch) == 1:
+            columns = batch[0][0]
+        else:
+            columns = {
+                name: list(chain.from_iterable(request[0][name] for request in batch))
+                for name in batch[0][0]
+            }
+        try:
+            predictions = await self._predict(columns)
+        except Exception as e:
+            if len(batch) == 1:
+                if not batch[0][2].done():
+                    batch[0][2].set_exception(e)
+                return
+            # score the requests alone, so only the bad ones fail
+            for request in batch:
+                await self._score([request])
+            return
+        offset = 0
+        for _, num_rows, future in batch:
+            # the future of a request whose client went away is cancelled
+            if not future.done():
+                future.set_result(
+                    np.asarray(predictions[offset : offset + num_rows]).tolist()
+                )
+            offset += num_rows
+
+
+class CachedMicroBatcher(MicroBatcher):
+    """MicroBatcher that encodes the rows of a batch, looks them up in a
+    PredictionCache and only sends the rows it misses to the workers
+
+    Args:
+        transformer (FeatureTransformer): transformer of the served model
+        cache (PredictionCache): predictions of the served model
+        score (callable): predictions of encoded rows, eg. `score_encoded`
+        args, kwargs: the other arguments of MicroBatcher
+    """
+
+    def __init__(self, transformer, cache, score, *args, **kwargs):
+        super().__init__(score, *args, **kwargs)
+        self.transformer = transformer
+        self.cache = cache
+        self.metrics.cache = cache
+
+    def set_model(self, executor, transformer=None, version=None):
+        super().set_model(executor)
+        self.transformer = transformer
+        self.cache.set_version(version)
+
+    async def _predict(self, columns):
+        X = self.transformer.transform(pd.DataFrame(columns))
+        keys = row_keys(X)
+        predictions, found = self.cache.lookup(keys)
+        if found.all():
+            return predictions
+        # rows repeated within the batch are predicted once
+        first_rows = {}
+        for i in np.flatnonzero(~found):
+            first_rows.setdefault(keys[i], i)
+        rows = list(first_rows.values())
+        version = self.cache.version
+        start = time.perf_counter()
+        missed = await super()._predict(X.iloc[rows])
+        if self.cache.version == version:
+            # not predicted by a model that was replaced in the meantime
+            self.cache.store(list(first_rows), missed, time.perf_counter() - start)
+        index = dict(zip(first_rows, missed))
+        for i in np.flatnonzero(~found):
+            predictions[i] = index[keys[i]]
+        return predictions
+
+
+class InferenceServer:
+    """HTTP/1.1 front end of a MicroBatcher
+
+    Args:
+        batcher (MicroBatcher): scores the rows of the invocations
+        ready (callable): coroutine function returning once the model can
+            score, awaited before /ping answers 200
+        reload (callable): coroutine function swapping the served model for
+            the one it should serve now, returning a json-serializable
+            description of it. Called by POST /reload
+    """
+
+    def __init__(self, batcher, ready=None, reload=None):
+        self.batcher = batcher
+        self.metrics = batcher.metrics
+        self.ready = False
+        self._ready = ready
+        self._reload = reload
+        self._listener = None
+        self._connections = set()
+
+    async def start(self, host="127.0.0.1", port=DEFAULT_PORT):
+        """Start batching and listening on the running event loop
+
+        Returns:
+            server: asyncio.Server, whose sockets give the port if it was 0
+        """
+        self.batcher.start()
+        self._listener = await asyncio.start_server(self._handle_connection, host, port)
+        if self._ready is not None:
+            await self._ready()
+        self.ready = True
+        return self._listener
+
+    async def stop(self):
+        """Stop listening, close the open connections and stop batching"""
+        self._listener.close()
+        for task in list(self._connections):
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        await self._listener.wait_closed()
+        await self.batcher.stop()
+
+    async def handle(self, method, path, body):
+        """Answer a request
+
+        Returns:
+            status, payload: http status code and json-serializable answer
+        """
+        if path == "/invocations":
+            if method != "POST":
+                return 405, {"error": "Use POST"}
+            return await self._invocations(body)
+        if path == "/reload" and self._reload is not None:
+            if method != "POST":
+                return 405, {"error": "Use POST"}
+            try:
+                return 200, await self._reload()
+            except Exception as e:
+                return 500, {"error": "{}: {}".format(type(e).__name__, e)}
+        if method != "GET":
+            return 405, {"error": "Use GET"}
+        if path in ("/ping", "/health"):
+            return (
+                (200, {"status": "ok"}) if self.ready else (503, {"status": "loading"})
+            )
+        if path == "/metrics":
+            return 200, self.metrics.snapshot()
+        return 404, {"error": "No endpoint {}".format(path)}
+
+    async def _invocations(self, body):
+        start = time.perf_counter()
+        num_rows = 0
+        try:
+            columns = parse_payload(body)
+            num_rows = len(columns[INPUT_COLUMNS[0]])
+            predictions = await self.batcher.predict(columns) if num_rows else []
+        except Exception as e:
+            # eg. a broken worker pool or a model that failed to load
+            status = 400 if isinstance(e, INPUT_ERRORS) else 500
+            self.metrics.record_request(time.perf_counter() - start, num_rows, status)
+            return status, {"error": "{}: {}".format(type(e).__name__, e)}
+        self.metrics.record_request(time.perf_counter() - start, num_rows)
+        return 200, {"predictions": predictions}
+
+    async def _handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = (
+                    version == "HTTP/1.1"
+                    and headers.get("connection", "").lower() != "close"
+                )
+                if "chunked" in headers.get("transfer-encoding", ""):
+                    status, payload = 411, {"error": "Send a Content-Length"}
+                    keep_alive = False
+                elif int(headers.get("content-length", 0)) > MAX_BODY_BYTES:
+                    status, payload = 413, {"error": "Body too large"}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(
+                        int(headers.get("content-length", 0))
+                    )
+                    status, payload = await self.handle(
+                        method, target.split("?")[0], body
+                    )
+                _write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ValueError:
+            # malformed request line or content length
+            _write_response(writer, 400, {"error": "Malformed request"}, False)
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+            self._connections.discard(task)
+
+
+def _write_response(writer, status, payload, keep_alive):
+    body = json.dumps(payload).encode()
+    writer.write(
+        (
+            "HTTP/1.1 {} {}\r\nContent-Type: application/json\r\n"
+            "Content-Length: {}\r\nConnection: {}\r\n\r\n"
+        )
+        .format(
+            status,
+            STATUS_REASONS[status],
+            len(body),
+            "keep-alive" if keep_alive else "close",
+        )
+        .encode("latin-1")
+        + body
+    )
+
+
+# model of a worker process, loaded by its initializer
+_worker_model = None
+
+
+def _init_worker(load, *args):
+    global _worker_model
+    _worker_model = load(*args)
+
+
+def _worker_ready():
+    return _worker_model is not None
+
+
+def score_columns(columns):
+    """Predictions of the worker's model for a dict of raw columns"""
+    return _worker_model.predict(None, pd.DataFrame(columns))
+
+
+def score_encoded(X):
+    """Predictions of the worker's model for encoded rows"""
+    return _worker_model.predict_encoded(X)
+
+
+def make_executor(workers, load, *args):
+    """Pool scoring batches with `score_columns`
+
+    Args:
+        workers (int): worker processes, -1 for one per core, 0 for a thread
+            of this process
+        load (callable): module-level function returning the model from
+            `args`, called once per worker
+
+    Returns:
+        executor, workers: the pool and the batches it scores at once
+    """
+    if workers == 0:
+        _init_worker(load, *args)
+        return ThreadPoolExecutor(1), 1
+    if workers < 0:
+        workers = os.cpu_count()
+    executor = process_pool(workers, initializer=_init_worker, initargs=(load, *args))
+    return executor, workers
+
+
+def resolve_model_run(model_name=REGISTERED_MODEL_NAME, version=0, stage=""):
+    """Run id of a version of a registered model
+
+    Args:
+        model_name (str): registered model
+        version (int): version, 0 for the latest one in `stage`
+        stage (str): stage, "" for the latest version whatever its stage
+
+    Raises:
+        ValueError: if there is no such version
+    """
+    client = MlflowClient()
+    if version:
+        return client.get_model_version(model_name, str(version)).run_id
+    if stage:
+        versions = client.get_latest_versions(model_name, stages=[stage])
+        run_id = versions[0].run_id if versions else None
+    else:
+        run_id = latest_version_run(model_name)
+    if run_id is None:
+        raise ValueError(
+            "{} has no version{}".format(model_name, " in " + stage if stage else "")
+        )
+    return run_id
+
+
+async def _serve(server, host, port):
+    listener = await server.start(host, port)
+    print(
+        "Serving on http://{}:{}/invocations".format(
+            host, listener.sockets[0].getsockname()[1]
+        )
+    )
+    async with listener:
+        await listener.serve_forever()
+
+
+async def _workers_ready(executor, workers):
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(
+        *[loop.run_in_executor(executor, _worker_ready) for _ in range(workers)]
+    )
+
+
+def serve_model(
+    model_name=REGISTERED_MODEL_NAME,
+    version=0,
+    stage="",
+    host="127.0.0.1",
+    port=DEFAULT_PORT,
+    max_batch_size=MAX_BATCH_SIZE,
+    max_wait_ms=MAX_WAIT_MS,
+    workers=-1,
+    cache_size=0,
+    cache_ttl_s=TTL_S,
+):
+    """Serve a version of a registered resale model until interrupted
+
+    Args:
+        model_name, version, stage: version to serve, see `resolve_model_run`.
+            POST /reload resolves them again and swaps the served model if
+            they resolve to another version
+        host, port (str, int): address to listen on
+        max_batch_size, max_wait_ms: see MicroBatcher
+        workers (int): see `make_executor`
+        cache_size (int): rows in the prediction cache, 0 for no cache
+        cache_ttl_s (float): seconds a cached prediction is served
+    """
+    run_id = resolve_model_run(model_name, version, stage)
+    # downloads the artifacts once, before the workers load them
+    model = load_resale_model(run_id)
+    executor, in_flight = make_executor(workers, load_resale_model, run_id)
+    if cache_size > 0:
+        cache = PredictionCache(cache_size, cache_ttl_s)
+        cache.set_version(run_id)
+        batcher = CachedMicroBatcher(
+            model.transformer,
+            cache,
+            score_encoded,
+            executor,
+            max_batch_size,
+            max_wait_ms,
+            in_flight,
+        )
+    else:
+        batcher = MicroBatcher(
+            score_columns, executor, max_batch_size, max_wait_ms, in_flight
+        )
+    served = {"run_id": run_id, "executor": executor}
+
+    async def ready():
+        await _workers_ready(executor, in_flight)
+
+    async def reload():
+        loop = asyncio.get_running_loop()
+        new_run_id = await loop.run_in_executor(
+            None, resolve_model_run, model_name, version, stage
+        )
+        if new_run_id == served["run_id"]:
+            return {"run_id": new_run_id, "reloaded": False}
+        new_model = await loop.run_in_executor(None, load_resale_model, new_run_id)
+        new_executor, _ = make_executor(workers, load_resale_model, new_run_id)
+        await _workers_ready(new_executor, in_flight)
+        # batches already sent to the old workers finish there
+        old_executor = served["executor"]
+        batcher.set_model(new_executor, new_model.transformer, new_run_id)
+        served.update(run_id=new_run_id, executor=new_executor)
+        old_executor.shutdown(wait=False)
+        print("Serving the model of run {}".format(new_run_id))
+        return {"run_id": new_run_id, "reloaded": True}
+
+    try:
+        asyncio.run(_serve(InferenceServer(batcher, ready, reload), host, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        served["executor"].shutdown(cancel_futures=True)
+
+
+@click.command(help="Serve a registered model with micro-batched predictions")
+@click.option("--model-name", type=str, default=REGISTERED_MODEL_NAME)
+@click.option(
+    "--version",
+    type=int,
+    default=0,
+    help="Version to serve, 0 for the latest one in --stage",
+)
+@click.option(
+    "--stage",
+    type=str,
+    default="",
+    help="Stage to serve the latest version of, eg. Production. Empty for the "
+    "latest version whatever its stage",
+)
+@click.option("--host", type=str, default="127.0.0.1")
+@click.option("--port", type=int, default=DEFAULT_PORT)
+@click.option(
+    "--max-batch-size",
+    type=int,
+    default=MAX_BATCH_SIZE,
+    help="Rows of concurrent requests scored together",
+)
+@click.option(
+    "--max-wait-ms",
+    type=float,
+    default=MAX_WAIT_MS,
+    help="Time a request waits for others to join its batch",
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=-1,
+    help="Processes scoring batches, -1 for one per core, 0 to score in the "
+    "server's process",
+)
+@click.option(
+    "--cache-size",
+    type=click.IntRange(0),
+    default=0,
+    help="Encoded rows whose predictions are cached, 0 for no cache",
+)
+@click.option(
+    "--cache-ttl-s",
+    type=float,
+    default=TTL_S,
+    help="Seconds a cached prediction is served",
+)
+def serve(
+    model_name,
+    version,
+    stage,
+    host,
+    port,
+    max_batch_size,
+    max_wait_ms,
+    workers,
+    cache_size,
+    cache_ttl_s,
+):
+    serve_model(
+        model_name,
+        version,
+        stage,
+        host,
+        port,
+        max_batch_size,
+        max_wait_ms,
+        workers,
+        cache_size,
+        cache_ttl_s,
+    )
+
+
+if __name__ == "__main__":
+    serve()
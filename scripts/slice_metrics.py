@@ -0,0 +1,203 @@
+"""
+Error metrics of a model per slice of the test set.
+
+Rows are sliced along each of SLICE_COLUMNS, decoded from the encoded
+features with the FeatureTransformer of the splits, and grouped into cells by
+their slices along all columns. The sums of every slice are then one
+`np.bincount` of the rows into cells followed by small bincounts of the cells
+into slices, whatever the number of slices. A bootstrap replicate of the
+slice MAEs draws the number of times each row is resampled and takes the same
+weighted bincounts; replicates are computed in fixed-size batches, each with
+its own seed, on a pool of processes.
+"""
+
+import os
+import warnings
+from functools import partial
+import numpy as np
+import pandas as pd
+
+SLICE_COLUMNS = ["town", "flat_type", "flat_model", "storey_range", "lease_bucket"]
+LEASE_BUCKET_YEARS = 10
+# replicates per task, so the intervals do not depend on the number of workers
+BOOTSTRAP_BATCH = 25
+
+
+def _onehot_codes(X, categories):
+    # the first category is dropped by the encoding: all zeros
+    block = X[[str(c) for c in categories[1:]]].to_numpy()
+    return np.where(block.any(axis=1), block.argmax(axis=1) + 1, 0)
+
+
+def slice_codes(X, transformer):
+    """Slice of every row along each of SLICE_COLUMNS
+
+    Args:
+        X (pd.DataFrame): features encoded by `transformer`
+        transformer (FeatureTransformer): transformer of the splits
+
+    Returns:
+        codes: (len(SLICE_COLUMNS), len(X)) int array, the slice of each row
+            along each column as an index into its labels
+        labels: column -> label of each code
+    """
+    flat_types = sorted(transformer.flat_type_map, key=transformer.flat_type_map.get)
+    lease_buckets = (
+        X["remaining_lease"].to_numpy().astype(np.int64) // LEASE_BUCKET_YEARS
+    )
+    num_buckets = lease_buckets.max() + 1 if len(X) else 0
+    codes = {
+        "town": _onehot_codes(X, transformer.vocabulary["town"]),
+        "flat_type": X["flat_type"].to_numpy().astype(np.int64),
+        "flat_model": _onehot_codes(X, transformer.vocabulary["flat_model"]),
+        "storey_range": X["storey_range"].to_numpy().astype(np.int64),
+        "lease_bucket": lease_buckets,
+    }
+    labels = {
+        "town": transformer.vocabulary["town"],
+        "flat_type": flat_types,
+        "flat_model": transformer.vocabulary["flat_model"],
+        "storey_range": transformer.vocabulary["storey_range"],
+        "lease_bucket": [
+            "{}-{}".format(b * LEASE_BUCKET_YEARS, (b + 1) * LEASE_BUCKET_YEARS - 1)
+            for b in range(num_buckets)
+        ],
+    }
+    return np.vstack([codes[col] for col in SLICE_COLUMNS]), labels
+
+
+def slice_cells(codes, sizes):
+    """Group rows by their slices along all columns, so per-slice sums are
+    computed from per-cell sums with one bincount over the rows
+
+    Args:
+        codes (np.ndarray): (columns, rows) output of `slice_codes`
+        sizes (list): number of labels of each column
+
+    Returns:
+        cells: cell of every row
+        cell_ids: (columns, cells) global slice id of every cell along every
+            column, the ids of a column following those of the previous one
+    """
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.intp)
+    keys, cells = np.unique(np.ravel_multi_index(codes, sizes), return_inverse=True)
+    cell_ids = np.vstack(np.unravel_index(keys, sizes)) + offsets[:, None]
+    return cells, cell_ids
+
+
+def _slice_sums(cells, cell_ids, weights, num_slices):
+    cell_sums = np.bincount(cells, weights, cell_ids.shape[1])
+    # the ids of each column are a disjoint range, so their sums add up
+    return sum(np.bincount(ids, cell_sums, num_slices) for ids in cell_ids)
+
+
+def _bootstrap_maes(cells, cell_ids, abs_errors, num_slices, num_replicates, seed):
+    rng = np.random.default_rng(seed)
+    num_rows = len(abs_errors)
+    maes = np.empty((num_replicates, num_slices))
+    for i in range(num_replicates):
+        # times each row is drawn when resampling the rows with replacement
+        weights = np.bincount(rng.integers(0, num_rows, num_rows), None, num_rows)
+        counts = _slice_sums(cells, cell_ids, weights, num_slices)
+        sums = _slice_sums(cells, cell_ids, weights * abs_errors, num_slices)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            maes[i] = sums / counts
+    return maes
+
+
+def bootstrap_intervals(
+    cells,
+    cell_ids,
+    abs_errors,
+    num_slices,
+    num_replicates=200,
+    confidence=0.95,
+    workers=1,
+    seed=2023,
+):
+    """Percentile bootstrap intervals of the MAE of every slice
+
+    Args:
+        cells, cell_ids: output of `slice_cells`
+        abs_errors (np.ndarray): absolute error of every row
+        num_slices (int): number of global slice ids
+        num_replicates (int): bootstrap replicates
+        confidence (float): coverage of the intervals
+        workers (int): number of processes, 1 to resample in this process and
+            -1 for all cores
+        seed (int): seed of the resampling
+
+    Returns:
+        low, high: bounds of the interval of each slice, nan if a slice has
+            no rows in any replicate
+    """
+    batches = [
+        min(BOOTSTRAP_BATCH, num_replicates - start)
+        for start in range(0, num_replicates, BOOTSTRAP_BATCH)
+    ]
+    seeds = np.random.SeedSequence(seed).spawn(len(batches))
+    resample = partial(_bootstrap_maes, cells, cell_ids, abs_errors, num_slices)
+    if workers < 0:
+        workers = os.cpu_count()
+    if workers <= 1:
+        maes = list(map(resample, batches, seeds))
+    else:
+        from utils import process_pool
+
+        with process_pool(workers) as executor:
+            maes = list(executor.map(resample, batches, seeds))
+    tail = (1 - confidence) / 2 * 100
+    with warnings.catch_warnings():
+        # slices without rows are nan in every replicate
+        warnings.simplefilter("ignore", RuntimeWarning)
+        low, high = np.nanpercentile(np.vstack(maes), [tail, 100 - tail], axis=0)
+    return low, high
+
+
+def sliced_metrics(X, y, predictions, transformer, num_replicates=200, workers=1):
+    """Error metrics of the predictions in every slice along SLICE_COLUMNS
+
+    Args:
+        X (pd.DataFrame): features encoded by `transformer`
+        y (np.ndarray): target
+        predictions (np.ndarray): predictions of the model on X
+        transformer (FeatureTransformer): transformer of the splits
+        num_replicates (int): bootstrap replicates of the MAE intervals, 0 to
+            skip them
+        workers (int): processes computing the replicates, -1 for all cores
+
+    Returns:
+        table: one row per non-empty slice with its column, value, count,
+            mae, mae_low and mae_high (95% interval) and bias (mean of
+            prediction - target)
+    """
+    codes, labels = slice_codes(X, transformer)
+    sizes = [len(labels[col]) for col in SLICE_COLUMNS]
+    cells, cell_ids = slice_cells(codes, sizes)
+    num_slices = sum(sizes)
+
+    errors = np.asarray(predictions, dtype=np.float64) - np.asarray(y, np.float64)
+    abs_errors = np.abs(errors)
+    counts = _slice_sums(cells, cell_ids, None, num_slices)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        maes = _slice_sums(cells, cell_ids, abs_errors, num_slices) / counts
+        biases = _slice_sums(cells, cell_ids, errors, num_slices) / counts
+    if num_replicates:
+        low, high = bootstrap_intervals(
+            cells, cell_ids, abs_errors, num_slices, num_replicates, workers=workers
+        )
+    else:
+        low = high = np.full(num_slices, np.nan)
+
+    table = pd.DataFrame(
+        {
+            "column": np.repeat(SLICE_COLUMNS, sizes),
+            "value": [str(label) for col in SLICE_COLUMNS for label in labels[col]],
+            "count": counts.astype(np.int64),
+            "mae": maes,
+            "mae_low": low,
+            "mae_high": high,
+            "bias": biases,
+        }
+    )
+    return table[table["count"] > 0].reset_index(drop=True)
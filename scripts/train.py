@@ -1,18 +1,246 @@
 import logging
-import hashlib
-from urllib.parse import unquote, urlparse
-import os
-import sys
 from typing import Literal, Union, Any
 import mlflow
-from mlflow.models.signature import infer_signature
 import click
-import pandas as pd
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.metrics import mean_absolute_error
+from feature_transformer import find_transformer
+from run_logger import run_logger
+from tree_ensemble import log_flat_model
+from utils import (
+    ENGINES,
+    FEATURE_MATRICES,
+    StagedBoostingRegressor,
+    load_split,
+    local_artifact,
+    step_run,
+    to_csr,
+)
+
+
+def make_estimator(
+    engine,
+    n_estimators,
+    max_features,
+    max_depth,
+    min_samples_split,
+    min_samples_leaf,
+):
+    """Unfitted regressor of a training engine
+
+    "rf_mae" is a random forest with the absolute error criterion, whose split
+    search is close to quadratic in the rows of a node. "rf_mse" is the same
+    forest with the squared error criterion. "hgb" is histogram-based gradient
+    boosting with the absolute error loss, with `n_estimators` boosting
+    iterations; it has no `max_features` or `min_samples_split`.
+
+    Args:
+        engine (str): one of ENGINES
+        n_estimators, max_features, max_depth, min_samples_split,
+        min_samples_leaf: RandomForestRegressor hyperparameters
+
+    Returns:
+        estimator: unfitted sklearn regressor
+    """
+    if engine == "hgb":
+        from sklearn.ensemble import HistGradientBoostingRegressor
+
+        return HistGradientBoostingRegressor(
+            loss="absolute_error",
+            max_iter=n_estimators,
+            max_depth=max_depth,
+            min_samples_leaf=min_samples_leaf,
+            early_stopping=False,
+            random_state=2023,
+        )
+    if engine not in ("rf_mae", "rf_mse"):
+        raise ValueError("Unknown engine `{}`".format(engine))
+
+    from sklearn.ensemble import RandomForestRegressor
+
+    return RandomForestRegressor(
+        n_estimators=n_estimators,
+        max_features=max_features,
+        max_depth=max_depth,
+        min_samples_split=min_samples_split,
+        min_samples_leaf=min_samples_leaf,
+        criterion="absolute_error" if engine == "rf_mae" else "squared_error",
+        n_jobs=-1,
+        random_state=2023,
+    )
+
 
+def continue_training(estimator, X, y, n_estimators, max_estimators=0):
+    """Add trees or boosting iterations fitted on new rows to a fitted
+    regressor, so the cost is proportional to the new rows rather than to all
+    the rows it was fitted on so far
 
-@click.command(help="Trains a random forest regressor")
+    A forest grows `n_estimators` more trees on (X, y) next to its existing
+    ones, then retires its oldest trees beyond `max_estimators`. Gradient
+    boosting gets a new stage of `n_estimators` iterations, with the
+    hyperparameters of its first one, fitted to the residuals of (X, y).
+    sklearn's own warm start would bin the new rows anew and compute the
+    residuals of the existing trees from bin indices they did not split on.
+
+    Args:
+        estimator: regressor fitted by `train_model`. A forest is updated in
+            place.
+        X, y: new rows
+        n_estimators (int): trees or boosting iterations to add
+        max_estimators (int): most recent trees a forest keeps, 0 to keep all.
+            Boosting iterations correct the previous ones and are never
+            retired.
+
+    Returns:
+        estimator: the updated regressor, a StagedBoostingRegressor for
+            gradient boosting
+    """
+    from sklearn.base import clone
+    from sklearn.ensemble import HistGradientBoostingRegressor, RandomForestRegressor
+
+    if isinstance(estimator, HistGradientBoostingRegressor):
+        estimator = StagedBoostingRegressor([estimator])
+    if isinstance(estimator, StagedBoostingRegressor):
+        if max_estimators:
+            raise ValueError("Boosting iterations cannot be retired")
+        stage = clone(estimator.stages[0]).set_params(max_iter=n_estimators)
+        stage.fit(X, y - estimator.predict(X))
+        return StagedBoostingRegressor(estimator.stages + [stage])
+    if not isinstance(estimator, RandomForestRegressor):
+        raise ValueError(
+            "Cannot continue training a {}".format(type(estimator).__name__)
+        )
+
+    estimator.set_params(
+        warm_start=True, n_estimators=len(estimator.estimators_) + n_estimators
+    )
+    estimator.fit(X, y)
+    estimator.set_params(warm_start=False)
+    if max_estimators and len(estimator.estimators_) > max_estimators:
+        estimator.estimators_ = estimator.estimators_[-max_estimators:]
+        estimator.set_params(n_estimators=max_estimators)
+    return estimator
+
+
+def train_model(
+    train,
+    validation,
+    n_estimators,
+    max_features,
+    max_depth,
+    min_samples_split,
+    min_samples_leaf,
+    transformer_path=None,
+    feature_matrix="dense",
+    engine="rf_mae",
+    base_model=None,
+    max_estimators=0,
+):
+    """Fit a regressor and log it with its metrics.
+    Must be called inside an active run.
+
+    Args:
+        train (pd.DataFrame): train split with `resale_price` column
+        validation (pd.DataFrame): validation split with `resale_price` column
+        n_estimators, max_features, max_depth, min_samples_split,
+        min_samples_leaf: RandomForestRegressor hyperparameters
+        transformer_path (str): saved FeatureTransformer of the splits. If
+            given, the regressor is also logged with it as a pyfunc model
+            that takes raw resale rows, see resale_model.py
+        feature_matrix (str): "dense" to fit on the dataframe, "csr" to fit
+            on a sparse matrix that keeps the one-hot features compact. The
+            regressor then has no `feature_names_in_`.
+        engine (str): regressor to fit, see `make_estimator`
+        base_model: fitted regressor to continue training on the train split
+            instead of fitting a new one, see `continue_training`. It keeps its
+            hyperparameters and `n_estimators` trees or iterations are added.
+        max_estimators (int): most recent trees a continued forest keeps, 0 to
+            keep all
+
+    Returns:
+        estimator: fitted regressor
+    """
+    from mlflow.models.signature import infer_signature
+    from sklearn.metrics import mean_absolute_error
+
+    if engine == "hgb" and feature_matrix == "csr":
+        raise ValueError("The hgb engine does not fit on sparse matrices")
+
+    logger = logging.getLogger()
+
+    y_train = train[["resale_price"]]
+    X_train = train.drop("resale_price", axis=1)
+    y_validation = validation[["resale_price"]]
+    X_validation = validation.drop("resale_price", axis=1)
+
+    if feature_matrix == "csr":
+        X_train_fit, X_validation_fit = to_csr(X_train), to_csr(X_validation)
+    else:
+        X_train_fit, X_validation_fit = X_train, X_validation
+    if base_model is not None:
+        logger.debug("Adding {} estimators to the base regressor".format(n_estimators))
+        estimator = continue_training(
+            base_model,
+            X_train_fit,
+            y_train.values.ravel(),
+            n_estimators,
+            max_estimators,
+        )
+    else:
+        estimator = make_estimator(
+            engine,
+            n_estimators,
+            max_features,
+            max_depth,
+            min_samples_split,
+            min_samples_leaf,
+        )
+        logger.debug("Fitting {} regressor".format(engine))
+        estimator.fit(X_train_fit, y_train.values.ravel())
+    train_mae = mean_absolute_error(y_train, estimator.predict(X_train_fit))
+    validation_mae = mean_absolute_error(
+        y_validation, estimator.predict(X_validation_fit)
+    )
+    logger.info("Train MAE: %.2f" % train_mae)
+    logger.info("Validation MAE: %.2f" % validation_mae)
+    run_logger().log_metrics({"train_mae": train_mae, "validation_mae": validation_mae})
+    signature = infer_signature(X_validation, estimator.predict(X_validation_fit))
+    model_uri = run_logger().log_model(
+        mlflow.sklearn.save_model,
+        "model",
+        sk_model=estimator,
+        signature=signature,
+        # input_example=X_train.iloc[0]
+    )
+    log_flat_model(estimator)
+    if transformer_path is not None:
+        from resale_model import log_resale_model
+
+        log_resale_model(model_uri, transformer_path)
+
+    return estimator
+
+
+def load_base_model(base_run):
+    """Regressor logged by a `train` run, to continue training it"""
+    logging.getLogger().info("Continuing training of train run {}".format(base_run))
+    run_logger().set_tag("base_run", base_run)
+    return mlflow.sklearn.load_model(local_artifact("runs:/{}/model".format(base_run)))
+
+
+def tuned_hyperparameters(hyperparameters, tune_run):
+    """Override hyperparameters with the best configuration of a `tune` run
+    and log the result, as the run's params hold the values passed in"""
+    from tune import load_best_params
+
+    logger = logging.getLogger()
+
+    hyperparameters = dict(hyperparameters, **load_best_params(tune_run))
+    logger.info("Using the best configuration of tune run {}".format(tune_run))
+    run_logger().set_tag("tune_run", tune_run)
+    run_logger().log_dict(hyperparameters, "hyperparameters.json")
+    return hyperparameters
+
+
+@click.command(help="Trains a regressor, a random forest by default")
 @click.option("--datadir", type=str)
 @click.option("--n-estimators", type=int, default=10)  # change to 100!
 @click.option(
@@ -21,73 +249,77 @@ from sklearn.metrics import mean_absolute_error
 @click.option("--max-depth", type=click.IntRange(1), default=click.types.UNPROCESSED)
 @click.option("--min-samples-split", type=int, default=2)
 @click.option("--min-samples-leaf", type=int, default=1)
+@click.option(
+    "--feature-matrix",
+    type=click.Choice(FEATURE_MATRICES),
+    default="dense",
+    help="Fit on the dataframe or on a sparse CSR matrix",
+)
+@click.option(
+    "--engine",
+    type=click.Choice(ENGINES),
+    default="rf_mae",
+    help="Random forest with absolute or squared error criterion, or "
+    "histogram-based gradient boosting with absolute error loss",
+)
+@click.option(
+    "--tune-run",
+    type=str,
+    default="",
+    help="Run id of a `tune` run whose best configuration overrides the hyperparameters",
+)
+@click.option(
+    "--base-run",
+    type=str,
+    default="",
+    help="Run id of a `train` run whose regressor gets --n-estimators more trees "
+    "fitted on the train split, instead of fitting a new regressor",
+)
+@click.option(
+    "--max-estimators",
+    type=click.IntRange(0),
+    default=0,
+    help="Most recent trees a continued forest keeps, 0 to keep all",
+)
 def train(
-    datadir, n_estimators, max_features, max_depth, min_samples_split, min_samples_leaf
+    datadir,
+    n_estimators,
+    max_features,
+    max_depth,
+    min_samples_split,
+    min_samples_leaf,
+    feature_matrix,
+    engine,
+    tune_run,
+    base_run,
+    max_estimators,
 ):
-    with mlflow.start_run() as mlrun:
-        artifact_uri = mlrun.info.artifact_uri
-
-        # logging
+    with step_run("train"):
         logger = logging.getLogger()
-        logger.setLevel(logging.DEBUG)
-        logging.captureWarnings(True)
-        formatter = logging.Formatter(
-            "%(asctime)s - %(levelname)s - %(message)s", "%Y-%m-%d %H:%M:%S"
-        )
+        hyperparameters = {
+            "n_estimators": n_estimators,
+            "max_features": max_features,
+            "max_depth": max_depth,
+            "min_samples_split": min_samples_split,
+            "min_samples_leaf": min_samples_leaf,
+        }
+        if tune_run:
+            hyperparameters = tuned_hyperparameters(hyperparameters, tune_run)
 
-        file_handler = logging.FileHandler(
-            unquote(urlparse(os.path.join(artifact_uri, "log.log")).path)
-        )
-        file_handler.setLevel(logging.DEBUG)
-        file_handler.setFormatter(formatter)
-
-        stdout_handler = logging.StreamHandler(sys.stdout)
-        stdout_handler.setLevel(logging.DEBUG)
-        stdout_handler.setFormatter(formatter)
-
-        logger.addHandler(file_handler)
-        logger.addHandler(stdout_handler)
-
-        # hash current file and log it as artifact
-        curr_file_hash = hashlib.md5(open("scripts/train.py", "rb").read()).hexdigest()
-        mlflow.log_text(curr_file_hash, "entrypoint_hash/hash.txt")
-
-        train_path = os.path.join(datadir, "train.csv")
-        validation_path = os.path.join(datadir, "validation.csv")
-        logger.info("Reading train data from {}".format(train_path))
-        train = pd.read_csv(train_path)
-        logger.info("Reading validation data from {}".format(validation_path))
-        validation = pd.read_csv(validation_path)
-
-        y_train = train[["resale_price"]]
-        X_train = train.drop("resale_price", axis=1)
-        y_validation = validation[["resale_price"]]
-        X_validation = validation.drop("resale_price", axis=1)
-
-        rfr = RandomForestRegressor(
-            n_estimators=n_estimators,
-            max_features=max_features,
-            max_depth=max_depth,
-            min_samples_split=min_samples_split,
-            min_samples_leaf=min_samples_leaf,
-            criterion="absolute_error",
-            n_jobs=-1,
-            random_state=2023,
-        )
-        logger.debug("Fitting random forest regressor")
-        rfr.fit(X_train, y_train.values.ravel())
-        train_mae = mean_absolute_error(y_train, rfr.predict(X_train))
-        validation_mae = mean_absolute_error(y_validation, rfr.predict(X_validation))
-        logger.info("Train MAE: %.2f" % train_mae)
-        logger.info("Validation MAE: %.2f" % validation_mae)
-        mlflow.log_metric("train_mae", train_mae)
-        mlflow.log_metric("validation_mae", validation_mae)
-        signature = infer_signature(X_validation, rfr.predict(X_validation))
-        mlflow.sklearn.log_model(
-            rfr,
-            "model",
-            signature=signature,
-            # input_example=X_train.iloc[0]
+        logger.info("Reading train data from {}".format(datadir))
+        train = load_split(datadir, "train")
+        logger.info("Reading validation data from {}".format(datadir))
+        validation = load_split(datadir, "validation")
+
+        train_model(
+            train,
+            validation,
+            **hyperparameters,
+            transformer_path=find_transformer(datadir),
+            feature_matrix=feature_matrix,
+            engine=engine,
+            base_model=load_base_model(base_run) if base_run else None,
+            max_estimators=max_estimators,
         )
 
 
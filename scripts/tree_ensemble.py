@@ -0,0 +1,347 @@
+"""
+Array format of the tree ensembles fitted by `train`, and its predictor.
+
+The nodes of all the trees of a random forest or of histogram gradient
+boosting are flattened into contiguous arrays (split feature, threshold,
+children, leaf value, cover) saved as .npy files, so loading a model is
+memory-mapping a few files instead of unpickling an object per tree. The
+predictor walks every tree for a batch of rows at once with NumPy, one tree
+level per step, or row by row with a numba kernel for large batches, and adds
+the leaf values of the trees in the order sklearn does, so its predictions are
+equal to the estimator's `predict`.
+"""
+
+import json
+import os
+from functools import lru_cache
+import numpy as np
+
+try:
+    # optional dependency, installed with shap
+    import numba
+except ImportError:
+    numba = None
+
+FLAT_MODEL_PATH = "flat_model"
+SPEC_FILENAME = "ensemble.json"
+NODE_DTYPES = {
+    "feature": np.intp,
+    "threshold": np.float64,
+    "children": np.intp,
+    "value": np.float64,
+    "cover": np.float64,
+    "missing_left": bool,
+}
+# rows walked at once, the walk holds a few (trees, rows) index arrays
+BATCH_NODES = 2**22
+# batches from this many rows are predicted with a compiled kernel, whose
+# compile or cache load cost is only worth it for large batches
+COMPILED_MIN_ROWS = 10000
+
+
+class FlatTreeEnsemble:
+    """Tree ensemble stored as node arrays
+
+    Node i of the concatenated trees splits on `feature[i]`: rows with a
+    value <= `threshold[i]` (or missing, if `missing_left[i]`) go to node
+    `children[i, 0]`, the others to `children[i, 1]`. Leaves are their own
+    children, so a walk of `max_depth` steps ends in a leaf from any root.
+
+    Args:
+        arrays (dict): node arrays of NODE_DTYPES and `roots`, the first node
+            of each tree
+        kind (str): "forest" averages the leaf values of the trees,
+            "boosting" adds them to `baseline`
+        max_depth (int): depth of the deepest tree
+        input_dtype (str): dtype the estimator casts the features to before
+            comparing them to the thresholds
+        baseline (float): initial prediction of a boosting ensemble
+        feature_names (list): features the estimator was fitted on, None if
+            it was fitted without names
+    """
+
+    def __init__(
+        self,
+        arrays,
+        kind,
+        max_depth,
+        input_dtype,
+        baseline=0.0,
+        feature_names=None,
+    ):
+        self.arrays = arrays
+        self.kind = kind
+        self.max_depth = max_depth
+        self.input_dtype = input_dtype
+        self.baseline = baseline
+        self.feature_names = feature_names
+
+    @classmethod
+    def from_estimator(cls, estimator):
+        """Flatten a fitted RandomForestRegressor, HistGradientBoostingRegressor
+        or StagedBoostingRegressor"""
+        from sklearn.ensemble import (
+            HistGradientBoostingRegressor,
+            RandomForestRegressor,
+        )
+        from utils import StagedBoostingRegressor
+
+        names = getattr(estimator, "feature_names_in_", None)
+        names = None if names is None else [str(name) for name in names]
+        if isinstance(estimator, RandomForestRegressor):
+            trees = [tree.tree_ for tree in estimator.estimators_]
+            nodes = [
+                {
+                    "feature": tree.feature,
+                    "threshold": tree.threshold,
+                    "children": np.column_stack(
+                        [tree.children_left, tree.children_right]
+                    ),
+                    "value": tree.value[:, 0, 0],
+                    "cover": tree.weighted_n_node_samples,
+                    "missing_left": np.zeros(tree.node_count, dtype=bool),
+                }
+                for tree in trees
+            ]
+            max_depth = max(tree.max_depth for tree in trees)
+            return cls(_concatenate(nodes), "forest", max_depth, "float32", 0.0, names)
+        if isinstance(estimator, HistGradientBoostingRegressor):
+            estimator = StagedBoostingRegressor([estimator])
+        if isinstance(estimator, StagedBoostingRegressor):
+            if any(stage.is_categorical_ is not None for stage in estimator.stages):
+                raise ValueError("Categorical splits are not supported")
+            # the trees of later stages follow those of earlier ones
+            predictors = [
+                predictors[0].nodes
+                for stage in estimator.stages
+                for predictors in stage._predictors
+            ]
+            nodes = [
+                {
+                    "feature": tree["feature_idx"],
+                    "threshold": tree["num_threshold"],
+                    "children": np.where(
+                        tree["is_leaf"][:, None],
+                        -1,
+                        np.column_stack([tree["left"], tree["right"]]),
+                    ),
+                    "value": tree["value"],
+                    "cover": tree["count"],
+                    "missing_left": tree["missing_go_to_left"].astype(bool),
+                }
+                for tree in predictors
+            ]
+            max_depth = max(int(tree["depth"].max()) for tree in predictors)
+            baseline = sum(
+                float(stage._baseline_prediction.ravel()[0])
+                for stage in estimator.stages
+            )
+            return cls(
+                _concatenate(nodes), "boosting", max_depth, "float64", baseline, names
+            )
+        raise ValueError("Cannot flatten a {}".format(type(estimator).__name__))
+
+    @property
+    def num_trees(self):
+        return len(self.arrays["roots"])
+
+    def predict(self, X):
+        """Predictions of the ensemble, equal to those of the estimator
+
+        Args:
+            X: pd.DataFrame, np.ndarray or scipy sparse matrix of features
+
+        Returns:
+            predictions: float64 array
+        """
+        if self.feature_names is not None and hasattr(X, "columns"):
+            X = X[self.feature_names]
+        if X.shape[0] >= COMPILED_MIN_ROWS:
+            kernel = _compiled_kernel()
+            if kernel is not None:
+                return self._predict_compiled(kernel, X)
+        batch_size = max(1, BATCH_NODES // self.num_trees)
+        return np.concatenate(
+            [
+                self._predict_batch(X[start : start + batch_size])
+                for start in range(0, X.shape[0], batch_size)
+            ]
+            or [np.empty(0)]
+        )
+
+    def _predict_batch(self, X):
+        a = self.arrays
+        if hasattr(X, "toarray"):
+            X = X.toarray()
+        X = np.asarray(X, dtype=self.input_dtype)
+        rows = np.arange(len(X))
+        nodes = np.repeat(a["roots"][:, None], len(X), axis=1)
+        for _ in range(self.max_depth):
+            values = X[rows, a["feature"][nodes]]
+            go_left = np.where(
+                np.isnan(values),
+                a["missing_left"][nodes],
+                values <= a["threshold"][nodes],
+            )
+            nodes = a["children"][nodes, (~go_left).astype(np.intp)]
+        leaf_values = a["value"][nodes]
+        # add the trees one after another, in sklearn's order
+        predictions = np.full(len(X), self.baseline)
+        for tree_values in leaf_values:
+            predictions += tree_values
+        if self.kind == "forest":
+            predictions /= self.num_trees
+        return predictions
+
+    def _predict_compiled(self, kernel, X):
+        a = self.arrays
+        if hasattr(X, "toarray"):
+            X = X.toarray()
+        X = np.asarray(X, dtype=self.input_dtype)
+        # unsigned views of the indices spare numba the checks for negative
+        # indices
+        return kernel(
+            X,
+            a["feature"].view(np.uintp),
+            a["threshold"],
+            a["children"].view(np.uintp),
+            a["value"],
+            a["missing_left"],
+            a["roots"].view(np.uintp),
+            self.baseline,
+            self.kind == "forest",
+        )
+
+    def shap_model(self):
+        """Trees in the dict format of `shap.TreeExplainer`, the leaf values
+        of a forest scaled so the SHAP values add up to `predict`"""
+        a = self.arrays
+        bounds = list(a["roots"]) + [len(a["value"])]
+        scaling = 1 / self.num_trees if self.kind == "forest" else 1.0
+        trees = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            children = np.asarray(a["children"][start:end])
+            is_leaf = children[:, 0] == np.arange(start, end)
+            # shap marks leaves with -1 children and tree-local indices
+            children = np.where(is_leaf[:, None], -1, children - start)
+            trees.append(
+                {
+                    "children_left": children[:, 0],
+                    "children_right": children[:, 1],
+                    "children_default": np.where(
+                        a["missing_left"][start:end], children[:, 0], children[:, 1]
+                    ),
+                    "feature": np.where(is_leaf, -2, a["feature"][start:end]),
+                    "threshold": np.asarray(a["threshold"][start:end]),
+                    "value": a["value"][start:end, None] * scaling,
+                    "node_sample_weight": np.asarray(a["cover"][start:end]),
+                }
+            )
+        return {
+            "trees": trees,
+            "base_offset": self.baseline,
+            "tree_output": "raw_value",
+            "objective": "squared_error",
+            "input_dtype": np.dtype(self.input_dtype).type,
+            "internal_dtype": np.float64,
+        }
+
+    def to_dict(self):
+        return {
+            "kind": self.kind,
+            "max_depth": self.max_depth,
+            "input_dtype": self.input_dtype,
+            "baseline": self.baseline,
+            "feature_names": self.feature_names,
+        }
+
+    def save(self, path):
+        """Save the node arrays as .npy files and the rest as JSON in `path`"""
+        os.makedirs(path, exist_ok=True)
+        for name, array in self.arrays.items():
+            np.save(os.path.join(path, name + ".npy"), array)
+        with open(os.path.join(path, SPEC_FILENAME), "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        """Load a saved ensemble, memory-mapping its node arrays"""
+        with open(os.path.join(path, SPEC_FILENAME), "r") as f:
+            spec = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode)
+            for name in list(NODE_DTYPES) + ["roots"]
+        }
+        return cls(arrays, **spec)
+
+
+def _concatenate(trees):
+    # one array per field with global node indices, leaves being their own
+    # children
+    sizes = [len(tree["value"]) for tree in trees]
+    roots = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.intp)
+    arrays = {
+        name: np.concatenate([tree[name] for tree in trees]).astype(dtype)
+        for name, dtype in NODE_DTYPES.items()
+    }
+    is_leaf = arrays["children"][:, 0] < 0
+    arrays["children"] = np.where(
+        is_leaf[:, None],
+        np.arange(len(is_leaf))[:, None],
+        arrays["children"] + np.repeat(roots, sizes)[:, None],
+    )
+    arrays["feature"][is_leaf] = 0
+    arrays["roots"] = roots
+    return arrays
+
+
+def _predict_rows(
+    X, feature, threshold, children, value, missing_left, roots, baseline, average
+):
+    # all rows walk a tree before the next one, as in sklearn, so the nodes
+    # of the tree stay in cache
+    num_rows = X.shape[0]
+    predictions = np.full(num_rows, baseline)
+    for root in roots:
+        for i in numba.prange(num_rows):
+            node = root
+            while children[node, 0] != node:
+                x = X[i, feature[node]]
+                go_left = x <= threshold[node] or (missing_left[node] and np.isnan(x))
+                node = children[node, 0] if go_left else children[node, 1]
+            predictions[i] += value[node]
+    if average:
+        predictions /= len(roots)
+    return predictions
+
+
+@lru_cache(maxsize=1)
+def _compiled_kernel():
+    if numba is None:
+        return None
+    # the cache records the name of this module, which must be imported as
+    # `tree_ensemble` to load it, as the steps, tests and benchmarks do
+    return numba.njit(parallel=True, cache=True)(_predict_rows)
+
+
+def log_flat_model(estimator, artifact_path=FLAT_MODEL_PATH):
+    """Flatten a fitted tree ensemble and log it to the active run"""
+    from run_logger import run_logger
+
+    with run_logger().staging_dir(artifact_path) as tmpdir:
+        FlatTreeEnsemble.from_estimator(estimator).save(tmpdir)
+
+
+def load_model(model_uri):
+    """Regressor logged by `train` at `model_uri`: its flat ensemble if one
+    was logged next to it, else the unpickled sklearn model"""
+    import mlflow
+    from utils import local_artifact, local_path
+
+    try:
+        path = local_path(os.path.dirname(model_uri.rstrip("/")), FLAT_MODEL_PATH)
+    except mlflow.exceptions.MlflowException:
+        path = None
+    if path is None or not os.path.exists(os.path.join(path, SPEC_FILENAME)):
+        return mlflow.sklearn.load_model(local_artifact(model_uri))
+    return FlatTreeEnsemble.load(path)
@@ -0,0 +1,229 @@
+"""
+Hyperparameter search for the regressor of a `train` engine.
+
+Samples candidate configurations and evaluates them with k-fold CV and
+successive halving: every iteration fits the remaining candidates on `factor`
+times more training rows and keeps the best 1/`factor` of them. The folds and
+candidates of an iteration are fitted concurrently on a joblib process pool,
+which reads the training matrix from a memory-mapped .npy file instead of
+receiving a pickled copy per task. Each trial is logged as a run nested under
+the tune run, and the best configuration is logged as `best_params.json` for
+`train --tune-run`.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import time
+import click
+import mlflow
+import numpy as np
+from mlflow.entities import Metric, Param, RunTag
+from mlflow.tracking import MlflowClient
+from mlflow.utils import mlflow_tags
+from run_logger import run_logger
+from utils import ENGINES, load_split, local_artifact, step_run
+
+BEST_PARAMS_PATH = "best_params.json"
+# values of the `train.make_estimator` hyperparameters, those an engine has
+# are searched
+PARAM_DISTRIBUTIONS = {
+    "n_estimators": [10, 25, 50, 100, 200],
+    "max_depth": [1, 2, 4, 8, 16, 32],
+    "max_features": ["sqrt", "log2", None],
+    "min_samples_split": [2, 5, 10, 20],
+    "min_samples_leaf": [1, 2, 5, 10],
+}
+# estimator parameter set by each `make_estimator` hyperparameter, by engine
+ESTIMATOR_PARAMS = {
+    "rf_mae": {name: name for name in PARAM_DISTRIBUTIONS},
+    "rf_mse": {name: name for name in PARAM_DISTRIBUTIONS},
+    "hgb": {
+        "n_estimators": "max_iter",
+        "max_depth": "max_depth",
+        "min_samples_leaf": "min_samples_leaf",
+    },
+}
+
+
+def search_space(engine):
+    """Unfitted estimator of an engine and the distributions of its
+    parameters to search
+
+    Returns:
+        estimator, param_distributions: the `make_estimator` regressor, fitting
+            on one core, and PARAM_DISTRIBUTIONS keyed by its parameter names
+    """
+    from train import make_estimator
+
+    estimator = make_estimator(engine, 100, "sqrt", None, 2, 1)
+    if "n_jobs" in estimator.get_params():
+        # the search runs folds and candidates concurrently
+        estimator.set_params(n_jobs=1)
+    param_distributions = {
+        param: PARAM_DISTRIBUTIONS[name]
+        for name, param in ESTIMATOR_PARAMS[engine].items()
+    }
+    return estimator, param_distributions
+
+
+def memmap_features(train, workdir):
+    """Write the features and target of a split to .npy files in `workdir` and
+    open them memory-mapped, so pool workers share the pages of one copy
+
+    Returns:
+        X, y: read-only memory-mapped feature matrix and target
+    """
+    arrays = {
+        "X": train.drop("resale_price", axis=1).to_numpy(dtype=np.float64),
+        "y": train["resale_price"].to_numpy(dtype=np.float64),
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(workdir, name + ".npy"), array)
+    return tuple(
+        np.load(os.path.join(workdir, name + ".npy"), mmap_mode="r") for name in arrays
+    )
+
+
+def _log_trials(cv_results, parent_run):
+    # one nested run per (iteration, candidate), logged with a single batch
+    client = MlflowClient()
+    timestamp = int(time.time() * 1000)
+    for i, params in enumerate(cv_results["params"]):
+        trial = client.create_run(
+            parent_run.info.experiment_id,
+            tags={
+                mlflow_tags.MLFLOW_PARENT_RUN_ID: parent_run.info.run_id,
+                mlflow_tags.MLFLOW_RUN_NAME: "trial-{}".format(i),
+            },
+        )
+        metrics = {
+            "cv_mae": -cv_results["mean_test_score"][i],
+            "cv_mae_std": cv_results["std_test_score"][i],
+            "mean_fit_time": cv_results["mean_fit_time"][i],
+        }
+        client.log_batch(
+            trial.info.run_id,
+            metrics=[Metric(k, float(v), timestamp, 0) for k, v in metrics.items()],
+            params=[Param(k, str(v)) for k, v in params.items()],
+            tags=[
+                RunTag("iteration", str(cv_results["iter"][i])),
+                RunTag("n_resources", str(cv_results["n_resources"][i])),
+            ],
+        )
+        client.set_terminated(trial.info.run_id)
+
+
+def tune_model(
+    X,
+    y,
+    n_candidates=20,
+    cv=3,
+    factor=3,
+    workers=-1,
+    engine="rf_mae",
+    random_state=2023,
+):
+    """Search the hyperparameters of an engine with successive halving and log
+    the trials and the best configuration. Must be called inside an active run.
+
+    Args:
+        X, y (np.ndarray): training features and target, ideally memory-mapped
+            (see `memmap_features`)
+        n_candidates (int): configurations sampled from PARAM_DISTRIBUTIONS
+        cv (int): number of folds
+        factor (int): growth of the rows and reduction of the candidates at
+            each iteration
+        workers (int): processes fitting folds and candidates, -1 for all cores
+        engine (str): one of ENGINES, as in `train`
+        random_state (int): seed of the sampling and the folds
+
+    Returns:
+        best_params: best configuration, keyword arguments of
+            `train.train_model` the engine uses
+    """
+    from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+    from sklearn.model_selection import HalvingRandomSearchCV, KFold
+
+    logger = logging.getLogger()
+
+    estimator, param_distributions = search_space(engine)
+    search = HalvingRandomSearchCV(
+        estimator,
+        param_distributions,
+        n_candidates=n_candidates,
+        factor=factor,
+        cv=KFold(cv, shuffle=True, random_state=random_state),
+        scoring="neg_mean_absolute_error",
+        refit=False,
+        n_jobs=workers,
+        random_state=random_state,
+    )
+    logger.info(
+        "Searching {} {} candidates with {}-fold CV on {} rows".format(
+            n_candidates, engine, cv, len(X)
+        )
+    )
+    start = time.perf_counter()
+    search.fit(X, y)
+    search_s = time.perf_counter() - start
+
+    cv_results = search.cv_results_
+    _log_trials(cv_results, mlflow.active_run())
+    best_params = {
+        name: search.best_params_[param]
+        for name, param in ESTIMATOR_PARAMS[engine].items()
+    }
+    best_mae = -search.best_score_
+    logger.info("Best CV MAE: %.2f with %s" % (best_mae, best_params))
+    run_logger().log_metrics(
+        {
+            "best_cv_mae": best_mae,
+            "search_s": search_s,
+            "trials_per_s": len(cv_results["params"]) / search_s,
+        }
+    )
+    run_logger().log_params({"best_" + k: v for k, v in best_params.items()})
+    run_logger().log_dict(best_params, BEST_PARAMS_PATH)
+    return best_params
+
+
+def load_best_params(run_id):
+    """Best configuration logged by a tune run"""
+    with open(local_artifact("runs:/{}/{}".format(run_id, BEST_PARAMS_PATH))) as f:
+        return json.load(f)
+
+
+@click.command(help="Search the hyperparameters of an engine with successive halving")
+@click.option("--datadir", type=str)
+@click.option("--n-candidates", type=click.IntRange(1), default=20)
+@click.option("--cv", type=click.IntRange(2), default=3)
+@click.option("--factor", type=click.IntRange(2), default=3)
+@click.option(
+    "--workers",
+    type=int,
+    default=-1,
+    help="Processes fitting folds and candidates concurrently, -1 for all cores",
+)
+@click.option(
+    "--engine",
+    type=click.Choice(ENGINES),
+    default="rf_mae",
+    help="Regressor whose hyperparameters are searched, as in `train`",
+)
+@click.option("--random-state", type=int, default=2023)
+def tune(datadir, n_candidates, cv, factor, workers, engine, random_state):
+    with step_run("tune"):
+        logger = logging.getLogger()
+
+        logger.info("Reading train data from {}".format(datadir))
+        train = load_split(datadir, "train")
+        with tempfile.TemporaryDirectory() as workdir:
+            X, y = memmap_features(train, workdir)
+            del train
+            tune_model(X, y, n_candidates, cv, factor, workers, engine, random_state)
+
+
+if __name__ == "__main__":
+    tune()
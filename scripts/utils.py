@@ -1,33 +1,460 @@
 import logging
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import sys
 import warnings
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import NamedTuple
+from urllib.parse import unquote, urlparse
+import mlflow
+import numpy as np
 import pandas as pd
-from sklearn.preprocessing import OneHotEncoder
 from mlflow import MlflowClient
+from mlflow.utils import mlflow_tags
 
 
-def onehotencode(df, col: str):
-    """One-hot encode a column in a dataframe
+@contextmanager
+def step_run(entry_point, logger_name=None, parent_run_id=None):
+    """Start an mlflow run for a pipeline step
+
+    Logs to stdout and to the run's log.log, logs the hash of the
+    entrypoint file as an artifact and, at the end of the step, the hits and
+    misses of the artifact cache. `run_logger()` batches the logging calls of
+    the step, which are all sent before the run ends.
+
+    Args:
+        entry_point (str): step name, matching scripts/<entry_point>.py
+        logger_name (str): logger to attach the handlers to, root if None
+        parent_run_id (str): run to nest the step under. It does not need to
+            be active in this process, eg. when the step runs in a worker.
+
+    Yields:
+        mlrun: the started mlflow run
+    """
+    from run_logger import batched_logging, run_logger
+
+    tags = {mlflow_tags.MLFLOW_PROJECT_ENTRY_POINT: entry_point}
+    if parent_run_id is not None:
+        tags[mlflow_tags.MLFLOW_PARENT_RUN_ID] = parent_run_id
+    active_run = mlflow.active_run()
+    nested = active_run is not None and active_run.info.run_id == parent_run_id
+    with mlflow.start_run(nested=nested, tags=tags) as mlrun, batched_logging(
+        mlrun.info.run_id
+    ):
+        artifact_uri = mlrun.info.artifact_uri
+
+        # logging
+        logger = logging.getLogger(logger_name)
+        logger.setLevel(logging.DEBUG)
+        logging.captureWarnings(True)
+        formatter = logging.Formatter(
+            "%(asctime)s - %(levelname)s - %(message)s", "%Y-%m-%d %H:%M:%S"
+        )
+
+        file_handler = logging.FileHandler(
+            unquote(urlparse(os.path.join(artifact_uri, "log.log")).path)
+        )
+        file_handler.setLevel(logging.DEBUG)
+        file_handler.setFormatter(formatter)
+
+        stdout_handler = logging.StreamHandler(sys.stdout)
+        stdout_handler.setLevel(logging.DEBUG)
+        stdout_handler.setFormatter(formatter)
+
+        logger.addHandler(file_handler)
+        logger.addHandler(stdout_handler)
+
+        try:
+            # hash current file and log it as artifact
+            with open("scripts/{}.py".format(entry_point), "rb") as f:
+                curr_file_hash = hashlib.md5(f.read()).hexdigest()
+            run_logger().log_text(curr_file_hash, "entrypoint_hash/hash.txt")
+
+            yield mlrun
+
+            from artifact_cache import default_cache
+
+            default_cache().log_metrics()
+        finally:
+            # detach so steps run in the same process don't log into each other
+            for handler in (file_handler, stdout_handler):
+                logger.removeHandler(handler)
+                handler.close()
+
+
+def process_pool(workers, **kwargs):
+    """ProcessPoolExecutor of spawned worker processes. Steps log on the
+    threads of their run logger, and forking would copy the locks they hold.
+
+    Args:
+        workers (int): number of processes
+        kwargs: other arguments of ProcessPoolExecutor, eg. `initializer`
+    """
+    return ProcessPoolExecutor(
+        workers, mp_context=multiprocessing.get_context("spawn"), **kwargs
+    )
+
+
+def map_unique(series, mapper):
+    """Apply a vectorized transform once per distinct value of a series
+
+    Low-cardinality string columns repeat a few hundred values over up to
+    millions of rows, so transforming the distinct values and broadcasting
+    them back by their factorized codes is much cheaper than a per-row op.
 
     Args:
-        df (pd.DataFrame): pandas dataframe
+        series (pd.Series): column to transform
+        mapper (callable): pd.Series -> pd.Series of the same length, eg.
+            `lambda s: s.str.extract(...)`
+
+    Returns:
+        series: transformed column, with missing values kept missing
+    """
+    codes, uniques = pd.factorize(series)
+    mapped = mapper(pd.Series(uniques, dtype=series.dtype))
+    if (codes < 0).any():
+        mapped = pd.concat([mapped, pd.Series([np.nan])], ignore_index=True)
+    return pd.Series(mapped.to_numpy()[codes], index=series.index, name=series.name)
+
+
+def category_codes(series, categories):
+    """Position of each value of a series in `categories`, -1 if not in it"""
+    return pd.Categorical(series, categories=categories).codes.astype(np.int64)
+
+
+def onehotencode(df, col: str, categories=None, dtype=np.float64):
+    """One-hot encode a column in a dataframe, dropping the first category.
+    Values not in `categories` are encoded as all zeros.
+
+    Args:
+        df (pd.DataFrame): pandas dataframe, `col` is dropped in place
         col (str): categorical column to one-hot encode
+        categories (list): sorted categories to encode, eg. fitted on the
+            full dataset when encoding it in chunks. Fitted on `df` if None.
+        dtype: dtype of the ohe features, eg. np.uint8 for 1 byte per value
 
     Returns:
         df: dataframe with ohe features
         ohe_features: names of the ohe features
         categories: all the categories of the ohe column
     """
-    ohe = OneHotEncoder(drop="first", handle_unknown="ignore", sparse_output=False)
-    ohe_df = pd.DataFrame(ohe.fit_transform(df[col].values.reshape(-1, 1)))
-    ohe_features = [x.replace("x0_", "") for x in ohe.get_feature_names_out()]
-    ohe_df.columns = ohe_features
-    categories = ohe.categories_[0].tolist()
-    df.drop(col, axis=1, inplace=True)
-    df = pd.concat([df, ohe_df], axis=1)
+    values = df.pop(col)
+    if categories is None:
+        categories = sorted(values.dropna().unique().tolist())
+    codes = category_codes(values, categories)
+    ohe = np.zeros((len(df), len(categories) - 1), dtype=dtype)
+    rows = np.flatnonzero(codes > 0)
+    ohe[rows, codes[rows] - 1] = 1
+    ohe_features = [str(category) for category in categories[1:]]
+    # index-aligned, and without copying df or the ohe matrix
+    ohe_df = pd.DataFrame(ohe, index=df.index, columns=ohe_features, copy=False)
+    df = pd.concat([df, ohe_df], axis=1, copy=False)
 
     return df, ohe_features, categories
 
 
+def to_csr(df, dtype=np.float32):
+    """CSR matrix of the values of a dataframe
+
+    Built column by column from the nonzero values, so the dense matrix is
+    never materialized. Mostly-zero one-hot features then cost a few bytes
+    per row instead of a float per category.
+
+    Args:
+        df (pd.DataFrame): numeric dataframe
+        dtype: dtype of the matrix values. sklearn trees work in float32.
+
+    Returns:
+        X: scipy.sparse.csr_matrix of shape df.shape
+    """
+    from scipy import sparse
+
+    rows, cols, values = [], [], []
+    for j, col in enumerate(df.columns):
+        column = df[col].to_numpy()
+        nonzero = np.flatnonzero(column)
+        rows.append(nonzero)
+        cols.append(np.full(len(nonzero), j, dtype=np.int32))
+        values.append(column[nonzero].astype(dtype))
+    return sparse.csr_matrix(
+        (np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+        shape=df.shape,
+    )
+
+
+SPLIT_NAMES = ["train", "validation", "test"]
+DATA_FORMATS = ["csv", "parquet", "feather", "npy"]
+ONEHOT_DTYPES = ["float64", "uint8"]
+FEATURE_MATRICES = ["dense", "csr"]
+# regressors `train` can fit, see train.make_estimator
+ENGINES = ["rf_mae", "rf_mse", "hgb"]
+REGISTERED_MODEL_NAME = "random_forest_regressor_HDB_Resale_Price"
+
+
+class StagedBoostingRegressor:
+    """Gradient boosting continued on new rows: boosting regressors fitted one
+    after another, each to the residuals of the previous ones, whose
+    predictions are added up. Defined here as the pickled model is loaded
+    with the code paths of the pyfunc model.
+
+    Args:
+        stages (list): fitted HistGradientBoostingRegressors, oldest first
+    """
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+        if hasattr(self.stages[0], "feature_names_in_"):
+            self.feature_names_in_ = self.stages[0].feature_names_in_
+
+    @property
+    def n_iter_(self):
+        return sum(stage.n_iter_ for stage in self.stages)
+
+    def predict(self, X):
+        predictions = self.stages[0].predict(X)
+        for stage in self.stages[1:]:
+            predictions = predictions + stage.predict(X)
+        return predictions
+
+
+class SplitWriter:
+    """Write a split to disk in one or more chunks
+
+    Chunks are appended in order, so writing a frame in one call or in
+    several row chunks produces the same csv and npy files. parquet and
+    feather files get one row group / record batch per chunk.
+
+    Args:
+        path (str): file to write
+        data_format (str): one of DATA_FORMATS
+        compression (str): codec for parquet and feather, eg. "zstd", "lz4"
+        num_rows (int): total rows of the split, required for npy
+    """
+
+    def __init__(self, path, data_format="parquet", compression="zstd", num_rows=None):
+        if data_format not in DATA_FORMATS:
+            raise ValueError("Unknown data format `{}`".format(data_format))
+        if data_format == "npy" and num_rows is None:
+            raise ValueError("num_rows is required to write npy splits")
+        self.path = path
+        self.data_format = data_format
+        self.compression = compression
+        self.num_rows = num_rows
+        self.rows_written = 0
+        self._writer = None
+        self._schema = None
+
+    def write(self, df):
+        if self.data_format == "csv":
+            if self._writer is None:
+                self._writer = open(self.path, "w", newline="")
+            df.to_csv(self._writer, header=self.rows_written == 0, index=False)
+        elif self.data_format == "npy":
+            if self._writer is None:
+                self._writer = np.lib.format.open_memmap(
+                    self.path,
+                    mode="w+",
+                    dtype=np.float64,
+                    shape=(self.num_rows, df.shape[1]),
+                )
+            end = self.rows_written + len(df)
+            self._writer[self.rows_written : end] = df.to_numpy(dtype=np.float64)
+        else:
+            import pyarrow as pa
+
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._writer is None:
+                self._schema = table.schema
+                self._writer = self._arrow_writer(table.schema)
+            elif not table.schema.equals(self._schema):
+                # eg. a chunk whose values of a string column are all missing
+                table = table.cast(self._schema)
+            self._writer.write_table(table)
+        self.rows_written += len(df)
+
+    def _arrow_writer(self, schema):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self.data_format == "parquet":
+            return pq.ParquetWriter(self.path, schema, compression=self.compression)
+        options = pa.ipc.IpcWriteOptions(compression=self.compression)
+        return pa.ipc.new_file(self.path, schema, options=options)
+
+    def close(self):
+        if self.data_format == "npy":
+            if self._writer is not None:
+                self._writer.flush()
+        elif self._writer is not None:
+            self._writer.close()
+        self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_manifest(outdir, data_format, columns, dtypes, files):
+    """Write the manifest `load_split` reads to find and type the splits
+
+    Args:
+        outdir (str): directory the splits were written to
+        data_format (str): one of DATA_FORMATS
+        columns (list): column names, in order
+        dtypes (dict): column name -> dtype
+        files (dict): split name -> file name in outdir
+
+    Returns:
+        path: path of the manifest
+    """
+    manifest = {
+        "format": data_format,
+        "columns": list(columns),
+        "dtypes": {col: str(dtypes[col]) for col in columns},
+        "files": files,
+    }
+    manifest_path = os.path.join(outdir, "manifest.json")
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest_path
+
+
+def save_splits(splits, outdir, data_format="parquet", compression="zstd"):
+    """Write train/validation/test splits and a manifest of their format and dtypes
+
+    Args:
+        splits (dict): split name -> pd.DataFrame
+        outdir (str): local directory to write to
+        data_format (str): one of DATA_FORMATS. npy writes one matrix per
+            split that `load_split` memory-maps.
+        compression (str): codec for parquet and feather, eg. "zstd", "lz4"
+
+    Returns:
+        paths: paths of the written files, manifest last
+    """
+    first = next(iter(splits.values()))
+    files, paths = {}, []
+    for name, df in splits.items():
+        filename = "{}.{}".format(name, data_format)
+        path = os.path.join(outdir, filename)
+        with SplitWriter(path, data_format, compression, num_rows=len(df)) as writer:
+            writer.write(df)
+        files[name] = filename
+        paths.append(path)
+
+    paths.append(
+        write_manifest(outdir, data_format, first.columns, first.dtypes, files)
+    )
+    return paths
+
+
+def csv_chunk_offsets(filepath, chunksize, block_size=2**24):
+    """Byte offsets of the header's end and of the end of every `chunksize`-th
+    line after it, found by scanning the file for newlines in blocks"""
+    with open(filepath, "rb") as f:
+        position = len(f.readline())
+        offsets, num_lines = [position], 0
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            newlines = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == 10)
+            # overall line number of newline i is num_lines + i + 1
+            ends = newlines[chunksize - num_lines % chunksize - 1 :: chunksize]
+            offsets.extend((position + ends + 1).tolist())
+            num_lines += len(newlines)
+            position += len(block)
+    if offsets[-1] != position:  # last line without a newline
+        offsets.append(position)
+    return offsets
+
+
+def read_csv_range(filepath, names, start, end, **kwargs):
+    """Parse the lines of a csv between two offsets of `csv_chunk_offsets`
+
+    Args:
+        filepath (str): csv with a header line
+        names (list): column names of the header
+        start, end (int): byte offsets of the first and after the last line
+        kwargs: options of `pd.read_csv`, eg. `dtype`
+
+    Returns:
+        df: rows of the lines
+    """
+    with open(filepath, "rb") as f:
+        f.seek(start)
+        block = f.read(end - start)
+    return pd.read_csv(io.BytesIO(block), header=None, names=names, **kwargs)
+
+
+def local_artifact(uri):
+    """Local path of an artifact file or directory: the artifact itself on a
+    local artifact store, else its copy in the shared artifact cache
+
+    Args:
+        uri (str): local path, runs:/ or artifact store uri
+
+    Returns:
+        path: local path, to be read but not modified
+    """
+    underlying_uri = uri
+    if uri.startswith("runs:/"):
+        from mlflow.store.artifact.runs_artifact_repo import RunsArtifactRepository
+
+        underlying_uri = RunsArtifactRepository.get_underlying_uri(uri)
+    parsed = urlparse(underlying_uri)
+    if parsed.scheme in ("", "file"):
+        return unquote(parsed.path)
+    from artifact_cache import default_cache
+
+    return default_cache().fetch(uri)
+
+
+def local_path(datadir, filename):
+    """Local path of a file of an artifact directory, see `local_artifact`"""
+    return local_artifact(os.path.join(datadir, filename))
+
+
+def load_split(datadir, name):
+    """Load a split written by the preprocess step with its original dtypes
+
+    Args:
+        datadir (str): local directory or artifact uri of `trainvaltest_data`
+        name (str): one of SPLIT_NAMES
+
+    Returns:
+        df: split with `resale_price` as first column
+    """
+    try:
+        with open(local_path(datadir, "manifest.json"), "r") as f:
+            manifest = json.load(f)
+    except (OSError, mlflow.exceptions.MlflowException):
+        # written before splits had a manifest
+        return pd.read_csv(local_path(datadir, name + ".csv"))
+
+    path = local_path(datadir, manifest["files"][name])
+    dtypes = manifest["dtypes"]
+    data_format = manifest["format"]
+    if data_format == "csv":
+        return pd.read_csv(path, dtype=dtypes)
+    if data_format == "parquet":
+        return pd.read_parquet(path)
+    if data_format == "feather":
+        return pd.read_feather(path)
+    if data_format == "npy":
+        matrix = np.load(path, mmap_mode="r")
+        return pd.DataFrame(
+            {col: matrix[:, i] for i, col in enumerate(manifest["columns"])}
+        ).astype(dtypes)
+    raise ValueError("Unknown data format `{}`".format(data_format))
+
+
 def fetch_logged_data(run_id):
     # params, metrics, tags, artifacts = fetch_logged_data(run_id)
     client = MlflowClient()
@@ -37,28 +464,342 @@ def fetch_logged_data(run_id):
     return data.params, data.metrics, tags, artifacts
 
 
-def infer_schema(df):
+def latest_version_run(model_name=REGISTERED_MODEL_NAME):
+    """Run id of the latest version of a registered model, None if the model
+    has no versions"""
+    versions = MlflowClient().search_model_versions("name='{}'".format(model_name))
+    if not versions:
+        return None
+    return max(versions, key=lambda version: int(version.version)).run_id
+
+
+def model_uri_run(model_uri):
+    """Run id of the model at a `models:/<name>/<version or stage>` or
+    `runs:/<run id>/<path>` uri"""
+    if model_uri.startswith("runs:/"):
+        return model_uri[len("runs:/") :].split("/")[0]
+    from mlflow.store.artifact.utils.models import get_model_name_and_version
+
+    client = MlflowClient()
+    name, version = get_model_name_and_version(client, model_uri)
+    return client.get_model_version(name, version).run_id
+
+
+# relative accuracy of the quantiles of numeric column sketches
+SKETCH_ACCURACY = 0.01
+_SKETCH_GAMMA = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+
+
+class ColumnProfile(NamedTuple):
+    """Statistics of a column, computed once and shared by schema inference,
+    schema comparison and the missing-data check. Profiles of chunks of a
+    dataset merge into the profile of the dataset (see `merge_profiles`).
+    """
+
+    dtype: np.dtype
+    num_rows: int
+    null_count: int
+    # numeric columns, over the non-null values
+    min: float = None
+    max: float = None
+    # other columns, non-null value -> count
+    domain: dict = None
+    # numeric columns, bucket value -> count of a log-bucketed quantile sketch
+    sketch: dict = None
+    # non-null values dropped from a domain bounded to its most frequent values
+    domain_overflow: int = 0
+
+    def quantile(self, q):
+        """Approximate q-quantile of a numeric column, within SKETCH_ACCURACY
+        of the exact value relative to it"""
+        values = sorted(self.sketch)
+        counts = np.cumsum([self.sketch[v] for v in values])
+        if not len(counts):
+            return np.nan
+        return values[np.searchsorted(counts, q * (counts[-1] - 1), side="right")]
+
+
+def _sketch(array):
+    # values in (gamma^(k-1), gamma^k] share the bucket value 2 gamma^k / (gamma + 1),
+    # computed the same way in every chunk so buckets merge by equality
+    magnitude = np.abs(array.astype(np.float64))
+    buckets = np.zeros(len(array))
+    nonzero = magnitude > 0
+    k = np.ceil(np.log(magnitude[nonzero]) / np.log(_SKETCH_GAMMA))
+    buckets[nonzero] = (
+        np.sign(array[nonzero]) * _SKETCH_GAMMA**k * 2 / (_SKETCH_GAMMA + 1)
+    )
+    values, counts = np.unique(buckets, return_counts=True)
+    return dict(zip(values.tolist(), counts.tolist()))
+
+
+def _bound_domain(domain, max_domain):
+    if max_domain is None or len(domain) <= max_domain:
+        return domain, 0
+    kept = sorted(domain.items(), key=lambda item: item[1], reverse=True)[:max_domain]
+    return dict(kept), sum(domain.values()) - sum(count for _, count in kept)
+
+
+def profile_column(values, max_domain=None):
+    """Profile a column with one vectorized pass over its values
+
+    Args:
+        values (pd.Series): column to profile
+        max_domain (int): keep only the most frequent categories of a domain
+            larger than this, None for exact domains
+
+    Returns:
+        profile: ColumnProfile of the column
+    """
+    dtype = values.dtype
+    if dtype.kind in "iufc":
+        array = values.to_numpy()
+        nulls = np.isnan(array) if dtype.kind in "fc" else None
+        null_count = int(nulls.sum()) if nulls is not None else 0
+        if null_count == len(array):
+            d_min = d_max = np.nan
+        elif null_count:
+            d_min, d_max = np.nanmin(array), np.nanmax(array)
+        else:
+            d_min, d_max = array.min(), array.max()
+        sketch = _sketch(array[~nulls] if null_count else array)
+        return ColumnProfile(dtype, len(array), null_count, d_min, d_max, sketch=sketch)
+
+    counts = values.value_counts(dropna=True, sort=False)
+    domain, overflow = _bound_domain(
+        dict(zip(counts.index.tolist(), counts.tolist())), max_domain
+    )
+    return ColumnProfile(
+        dtype,
+        len(values),
+        len(values) - int(counts.sum()),
+        domain=domain,
+        domain_overflow=overflow,
+    )
+
+
+def profile_data(df, max_domain=None):
+    """Profile every column of a dataframe
+
+    Returns:
+        profile: column name -> ColumnProfile
+    """
+    return {col: profile_column(df[col], max_domain) for col in df.columns}
+
+
+def _merge_counts(a, b):
+    merged = dict(a)
+    for key, count in b.items():
+        merged[key] = merged.get(key, 0) + count
+    return merged
+
+
+def merge_column_profiles(a, b, max_domain=None):
+    """Profile of the concatenation of the columns profiled by `a` and `b`.
+    Numeric dtypes are promoted as when reading the whole column at once.
+    """
+    num_rows = a.num_rows + b.num_rows
+    null_count = a.null_count + b.null_count
+    if a.domain is None and b.domain is None:
+        return ColumnProfile(
+            np.promote_types(a.dtype, b.dtype),
+            num_rows,
+            null_count,
+            np.fmin(a.min, b.min),
+            np.fmax(a.max, b.max),
+            sketch=_merge_counts(a.sketch, b.sketch),
+        )
+    # a chunk where a column is all null is read as float64
+    if a.domain is None and a.null_count == a.num_rows:
+        a = a._replace(dtype=b.dtype, domain={})
+    if b.domain is None and b.null_count == b.num_rows:
+        b = b._replace(dtype=a.dtype, domain={})
+    if a.domain is None or b.domain is None:
+        raise ValueError(
+            "Cannot merge the profiles of a {} and a {} column".format(a.dtype, b.dtype)
+        )
+    domain, overflow = _bound_domain(_merge_counts(a.domain, b.domain), max_domain)
+    return ColumnProfile(
+        a.dtype,
+        num_rows,
+        null_count,
+        domain=domain,
+        domain_overflow=a.domain_overflow + b.domain_overflow + overflow,
+    )
+
+
+def merge_profiles(profiles, max_domain=None):
+    """Merge the profiles of consecutive chunks of a dataset
+
+    Args:
+        profiles (iterable): outputs of `profile_data` on chunks with the
+            same columns
+        max_domain (int): bound of the merged domains, see `profile_column`
+
+    Returns:
+        profile: column name -> ColumnProfile of the whole dataset
+    """
+    merged = None
+    for profile in profiles:
+        if merged is None:
+            merged = profile
+            continue
+        if list(profile) != list(merged):
+            raise ValueError("Cannot merge profiles of chunks with different columns")
+        merged = {
+            col: merge_column_profiles(merged[col], p, max_domain)
+            for col, p in profile.items()
+        }
+    return merged
+
+
+def missing_data(profile):
+    """Columns with missing values and their number of missing values"""
+    return {col: p.null_count for col, p in profile.items() if p.null_count}
+
+
+# smallest bin frequency in drift scores, so empty bins do not diverge
+DRIFT_EPSILON = 1e-4
+
+
+def bin_frequencies(profile, bins):
+    """Fraction of the non-null values of a profiled column in each reference
+    bin. Numeric columns are binned from their quantile sketch and category
+    columns from their domain counts, so the cost does not grow with the rows.
+
+    Args:
+        profile (ColumnProfile): profile of the column
+        bins (dict): reference bins of the column, see `reference_bins`
+
+    Returns:
+        freqs: np.ndarray of the fraction of values in each bin
+    """
+    if "edges" in bins:  # numeric
+        values = np.fromiter(profile.sketch.keys(), dtype=np.float64)
+        counts = np.fromiter(profile.sketch.values(), dtype=np.float64)
+        binned = np.bincount(
+            np.searchsorted(bins["edges"], values, side="right"),
+            weights=counts,
+            minlength=len(bins["edges"]) + 1,
+        )
+    else:  # object, the last bin holds the other categories
+        index = {category: i for i, category in enumerate(bins["categories"])}
+        binned = np.zeros(len(bins["categories"]) + 1)
+        for value, count in profile.domain.items():
+            binned[index.get(value, -1)] += count
+        binned[-1] += profile.domain_overflow
+    total = binned.sum()
+    return binned / total if total else binned
+
+
+def reference_bins(profile, num_bins=10):
+    """Compact reference distribution of a profiled column: `num_bins`
+    quantile bins of a numeric column, or the frequencies of the
+    `num_bins - 1` most frequent categories and of the others
+
+    Returns:
+        bins: {"edges" or "categories": ..., "freqs": [...]}
+    """
+    if profile.domain is None:
+        quantiles = [profile.quantile(i / num_bins) for i in range(1, num_bins)]
+        bins = {"edges": np.unique(quantiles).tolist()}
+    else:
+        ranked = sorted(profile.domain, key=profile.domain.get, reverse=True)
+        bins = {"categories": ranked[: num_bins - 1]}
+    bins["freqs"] = np.round(bin_frequencies(profile, bins), 6).tolist()
+    return bins
+
+
+def drift_scores(profile, bins):
+    """Population stability index of a profiled column against its reference
+    bins, and for numeric columns the Kolmogorov-Smirnov statistic between
+    the binned distributions
+
+    Returns:
+        scores: {"psi": float} and "ks" for numeric columns
+    """
+    expected = np.asarray(bins["freqs"])
+    actual = bin_frequencies(profile, bins)
+    p = np.clip(actual, DRIFT_EPSILON, None)
+    q = np.clip(expected, DRIFT_EPSILON, None)
+    scores = {"psi": float(np.sum((p - q) * np.log(p / q)))}
+    if "edges" in bins:
+        scores["ks"] = float(np.abs(np.cumsum(actual) - np.cumsum(expected)).max())
+    return scores
+
+
+def infer_schema(df, profile=None, num_bins=0):
+    """Schema of a dataframe: dtype and min/max of numeric columns, dtype and
+    domain of the other columns
+
+    Args:
+        df (pd.DataFrame): data, not read if `profile` is given
+        profile (dict): output of `profile_data` on the data
+        num_bins (int): add the `reference_bins` of each column to compute
+            drift against, 0 for none
+
+    Returns:
+        schema: column name -> column schema
+    """
+    profile = profile or profile_data(df)
     schema = {}
-    for col in df.columns:
-        dt = df[col].dtype
-        if dt.kind in "iufc":
+    for col, p in profile.items():
+        if p.domain is None:  # numeric
             schema[col] = {
-                "type": str(dt),
-                "min": float(df[col].min()),
-                "max": float(df[col].max()),
+                "type": str(p.dtype),
+                "min": float(p.min),
+                "max": float(p.max),
             }
         else:  # object
-            schema[col] = {"type": str(dt), "domain": sorted(list(set(df[col])))}
+            schema[col] = {"type": str(p.dtype), "domain": sorted(p.domain)}
+        if num_bins:
+            schema[col]["bins"] = reference_bins(p, num_bins)
 
     return schema
 
 
-def compare_data_to_schema(data, schema):
+def compare_drift_to_schema(
+    schema, profile, warn_threshold=0.1, fail_threshold=0.25, exclude=()
+):
+    """Drift of the profiled data from the reference bins of a schema. Warns
+    when the PSI of a column exceeds `warn_threshold` and fails when it
+    exceeds `fail_threshold`. Columns in `exclude` or without reference bins
+    are skipped.
+
+    Returns:
+        status, scores: "Passed" or "Failed", and column -> `drift_scores`
+    """
+    logging.captureWarnings(True)
+    status, scores = "Passed", {}
+    for col, p in profile.items():
+        bins = schema.get(col, {}).get("bins")
+        if col in exclude or bins is None or ("edges" in bins) != (p.domain is None):
+            continue
+        scores[col] = drift_scores(p, bins)
+        psi = scores[col]["psi"]
+        if psi > fail_threshold:
+            print(
+                "Column `{}` has drifted from schema (PSI {:.4f} > {})".format(
+                    col, psi, fail_threshold
+                )
+            )
+            status = "Failed"
+        elif psi > warn_threshold:
+            warnings.warn(
+                "Column `{}` is drifting from schema (PSI {:.4f} > {})".format(
+                    col, psi, warn_threshold
+                )
+            )
+    return status, scores
+
+
+def compare_data_to_schema(data, schema, profile=None):
     # logger = logging.getLogger(__name__)
     # warnings_logger = logging.getLogger("py.warnings")
     logging.captureWarnings(True)
+    profile = profile or profile_data(data)
 
-    data_cols = data.columns
+    data_cols = list(profile)
     for col in schema.keys():
         if col not in data_cols:
             print("Column `{}` is missing from dataset".format(col))
@@ -67,7 +808,7 @@ def compare_data_to_schema(data, schema):
         if col not in schema:
             print("Column `{}` does not exist in schema".format(col))
             return "Failed"
-        dt = data[col].dtype
+        dt = profile[col].dtype
         if dt.kind in "iufc":  # if numeric
             if dt != schema[col]["type"]:
                 print(
@@ -77,7 +818,7 @@ def compare_data_to_schema(data, schema):
                 )
                 print("Terminating data validation ...")
                 return "Failed"
-            d_max, d_min = data[col].max(), data[col].min()
+            d_max, d_min = profile[col].max, profile[col].min
             if d_max > schema[col]["max"]:
                 warnings.warn(
                     "Column `{}` has values ({}) higher than max of schema ({})".format(
@@ -101,12 +842,18 @@ def compare_data_to_schema(data, schema):
                 return "Failed"
             # check if each columns contain values not present in previous domain
             old_set = set(schema[col]["domain"])
-            diff = sorted(set(data[col]).difference(old_set))
+            diff = sorted(set(profile[col].domain).difference(old_set))
             if diff:
                 warnings.warn(
                     "Column `{}` domain contains {} that are not present in schema".format(
                         col, diff
                     )
                 )
+            if profile[col].domain_overflow:
+                warnings.warn(
+                    "Column `{}` has ({}) values outside its {} most frequent categories that were not compared to schema".format(
+                        col, profile[col].domain_overflow, len(profile[col].domain)
+                    )
+                )
 
     return "Passed"
@@ -0,0 +1,87 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+from mlflow.exceptions import MlflowException
+from scripts.artifact_cache import ArtifactCache
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+@pytest.fixture
+def store(tmp_path):
+    root = tmp_path / "store"
+    _write(str(root / "model" / "model.pkl"), "a" * 100)
+    _write(str(root / "model" / "meta" / "MLmodel"), "flavors")
+    _write(str(root / "data" / "test.csv"), "b" * 300)
+    return "file://{}".format(root)
+
+
+def test_fetch_hits_until_content_changes(store, tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"), max_bytes=10000)
+    path = cache.fetch(store + "/model")
+    with open(os.path.join(path, "meta", "MLmodel")) as f:
+        assert f.read() == "flavors"
+    assert cache.fetch(store + "/model") == path
+    assert (cache.hits, cache.misses, cache.bytes_downloaded) == (1, 1, 107)
+
+    # a re-logged artifact is a new entry
+    _write(store[len("file://") :] + "/model/model.pkl", "c" * 50)
+    changed = cache.fetch(store + "/model/")
+    assert changed != path
+    with open(os.path.join(changed, "model.pkl")) as f:
+        assert f.read() == "c" * 50
+    assert cache.misses == 2
+
+    with pytest.raises(MlflowException):
+        cache.fetch(store + "/missing")
+
+
+def test_evicts_least_recently_used(store, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    cache = ArtifactCache(cache_dir, max_bytes=450)
+    model = cache.fetch(store + "/model")
+    test = cache.fetch(store + "/data/test.csv")
+    assert os.path.exists(model) and os.path.exists(test)
+
+    # the model is used last, so the test split is evicted for the new file
+    key = os.path.relpath(test, cache_dir).split(os.sep)[0]
+    os.utime(os.path.join(cache_dir, key, "entry.json"), (0, 0))
+    cache.fetch(store + "/model")
+    _write(store[len("file://") :] + "/data/validation.csv", "d" * 300)
+    validation = cache.fetch(store + "/data/validation.csv")
+    assert os.path.exists(model) and os.path.exists(validation)
+    assert not os.path.exists(test)
+    assert sum(size for _, size, _ in cache.entries()) <= 450
+
+
+def test_evict_skips_entries_used_after_listing(store, tmp_path, monkeypatch):
+    cache = ArtifactCache(str(tmp_path / "cache"), max_bytes=10000)
+    model = cache.fetch(store + "/model")
+    listing = cache.entries()
+    # the entry is hit between the listing and its eviction
+    cache.fetch(store + "/model")
+    monkeypatch.setattr(
+        cache, "entries", lambda: [(0, *entry[1:]) for entry in listing]
+    )
+    cache.max_bytes = 0
+    assert cache.evict() == 0
+    assert os.path.exists(model)
+
+
+def _fetch(cache_dir, uri):
+    cache = ArtifactCache(cache_dir, max_bytes=10000)
+    return cache.fetch(uri), cache.misses
+
+
+def test_concurrent_fetches_share_an_entry(store, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(_fetch, [cache_dir] * 8, [store + "/model"] * 8))
+    assert len({path for path, _ in results}) == 1
+    assert len(ArtifactCache(cache_dir).entries()) == 1
+    assert not [name for name in os.listdir(cache_dir) if name.startswith(".tmp")]
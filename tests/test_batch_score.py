@@ -0,0 +1,45 @@
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from scripts.batch_score import PREDICTION_COLUMN, score_file
+
+FILEPATH = "data/resale-flat-prices-2022-jan.csv"
+
+
+class AreaModel:
+    def predict(self, context, model_input):
+        return model_input["floor_area_sqm"].to_numpy() * 2
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_score_file_in_chunks(tmp_path, workers):
+    data = pd.read_csv(FILEPATH)
+    output = str(tmp_path / "predictions.parquet")
+    rows = score_file(FILEPATH, output, AreaModel, chunksize=700, workers=workers)
+    assert rows == len(data)
+    # one row group per chunk, in input order
+    assert pq.ParquetFile(output).num_row_groups == -(-len(data) // 700)
+    scored = pd.read_parquet(output)
+    assert scored.columns.tolist() == data.columns.tolist() + [PREDICTION_COLUMN]
+    pd.testing.assert_series_equal(
+        scored[PREDICTION_COLUMN], data["floor_area_sqm"] * 2, check_names=False
+    )
+    # every chunk is parsed with the same dtypes
+    assert scored["block"].tolist() == data["block"].astype(str).tolist()
+    assert scored["resale_price"].dtype == "float64"
+
+
+def test_score_parquet_to_feather(tmp_path):
+    data = pd.read_csv(FILEPATH)
+    data.to_parquet(tmp_path / "input.parquet")
+    output = str(tmp_path / "predictions.feather")
+    score_file(
+        str(tmp_path / "input.parquet"),
+        output,
+        AreaModel,
+        chunksize=1000,
+        output_format="feather",
+    )
+    scored = pd.read_feather(output)
+    pd.testing.assert_frame_equal(scored.drop(columns=PREDICTION_COLUMN), data)
+    assert (scored[PREDICTION_COLUMN] == data["floor_area_sqm"] * 2).all()
@@ -0,0 +1,33 @@
+import pandas as pd
+import pytest
+from scripts.data_validate import profile_csv
+from scripts.utils import infer_schema, merge_profiles, missing_data, profile_data
+
+FILEPATH = "data/resale-flat-prices-2022-jan.csv"
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_profile_csv_matches_in_memory(workers):
+    data = pd.read_csv(FILEPATH)
+    profile = profile_data(data)
+    chunked = profile_csv(FILEPATH, chunksize=700, workers=workers)
+    assert infer_schema(None, chunked) == infer_schema(data)
+    for col, p in profile.items():
+        assert chunked[col].num_rows == len(data)
+        assert chunked[col].domain == p.domain
+        assert chunked[col].sketch == p.sketch
+
+
+def test_merge_profiles_promotes_and_bounds():
+    chunks = [
+        pd.DataFrame({"numeric": [1, 2], "object": ["foo", "foo"]}),
+        pd.DataFrame({"numeric": [None, 4.5], "object": ["bar", None]}),
+    ]
+    profile = merge_profiles([profile_data(chunk) for chunk in chunks])
+    assert profile["numeric"].dtype == "float64"
+    assert (profile["numeric"].min, profile["numeric"].max) == (1.0, 4.5)
+    assert missing_data(profile) == {"numeric": 1, "object": 1}
+
+    bounded = merge_profiles([profile_data(c, max_domain=1) for c in chunks], 1)
+    assert bounded["object"].domain == {"foo": 2}
+    assert bounded["object"].domain_overflow == 1
@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+from scripts.feature_transformer import (
+    TARGET,
+    FeatureTransformer,
+    clean_data,
+    fit_vocabulary,
+)
+
+FILEPATH = "data/resale-flat-prices-2022-jan.csv"
+
+
+@pytest.fixture(scope="module")
+def raw():
+    return pd.read_csv(FILEPATH)
+
+
+@pytest.fixture(scope="module")
+def transformer(raw):
+    return FeatureTransformer(fit_vocabulary(clean_data(raw)))
+
+
+def test_transform_matches_training_encoding(raw, transformer):
+    encoded = transformer.encode(clean_data(raw)).drop(columns=TARGET)
+    assert encoded.columns.tolist() == transformer.feature_names
+
+    # any batch of raw rows encodes like the same rows of the full dataset
+    rows = raw.sample(5, random_state=0).drop(columns=TARGET)
+    pd.testing.assert_frame_equal(
+        transformer.transform(rows), encoded.loc[rows.index], check_dtype=False
+    )
+
+
+def test_save_load(tmp_path, raw, transformer):
+    path = str(tmp_path / "feature_transformer.json")
+    transformer.save(path)
+    loaded = FeatureTransformer.load(path)
+    assert loaded.to_dict() == transformer.to_dict()
+    pd.testing.assert_frame_equal(
+        loaded.transform(raw.head(10)), transformer.transform(raw.head(10))
+    )
+
+
+def test_unknown_categories(raw, transformer):
+    row = raw.head(1).copy()
+    row["town"] = "ATLANTIS"
+    town_features = transformer.cat_features_schema()["town"]["ohe_features"]
+    assert (transformer.transform(row)[town_features] == 0).all(axis=None)
+
+    row["flat_type"] = "PENTHOUSE"
+    with pytest.raises(ValueError, match="flat_type"):
+        transformer.transform(row)
+
+
+def test_raw_categories_are_cleaned(raw, transformer):
+    rows = raw.head(3).copy()
+    rows["flat_model"] = ["Model A-Maisonette", "Maisonette", "Model A-Maisonette"]
+    maisonette = transformer.transform(rows)["Maisonette"]
+    assert maisonette.tolist() == [1.0, 1.0, 1.0]
@@ -0,0 +1,26 @@
+from scripts.import_profile import entry_point_scripts, parse_importtime
+
+
+def test_parse_importtime():
+    stderr = "\n".join(
+        [
+            "import time: self [us] | cumulative | imported package",
+            "import time:       100 |        100 |   _io",
+            "import time:       200 |        300 | site",
+            "import time:       500 |     500000 |     pandas.core",
+            "import time:      1000 |    1200000 |   pandas",
+            "import time:      2000 |    1500000 | mlflow",
+            "Usage: train.py [OPTIONS]",
+        ]
+    )
+    total_s, top_level = parse_importtime(stderr)
+    assert top_level == [("site", 0.0003), ("mlflow", 1.5)]
+    assert total_s == 1.5003
+
+
+def test_entry_point_scripts():
+    scripts = entry_point_scripts()
+    assert scripts["train"] == "scripts/train.py"
+    assert scripts["main"] == "scripts/main.py"
+    # entry points whose script does not exist are skipped
+    assert "load_raw_data" not in scripts
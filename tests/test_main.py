@@ -3,3 +3,74 @@ import pytest
 
 def test_pipelines_importable():
     from scripts import data_validate
+
+
+def test_critical_path():
+    from scripts.main import _critical_path
+
+    timeline = {
+        "data_validate": {"duration_s": 5.0},
+        "preprocess": {"duration_s": 2.0},
+        "train": {"duration_s": 3.0},
+        "evaluate": {"duration_s": 1.0},
+        "model_validate": {"duration_s": 4.0},
+    }
+    critical_time, critical_steps = _critical_path(timeline)
+    assert critical_time == 10.0
+    assert critical_steps == ["preprocess", "train", "evaluate", "model_validate"]
+
+
+def test_pipeline_steps_without_tune():
+    from scripts.main import PIPELINE_STEPS, _pipeline_steps
+
+    steps = _pipeline_steps({step: {} for step in PIPELINE_STEPS if step != "tune"})
+    assert "tune" not in steps
+    assert steps["train"] == ["preprocess"]
+    assert _pipeline_steps({step: {} for step in PIPELINE_STEPS}) == PIPELINE_STEPS
+
+
+def test_failed_data_validation_discards_running_steps(tmp_path, monkeypatch):
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    import mlflow
+    from mlflow.tracking import MlflowClient
+    from scripts import main
+    from scripts.run_cache import RunIndex
+
+    monkeypatch.setenv("MLFLOW_TRACKING_URI", "file://{}".format(tmp_path / "mlruns"))
+    monkeypatch.setenv("RUN_CACHE_INDEX", str(tmp_path / "index.json"))
+    launched = []
+
+    def get_or_run(entrypoint, parameters, fingerprint, experiment_id):
+        launched.append(entrypoint)
+        if entrypoint == "data_validate":
+            time.sleep(0.3)
+            raise RuntimeError("Data validation with previous schema failed!")
+        if entrypoint == "train":
+            time.sleep(0.6)
+        client = MlflowClient()
+        run_id = client.create_run(experiment_id).info.run_id
+        client.set_terminated(run_id)
+        return run_id, None
+
+    monkeypatch.setattr(main, "_get_or_run", get_or_run)
+    monkeypatch.setattr(
+        main, "_step_executor", lambda executor, workers: ThreadPoolExecutor(workers)
+    )
+    step_parameters = {
+        "data_validate": {},
+        "preprocess": {"filepath": "data.csv"},
+        "train": {},
+        "evaluate": {},
+    }
+    fingerprints = {step: step + "_key" for step in step_parameters}
+    with mlflow.start_run() as run:
+        model_uri = main._run_pipeline(step_parameters, fingerprints, "subprocess", 2)
+
+    assert model_uri is None
+    assert launched == ["data_validate", "preprocess", "train"]
+    index = RunIndex()
+    experiment_id = run.info.experiment_id
+    assert index.get(experiment_id, "preprocess_key") is not None
+    assert index.get(experiment_id, "train_key") is None
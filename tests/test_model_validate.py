@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scripts import model_validate
+from scripts.model_validate import shap_explanation
+from scripts.train import make_estimator
+from scripts.utils import ENGINES
+from tree_ensemble import FlatTreeEnsemble
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(2023)
+    X = pd.DataFrame(rng.normal(size=(300, 4)), columns=["a", "b", "c", "d"])
+    y = 100 * X["a"] + 10 * X["b"] * X["c"] + rng.normal(size=300)
+    return X, y
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_tree_shap_values_add_up_to_predictions(data, engine):
+    X, y = data
+    estimator = make_estimator(engine, 10, "sqrt", 3, 2, 1).fit(X, y)
+    background = X.sample(50, random_state=0)
+    for model in [estimator, FlatTreeEnsemble.from_estimator(estimator)]:
+        explanation = shap_explanation(model, X, background)
+        assert explanation.values.shape == (300, 4)
+        assert explanation.feature_names == ["a", "b", "c", "d"]
+        np.testing.assert_allclose(
+            explanation.values.sum(axis=1) + explanation.base_values,
+            estimator.predict(X),
+            rtol=1e-6,
+        )
+
+
+def test_chunks_and_budget(data, monkeypatch):
+    X, y = data
+    monkeypatch.setattr(model_validate, "SHAP_CHUNK_ROWS", 64)
+    flat = FlatTreeEnsemble.from_estimator(
+        make_estimator("rf_mse", 10, "sqrt", 3, 2, 1).fit(X, y)
+    )
+    background = X.sample(50, random_state=0)
+    serial = shap_explanation(flat, X, background)
+    parallel = shap_explanation(flat, X, background, workers=2)
+    np.testing.assert_array_equal(parallel.values, serial.values)
+
+    # the first chunk is explained whatever the budget
+    budgeted = shap_explanation(flat, X, background, time_budget=1e-9)
+    np.testing.assert_array_equal(budgeted.values, serial.values[:64])
+    np.testing.assert_array_equal(budgeted.data, X.to_numpy()[:64])
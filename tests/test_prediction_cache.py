@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+from scripts.prediction_cache import PredictionCache, row_keys
+
+
+def test_row_keys_are_canonical():
+    X = pd.DataFrame({"a": [0.0, -0.0, np.nan, 1.0], "b": [1.0, 1.0, 2.0, 1.0]})
+    keys = row_keys(X)
+    assert keys[0] == keys[1]
+    assert keys[2] == row_keys(np.array([[float("nan"), 2.0]]))[0]
+    assert len(set(keys)) == 3
+    assert row_keys(np.empty((0, 2))) == []
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_and_ttl():
+    clock = FakeClock()
+    cache = PredictionCache(max_entries=2, ttl_s=10, clock=clock)
+    keys = row_keys(np.arange(3.0)[:, None])
+    cache.store(keys[:2], [10.0, 11.0], seconds=0.2)
+    predictions, found = cache.lookup(keys)
+    np.testing.assert_array_equal(found, [True, True, False])
+    np.testing.assert_array_equal(predictions[:2], [10.0, 11.0])
+    assert (cache.hits, cache.misses) == (2, 1)
+    assert cache.saved_calls == 0
+    cache.lookup(keys[:2])
+    assert cache.saved_calls == 1
+
+    # the least recently looked up entry is evicted
+    cache.lookup(keys[1:2])
+    cache.store(keys[2:], [12.0])
+    assert cache.lookup(keys)[1].tolist() == [False, True, True]
+    assert cache.evictions == 1
+
+    clock.now = 10.0
+    assert not cache.lookup(keys)[1].any()
+    assert cache.expirations == 2 and len(cache) == 0
+
+
+def test_new_version_drops_entries():
+    cache = PredictionCache()
+    cache.set_version("run_1")
+    keys = row_keys(np.ones((1, 3)))
+    cache.store(keys, [1.0])
+    cache.set_version("run_1")
+    assert cache.lookup(keys)[1].all()
+    cache.set_version("run_2")
+    assert not cache.lookup(keys)[1].any()
+    assert cache.stats()["invalidations"] == 1
+    assert cache.stats()["hit_rate"] == 0.5
+
+
+def test_saved_seconds():
+    cache = PredictionCache()
+    # model calls take 10 ms plus 1 ms per row
+    for rows in [1, 5, 2, 8]:
+        keys = row_keys(np.arange(rows, dtype=float)[:, None] + 10 * rows)
+        cache.store(keys, np.zeros(rows), seconds=0.01 + 0.001 * rows)
+    np.testing.assert_allclose(cache.call_costs(), [0.01, 0.001])
+
+    keys = row_keys(np.array([[10.0], [50.0], [-1.0]]))
+    cache.lookup(keys)
+    np.testing.assert_allclose(cache.saved_seconds, 2 * 0.001)
+    cache.lookup(keys[:2])
+    np.testing.assert_allclose(cache.saved_seconds, 4 * 0.001 + 0.01)
@@ -0,0 +1,57 @@
+import filecmp
+import os
+import pandas as pd
+import pytest
+import scripts.preprocess as preprocess
+from scripts.utils import load_split
+
+FILEPATH = "data/resale-flat-prices-2022-jan.csv"
+
+
+@pytest.mark.parametrize("data_format", ["csv", "npy", "parquet"])
+def test_chunked_matches_in_memory(tmp_path, monkeypatch, data_format):
+    logged = {}
+    monkeypatch.setattr(
+        preprocess, "_log_outputs", lambda paths, schema: logged.update(paths=paths)
+    )
+    preprocess.preprocess_data(pd.read_csv(FILEPATH), data_format=data_format)
+    in_memory_dir = os.path.dirname(logged["paths"][0])
+
+    chunked_dir = str(tmp_path)
+    paths, _ = preprocess.write_splits_chunked(
+        FILEPATH, chunked_dir, chunksize=500, data_format=data_format
+    )
+    assert sorted(os.listdir(chunked_dir)) == sorted(os.listdir(in_memory_dir))
+    for path in paths:
+        filename = os.path.basename(path)
+        if data_format != "parquet" or filename == "manifest.json":
+            assert filecmp.cmp(
+                path, os.path.join(in_memory_dir, filename), shallow=False
+            )
+    for name in ["train", "validation", "test"]:
+        pd.testing.assert_frame_equal(
+            load_split(chunked_dir, name), load_split(in_memory_dir, name)
+        )
+
+
+def test_chunked_with_base_vocabulary(tmp_path, monkeypatch):
+    logged = {}
+    monkeypatch.setattr(
+        preprocess, "_log_outputs", lambda paths, schema: logged.update(paths=paths)
+    )
+    data = pd.read_csv(FILEPATH)
+    vocabulary = preprocess.fit_vocabulary(preprocess.clean_data(data))
+    # a town missing from the data replaces a town the base run never saw
+    unseen = vocabulary["town"][1]
+    vocabulary["town"][1] = "AAA"
+    train_df, _, _ = preprocess.preprocess_data(data, vocabulary=vocabulary)
+    assert unseen not in train_df and (train_df["AAA"] == 0).all()
+
+    paths, transformer = preprocess.write_splits_chunked(
+        FILEPATH, str(tmp_path), chunksize=500, vocabulary=vocabulary
+    )
+    assert transformer.vocabulary == vocabulary
+    in_memory_dir = os.path.dirname(logged["paths"][0])
+    pd.testing.assert_frame_equal(
+        load_split(str(tmp_path), "train"), load_split(in_memory_dir, "train")
+    )
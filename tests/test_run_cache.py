@@ -0,0 +1,99 @@
+import multiprocessing
+
+import pytest
+from mlflow.exceptions import MlflowException
+from mlflow.protos.databricks_pb2 import (
+    RESOURCE_DOES_NOT_EXIST,
+    TEMPORARILY_UNAVAILABLE,
+)
+from scripts.run_cache import RunIndex, cache_key, hash_file, lookup_run
+
+
+def test_cache_key_deterministic():
+    key = cache_key("train", {"a": 1, "b": "x"}, "code", {"filepath": "data"})
+    assert key == cache_key("train", {"b": "x", "a": "1"}, "code", {"filepath": "data"})
+
+
+def test_cache_key_changes_with_inputs():
+    key = cache_key("train", {"a": 1}, "code", {"filepath": "data"}, {"up": "fp"})
+    assert key != cache_key(
+        "evaluate", {"a": 1}, "code", {"filepath": "data"}, {"up": "fp"}
+    )
+    assert key != cache_key(
+        "train", {"a": 2}, "code", {"filepath": "data"}, {"up": "fp"}
+    )
+    assert key != cache_key(
+        "train", {"a": 1}, "other", {"filepath": "data"}, {"up": "fp"}
+    )
+    assert key != cache_key(
+        "train", {"a": 1}, "code", {"filepath": "new"}, {"up": "fp"}
+    )
+    assert key != cache_key(
+        "train", {"a": 1}, "code", {"filepath": "data"}, {"up": "new"}
+    )
+
+
+def test_hash_file(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_bytes(b"a,b\n1,2\n" * 1000)
+    digest = hash_file(str(path), chunk_size=7)
+    assert digest == hash_file(str(path))
+    path.write_bytes(b"a,b\n1,3\n" * 1000)
+    assert digest != hash_file(str(path))
+
+
+def test_run_index(tmp_path):
+    index = RunIndex(str(tmp_path / "index.json"))
+    assert index.get("0", "key") is None
+    index.put("0", "key", "run_a")
+    assert index.get("0", "key") == "run_a"
+    assert index.get("1", "key") is None
+    index.remove("0", "key")
+    assert index.get("0", "key") is None
+
+
+def _put_keys(path, worker):
+    index = RunIndex(path)
+    for i in range(20):
+        index.put("0", "key_{}_{}".format(worker, i), "run")
+
+
+def test_run_index_concurrent_puts(tmp_path):
+    path = str(tmp_path / "index.json")
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=_put_keys, args=(path, worker)) for worker in range(4)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    index = RunIndex(path)
+    assert all(
+        index.get("0", "key_{}_{}".format(worker, i)) == "run"
+        for worker in range(4)
+        for i in range(20)
+    )
+
+
+class _FailingClient:
+    def __init__(self, error_code):
+        self.error_code = error_code
+
+    def get_run(self, run_id):
+        raise MlflowException("get_run failed", self.error_code)
+
+    def search_runs(self, *args, **kwargs):
+        return []
+
+
+def test_lookup_run_keeps_entries_on_server_errors(tmp_path):
+    index = RunIndex(str(tmp_path / "index.json"))
+    index.put("0", "key", "run_a")
+    with pytest.raises(MlflowException):
+        lookup_run("0", "key", index, _FailingClient(TEMPORARILY_UNAVAILABLE))
+    assert index.get("0", "key") == "run_a"
+    assert (
+        lookup_run("0", "key", index, _FailingClient(RESOURCE_DOES_NOT_EXIST)) is None
+    )
+    assert index.get("0", "key") is None
@@ -0,0 +1,118 @@
+import os
+import tempfile
+import threading
+
+import pytest
+from scripts import run_logger as run_logger_module
+from scripts.run_logger import RunLogger, batched_logging, run_logger
+
+
+class _RecordingClient:
+    def __init__(self, fail_uploads=False):
+        self.fail_uploads = fail_uploads
+        self.batches = []
+        self.artifacts = {}
+        self.threads = set()
+
+    def log_batch(self, run_id, metrics=(), params=(), tags=()):
+        self.threads.add(threading.get_ident())
+        self.batches.append((list(metrics), list(params), list(tags)))
+
+    def log_artifact(self, run_id, local_path, artifact_path=None):
+        if self.fail_uploads:
+            raise OSError("upload failed")
+        with open(local_path) as f:
+            name = os.path.join(artifact_path or "", os.path.basename(local_path))
+            self.artifacts[name] = f.read()
+
+    def log_artifacts(self, run_id, local_dir, artifact_path=None):
+        for name in os.listdir(local_dir):
+            self.log_artifact(run_id, os.path.join(local_dir, name), artifact_path)
+
+
+def test_batches_calls_until_the_block_exits(tmp_path):
+    client = _RecordingClient()
+    with batched_logging("run", client):
+        logger = run_logger("run")
+        logger.log_metric("a", 1)
+        logger.log_metrics({"b": 2.0, "c": 3})
+        logger.log_params({"p": 1})
+        logger.set_tag("t", "x")
+        logger.log_dict({"k": "v"}, "dir/d.json")
+        artifact = tmp_path / "f.txt"
+        artifact.write_text("content")
+        logger.log_artifact(str(artifact), "files")
+        assert client.batches == []
+
+    assert len(client.batches) == 1
+    metrics, params, tags = client.batches[0]
+    assert [(m.key, m.value) for m in metrics] == [("a", 1), ("b", 2), ("c", 3)]
+    assert [(p.key, p.value) for p in params] == [("p", "1")]
+    assert [(t.key, t.value) for t in tags] == [("t", "x")]
+    assert client.artifacts == {
+        os.path.join("dir", "d.json"): '{\n  "k": "v"\n}',
+        os.path.join("files", "f.txt"): "content",
+    }
+    assert client.threads != {threading.get_ident()}
+    assert "run" not in run_logger_module._loggers
+
+
+def test_splits_batches_at_the_request_limits():
+    client = _RecordingClient()
+    logger = RunLogger("run", client)
+    logger.log_metrics({str(i): i for i in range(2500)})
+    logger.log_params({str(i): i for i in range(150)})
+    logger.flush()
+    logger.close()
+    assert [(len(m), len(p)) for m, p, _ in client.batches] == [
+        (1000, 0),
+        (1000, 0),
+        (500, 0),
+        (0, 100),
+        (0, 50),
+    ]
+
+
+def test_failed_upload_fails_the_block():
+    client = _RecordingClient(fail_uploads=True)
+    with pytest.raises(OSError, match="upload failed"):
+        with batched_logging("run", client):
+            with run_logger("run").staging_dir("plots") as tmpdir:
+                with open(os.path.join(tmpdir, "plot.png"), "w") as f:
+                    f.write("png")
+    assert "run" not in run_logger_module._loggers
+
+
+def test_logs_right_away_outside_a_block(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    client = _RecordingClient()
+    logger = RunLogger("run", client, synchronous=True)
+    logger.log_metric("a", 1)
+    assert len(client.batches) == 1
+    logger.log_text("hash", "entrypoint_hash/hash.txt")
+    logger.log_dict({"k": "v"}, "d.json")
+    assert client.artifacts == {
+        os.path.join("entrypoint_hash", "hash.txt"): "hash",
+        "d.json": '{\n  "k": "v"\n}',
+    }
+    # nothing is left staged
+    assert os.listdir(tmp_path) == []
+
+
+def test_log_model_records_the_model(tmp_path, monkeypatch):
+    import mlflow
+    from sklearn.dummy import DummyRegressor
+
+    monkeypatch.setenv("MLFLOW_TRACKING_URI", "file://{}".format(tmp_path / "mlruns"))
+    with mlflow.start_run() as run, batched_logging(run.info.run_id):
+        model_uri = run_logger().log_model(
+            mlflow.sklearn.save_model,
+            "model",
+            sk_model=DummyRegressor().fit([[0.0]], [1.0]),
+        )
+        with pytest.raises(ValueError):
+            RunLogger("other").log_model(mlflow.sklearn.save_model, "model")
+    assert model_uri == "runs:/{}/model".format(run.info.run_id)
+    assert mlflow.sklearn.load_model(model_uri).predict([[0.0]]) == [1.0]
+    history = mlflow.get_run(run.info.run_id).data.tags["mlflow.log-model.history"]
+    assert '"artifact_path": "model"' in history
@@ -0,0 +1,56 @@
+import mlflow
+from mlflow.tracking import MlflowClient
+from scripts.schema_registry import (
+    SCHEMA_ARTIFACT_PATH,
+    SchemaCache,
+    SchemaRegistry,
+    schema_digest,
+)
+
+SCHEMA = {
+    "numeric": {"type": "float64", "min": 1.0, "max": 3.0},
+    "object": {"type": "object", "domain": ["bar", "baz", "foo"]},
+}
+
+
+def test_schema_digest():
+    reordered = {"object": SCHEMA["object"], "numeric": SCHEMA["numeric"]}
+    assert schema_digest(SCHEMA) == schema_digest(reordered)
+    assert schema_digest(SCHEMA) != schema_digest({"numeric": SCHEMA["numeric"]})
+
+
+def test_schema_cache(tmp_path):
+    cache = SchemaCache(str(tmp_path))
+    digest = schema_digest(SCHEMA)
+    assert cache.get(digest) is None
+    cache.put(digest, SCHEMA)
+    assert cache.get(digest) == SCHEMA
+    (tmp_path / "{}.json".format(digest)).write_text('{"numeric": {}}')
+    assert cache.get(digest) is None
+
+
+def test_schema_registry(tmp_path, monkeypatch):
+    monkeypatch.setenv("MLFLOW_TRACKING_URI", "file://{}".format(tmp_path / "mlruns"))
+    client = MlflowClient()
+    experiment_id = client.create_experiment("registry")
+    registry = SchemaRegistry(
+        experiment_id, client, SchemaCache(str(tmp_path / "cache"))
+    )
+    assert registry.latest() == (None, None)
+
+    # a run from before the registry is found by the fallback query
+    with mlflow.start_run(
+        experiment_id=experiment_id,
+        tags={"mlflow.project.entryPoint": "data_validate"},
+    ) as run:
+        mlflow.log_dict(SCHEMA, SCHEMA_ARTIFACT_PATH)
+        mlflow.set_tag("validation_status", "pass")
+    assert registry.latest() == (SCHEMA, run.info.run_id)
+    assert registry.latest("other") == (None, None)
+
+    newer = {"numeric": SCHEMA["numeric"]}
+    with mlflow.start_run(experiment_id=experiment_id) as newer_run:
+        mlflow.log_dict(newer, SCHEMA_ARTIFACT_PATH)
+    digest = registry.accept(newer, newer_run.info.run_id)
+    assert registry.latest() == (newer, newer_run.info.run_id)
+    assert client.get_run(newer_run.info.run_id).data.tags["schema_digest"] == digest
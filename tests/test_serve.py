@@ -0,0 +1,222 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+from scripts import serve
+from scripts.prediction_cache import PredictionCache
+from scripts.serve import (
+    INPUT_COLUMNS,
+    BadRequest,
+    CachedMicroBatcher,
+    InferenceServer,
+    MicroBatcher,
+    parse_payload,
+)
+
+ROW = ["BEDOK", "4 ROOM", "04 TO 06", 104.0, "Model A", 1986, "63 years 02 months"]
+
+
+def _columns(*areas):
+    return {
+        name: [area if name == "floor_area_sqm" else value for area in areas]
+        for name, value in zip(INPUT_COLUMNS, ROW)
+    }
+
+
+def test_parse_payload():
+    split = {"dataframe_split": {"columns": INPUT_COLUMNS[::-1], "data": [ROW[::-1]]}}
+    records = {"dataframe_records": [dict(zip(INPUT_COLUMNS, ROW))]}
+    for payload in [split, records]:
+        columns = parse_payload(json.dumps(payload).encode())
+        assert list(columns) == INPUT_COLUMNS
+        assert [values[0] for values in columns.values()] == ROW
+
+    missing = {"dataframe_split": {"columns": INPUT_COLUMNS[1:], "data": [ROW[1:]]}}
+    for body in [b"{", b"[]", json.dumps(missing).encode()]:
+        with pytest.raises(BadRequest):
+            parse_payload(body)
+
+
+def _area_score(batches):
+    def score(columns):
+        if "bad" in columns["floor_area_sqm"]:
+            raise ValueError("bad area")
+        batches.append(len(columns["floor_area_sqm"]))
+        return [2 * area for area in columns["floor_area_sqm"]]
+
+    return score
+
+
+def test_requests_are_scored_in_batches():
+    async def run():
+        batches = []
+        executor = ThreadPoolExecutor(1)
+        batcher = MicroBatcher(
+            _area_score(batches), executor, max_batch_size=4, max_wait_ms=50
+        )
+        batcher.start()
+        requests = [_columns(i) for i in range(9)] + [_columns(*range(5))]
+        results = await asyncio.gather(
+            *[batcher.predict(columns) for columns in requests]
+        )
+        await batcher.stop()
+        executor.shutdown()
+        return batches, results, batcher.metrics
+
+    batches, results, metrics = asyncio.run(run())
+    assert results == [[2 * i] for i in range(9)] + [[0, 2, 4, 6, 8]]
+    # a request larger than the batch size is a batch of its own
+    assert batches == [4, 4, 1, 5]
+    assert metrics.batches == 4
+
+
+def test_bad_request_fails_alone():
+    async def run():
+        batches = []
+        batcher = MicroBatcher(
+            _area_score(batches), ThreadPoolExecutor(1), max_wait_ms=50
+        )
+        batcher.start()
+        results = await asyncio.gather(
+            batcher.predict(_columns(1)),
+            batcher.predict(_columns("bad")),
+            batcher.predict(_columns(3)),
+            return_exceptions=True,
+        )
+        await batcher.stop()
+        return results
+
+    good, bad, other = asyncio.run(run())
+    assert good == [2] and other == [6]
+    assert isinstance(bad, ValueError)
+
+
+async def _http(port, request):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(request)
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if not line.strip():
+            break
+        name, _, value = line.decode().partition(":")
+        headers[name.lower()] = value.strip()
+    body = await reader.readexactly(int(headers["content-length"]))
+    writer.close()
+    return status, json.loads(body)
+
+
+def _post(body):
+    return (
+        "POST /invocations HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n"
+        "Content-Type: application/json\r\nContent-Length: {}\r\n\r\n".format(
+            len(body)
+        ).encode()
+        + body
+    )
+
+
+def test_http_server(monkeypatch):
+    monkeypatch.setattr(serve, "_worker_model", None)
+
+    class AreaModel:
+        def predict(self, context, model_input):
+            return model_input["floor_area_sqm"].to_numpy() * 2
+
+    async def run():
+        executor, in_flight = serve.make_executor(0, AreaModel)
+        server = InferenceServer(
+            MicroBatcher(serve.score_columns, executor, max_in_flight=in_flight)
+        )
+        listener = await server.start("127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        payload = {"dataframe_split": {"columns": INPUT_COLUMNS, "data": [ROW] * 3}}
+        answers = await asyncio.gather(
+            _http(port, _post(json.dumps(payload).encode())),
+            _http(port, _post(b'{"dataframe_split": {}}')),
+            _http(port, b"GET /ping HTTP/1.1\r\nConnection: close\r\n\r\n"),
+            _http(port, b"GET /nothing HTTP/1.1\r\nConnection: close\r\n\r\n"),
+        )
+        metrics = await _http(port, b"GET /metrics HTTP/1.0\r\n\r\n")
+        await server.stop()
+        executor.shutdown()
+        return answers, metrics
+
+    (ok, bad, ping, missing), (_, metrics) = asyncio.run(run())
+    assert ok == (200, {"predictions": [208.0] * 3})
+    assert bad[0] == 400
+    assert ping == (200, {"status": "ok"})
+    assert missing[0] == 404
+    assert metrics["requests"] == 2 and metrics["errors"] == 1
+    assert metrics["rows"] == 3 and metrics["batches"] == 1
+
+
+class AreaTransformer:
+    def __init__(self, scale):
+        self.scale = scale
+
+    def transform(self, data):
+        return pd.DataFrame({"area": data["floor_area_sqm"] * self.scale})
+
+
+def test_cached_batcher_scores_missed_rows_once():
+    async def run():
+        scored = []
+
+        def score_encoded(X):
+            scored.append(len(X))
+            return X["area"].to_numpy() + 1
+
+        cache = PredictionCache()
+        cache.set_version("run_1")
+        executor = ThreadPoolExecutor(1)
+        batcher = CachedMicroBatcher(
+            AreaTransformer(1), cache, score_encoded, executor, max_wait_ms=50
+        )
+        batcher.start()
+        first = await asyncio.gather(
+            batcher.predict(_columns(1, 2, 1)), batcher.predict(_columns(2, 3))
+        )
+        second = await batcher.predict(_columns(3, 1))
+        batcher.set_model(executor, AreaTransformer(10), "run_2")
+        third = await batcher.predict(_columns(3))
+        await batcher.stop()
+        executor.shutdown()
+        return scored, first, second, third, batcher.metrics.snapshot()["cache"]
+
+    scored, first, second, third, stats = asyncio.run(run())
+    assert first == [[2, 3, 2], [3, 4]] and second == [4, 2] and third == [31]
+    # repeated rows are scored once, cached rows not at all
+    assert scored == [3, 1]
+    assert stats["hits"] == 2 and stats["misses"] == 6
+    assert stats["invalidations"] == 1 and stats["version"] == "run_2"
+
+
+def test_server_errors_are_not_bad_requests():
+    def score(columns):
+        if columns["town"][0] == "NOWHERE":
+            raise ValueError("Unknown town values: ['NOWHERE']")
+        raise RuntimeError("A process in the process pool was terminated abruptly")
+
+    async def run():
+        executor = ThreadPoolExecutor(1)
+        server = InferenceServer(MicroBatcher(score, executor))
+        server.batcher.start()
+        unknown = dict(zip(INPUT_COLUMNS, ["NOWHERE"] + ROW[1:]))
+        answers = [
+            await server.handle(
+                "POST", "/invocations", json.dumps({"dataframe_records": [row]})
+            )
+            for row in (unknown, dict(zip(INPUT_COLUMNS, ROW)))
+        ]
+        await server.batcher.stop()
+        executor.shutdown()
+        return answers, server.metrics.snapshot()
+
+    (bad, broken), metrics = asyncio.run(run())
+    assert bad[0] == 400 and "Unknown town" in bad[1]["error"]
+    assert broken[0] == 500 and broken[1]["error"].startswith("RuntimeError")
+    assert metrics["errors"] == 2 and metrics["server_errors"] == 1
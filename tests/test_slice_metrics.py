@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scripts.feature_transformer import (
+    TARGET,
+    FeatureTransformer,
+    clean_data,
+    fit_vocabulary,
+)
+from scripts.slice_metrics import bootstrap_intervals, slice_cells, sliced_metrics
+
+FILEPATH = "data/resale-flat-prices-2022-jan.csv"
+
+
+@pytest.fixture(scope="module")
+def cleaned():
+    return clean_data(pd.read_csv(FILEPATH))
+
+
+@pytest.fixture(scope="module")
+def transformer(cleaned):
+    return FeatureTransformer(fit_vocabulary(cleaned), onehot_dtype="uint8")
+
+
+def test_sliced_metrics_match_groupby(cleaned, transformer):
+    encoded = transformer.encode(cleaned.copy())
+    X, y = encoded.drop(columns=TARGET), encoded[TARGET].to_numpy()
+    predictions = y + np.random.default_rng(2023).normal(0, 1000, len(y))
+    table = sliced_metrics(X, y, predictions, transformer, num_replicates=0)
+
+    errors = pd.Series(predictions - y, index=cleaned.index)
+    slices = cleaned.assign(
+        lease_bucket=(cleaned["remaining_lease"] // 10 * 10).map(
+            lambda b: "{}-{}".format(b, b + 9)
+        )
+    )
+    for col in ["town", "flat_type", "flat_model", "storey_range", "lease_bucket"]:
+        expected = errors.groupby(slices[col]).agg(
+            count="size", mae=lambda e: e.abs().mean(), bias="mean"
+        )
+        actual = table[table["column"] == col].set_index("value")
+        assert sorted(actual.index) == sorted(expected.index)
+        pd.testing.assert_frame_equal(
+            actual.loc[expected.index, ["count", "mae", "bias"]],
+            expected,
+            check_names=False,
+        )
+
+
+def test_bootstrap_intervals_independent_of_workers():
+    rng = np.random.default_rng(2023)
+    # the last value of the second column has no rows
+    codes = np.vstack([rng.integers(0, 3, 1000), rng.integers(0, 2, 1000)])
+    cells, cell_ids = slice_cells(codes, [3, 3])
+    assert cell_ids.shape == (2, 6)
+    abs_errors = rng.exponential(100, 1000)
+    low, high = bootstrap_intervals(cells, cell_ids, abs_errors, 6, num_replicates=60)
+    assert np.isnan(low[5]) and np.isnan(high[5])
+    slices = [codes[0] == c for c in range(3)] + [codes[1] == c for c in range(2)]
+    for i, rows in enumerate(slices):
+        assert low[i] < abs_errors[rows].mean() < high[i]
+
+    parallel = bootstrap_intervals(
+        cells, cell_ids, abs_errors, 6, num_replicates=60, workers=2
+    )
+    np.testing.assert_array_equal(parallel, (low, high))
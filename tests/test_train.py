@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scripts.train import continue_training, make_estimator, train_model
+from scripts.utils import ENGINES
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_make_estimator(engine):
+    rng = np.random.default_rng(2023)
+    X = pd.DataFrame(rng.normal(size=(200, 3)), columns=["a", "b", "c"])
+    y = 100 * X["a"] + rng.normal(size=200)
+    estimator = make_estimator(engine, 10, "sqrt", 2, 2, 1).fit(X, y)
+    assert estimator.predict(X).shape == (200,)
+    assert list(estimator.feature_names_in_) == ["a", "b", "c"]
+
+
+def test_make_estimator_criterion():
+    assert make_estimator("rf_mae", 10, "sqrt", 1, 2, 1).criterion == "absolute_error"
+    assert make_estimator("rf_mse", 10, "sqrt", 1, 2, 1).criterion == "squared_error"
+    assert make_estimator("hgb", 10, "sqrt", 1, 2, 1).loss == "absolute_error"
+    with pytest.raises(ValueError):
+        make_estimator("svm", 10, "sqrt", 1, 2, 1)
+
+
+def test_train_model_hgb_csr():
+    split = pd.DataFrame({"resale_price": [1.0, 2.0], "a": [0.0, 1.0]})
+    with pytest.raises(ValueError):
+        train_model(split, split, 10, "sqrt", 1, 2, 1, None, "csr", "hgb")
+
+
+def test_continue_training_forest():
+    rng = np.random.default_rng(2023)
+    X = pd.DataFrame(rng.normal(size=(400, 3)), columns=["a", "b", "c"])
+    y = 100 * X["a"] + rng.normal(size=400)
+    estimator = make_estimator("rf_mse", 10, "sqrt", 2, 2, 1).fit(X[:200], y[:200])
+    base_trees = list(estimator.estimators_)
+
+    continue_training(estimator, X[200:], y[200:], 5)
+    assert len(estimator.estimators_) == 15
+    assert estimator.estimators_[:10] == base_trees
+    assert not estimator.warm_start
+
+    continue_training(estimator, X[200:], y[200:], 5, max_estimators=12)
+    assert len(estimator.estimators_) == estimator.n_estimators == 12
+    assert base_trees[-2:] == estimator.estimators_[:2]
+    assert estimator.predict(X).shape == (400,)
+
+
+def test_continue_training_boosting():
+    rng = np.random.default_rng(2023)
+    X = pd.DataFrame(rng.normal(size=(400, 3)), columns=["a", "b", "c"])
+    y = 100 * X["a"] + rng.normal(size=400)
+    base = make_estimator("hgb", 10, None, 2, 2, 1).fit(X[:200], y[:200])
+    base_predictions = base.predict(X)
+
+    estimator = continue_training(base, X[200:], y[200:], 5)
+    assert type(estimator).__name__ == "StagedBoostingRegressor"
+    assert estimator.stages[0] is base and estimator.n_iter_ == 15
+    np.testing.assert_array_equal(base.predict(X), base_predictions)
+    assert list(estimator.feature_names_in_) == ["a", "b", "c"]
+    # the new stage corrects the residuals of the new rows
+    new_mae = np.abs(y[200:] - estimator.predict(X[200:])).mean()
+    assert new_mae < np.abs(y[200:] - base_predictions[200:]).mean()
+
+    estimator = continue_training(estimator, X[200:], y[200:], 5)
+    assert len(estimator.stages) == 3 and estimator.n_iter_ == 20
+    with pytest.raises(ValueError):
+        continue_training(estimator, X, y, 5, max_estimators=10)
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+import scripts  # noqa: F401, puts the scripts on sys.path
+import tree_ensemble
+from scipy import sparse
+from scripts.train import continue_training, make_estimator
+from scripts.utils import ENGINES
+from tree_ensemble import FlatTreeEnsemble
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(2023)
+    X = pd.DataFrame(rng.normal(size=(600, 4)), columns=["a", "b", "c", "d"])
+    X["d"] = (X["d"] > 0).astype(float)
+    y = 100 * X["a"] + 10 * X["b"] * X["d"] + rng.normal(size=600)
+    return X, y
+
+
+@pytest.mark.parametrize("compiled", [False, True])
+@pytest.mark.parametrize("max_depth", [1, None])
+@pytest.mark.parametrize("engine", ENGINES)
+def test_predict_equals_estimator(data, engine, max_depth, compiled, monkeypatch):
+    if compiled:
+        pytest.importorskip("numba")
+        monkeypatch.setattr(tree_ensemble, "COMPILED_MIN_ROWS", 1)
+    X, y = data
+    estimator = make_estimator(engine, 10, "sqrt", max_depth, 2, 1).fit(X, y)
+    if hasattr(estimator, "n_jobs"):
+        # sklearn sums the trees in the order they finish with more jobs
+        estimator.set_params(n_jobs=1)
+    flat = FlatTreeEnsemble.from_estimator(estimator)
+    assert flat.num_trees == 10
+
+    # columns are reordered by name
+    shuffled = X[["d", "c", "b", "a"]]
+    np.testing.assert_array_equal(flat.predict(shuffled), estimator.predict(X))
+    if engine == "hgb":
+        missing = X.mask(np.random.default_rng(0).random(X.shape) < 0.2)
+        np.testing.assert_array_equal(flat.predict(missing), estimator.predict(missing))
+    else:
+        np.testing.assert_array_equal(
+            flat.predict(sparse.csr_matrix(X.to_numpy())),
+            estimator.predict(X.to_numpy()),
+        )
+
+
+def test_staged_boosting(data):
+    X, y = data
+    estimator = make_estimator("hgb", 10, "sqrt", 3, 2, 1).fit(X[:300], y[:300])
+    estimator = continue_training(estimator, X[300:], y[300:], 5)
+    flat = FlatTreeEnsemble.from_estimator(estimator)
+    assert flat.num_trees == 15
+    # the baselines of the stages are added before their trees
+    np.testing.assert_allclose(flat.predict(X), estimator.predict(X))
+
+
+def test_save_load_memory_maps(data, tmp_path):
+    X, y = data
+    estimator = make_estimator("hgb", 10, "sqrt", 3, 2, 1).fit(X, y)
+    FlatTreeEnsemble.from_estimator(estimator).save(str(tmp_path))
+
+    flat = FlatTreeEnsemble.load(str(tmp_path))
+    assert isinstance(flat.arrays["threshold"], np.memmap)
+    assert flat.kind == "boosting" and flat.feature_names == ["a", "b", "c", "d"]
+    np.testing.assert_array_equal(flat.predict(X), estimator.predict(X))
+    assert flat.predict(X[:0]).shape == (0,)
+
+
+def test_load_model_falls_back_to_sklearn(data, tmp_path, monkeypatch):
+    import mlflow
+
+    X, y = data
+    estimator = make_estimator("rf_mse", 5, "sqrt", 3, 2, 1).fit(X, y)
+    monkeypatch.setattr(mlflow.sklearn, "load_model", lambda uri: estimator)
+
+    model_dir = tmp_path / "model"
+    model_dir.mkdir()
+    assert tree_ensemble.load_model(str(model_dir)) is estimator
+
+    FlatTreeEnsemble.from_estimator(estimator).save(str(tmp_path / "flat_model"))
+    assert isinstance(tree_ensemble.load_model(str(model_dir)), FlatTreeEnsemble)
@@ -0,0 +1,41 @@
+import mlflow
+import numpy as np
+import pandas as pd
+import pytest
+from mlflow.tracking import MlflowClient
+from scripts.tune import (
+    ESTIMATOR_PARAMS,
+    load_best_params,
+    memmap_features,
+    tune_model,
+)
+
+
+def test_memmap_features(tmp_path):
+    train = pd.DataFrame({"resale_price": [1.0, 2.0], "a": [3, 4], "b": [5.0, 6.0]})
+    X, y = memmap_features(train, str(tmp_path))
+    assert isinstance(X, np.memmap) and not X.flags.writeable
+    assert X.tolist() == [[3.0, 5.0], [4.0, 6.0]] and y.tolist() == [1.0, 2.0]
+
+
+@pytest.mark.parametrize("engine", ["rf_mse", "hgb"])
+def test_tune_model(tmp_path, monkeypatch, engine):
+    monkeypatch.setenv("MLFLOW_TRACKING_URI", "file://{}".format(tmp_path / "mlruns"))
+    rng = np.random.default_rng(2023)
+    X = rng.normal(size=(300, 4))
+    y = 3 * X[:, 0] + rng.normal(size=300)
+    with mlflow.start_run() as run:
+        best_params = tune_model(
+            X, y, n_candidates=4, cv=2, factor=2, workers=1, engine=engine
+        )
+    # keyword arguments of `train_model`, only those the engine uses
+    assert set(best_params) == set(ESTIMATOR_PARAMS[engine])
+    assert load_best_params(run.info.run_id) == best_params
+
+    trials = MlflowClient().search_runs(
+        [run.info.experiment_id],
+        filter_string="tags.mlflow.parentRunId = '{}'".format(run.info.run_id),
+    )
+    # 4 candidates, then the best 2, then the best one
+    assert len(trials) == 7
+    assert all("cv_mae" in trial.data.metrics for trial in trials)
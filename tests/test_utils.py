@@ -1,6 +1,17 @@
 import pytest
+import numpy as np
 import pandas as pd
-from scripts.utils import onehotencode, infer_schema, compare_data_to_schema
+from scripts.utils import (
+    onehotencode,
+    to_csr,
+    infer_schema,
+    compare_data_to_schema,
+    compare_drift_to_schema,
+    missing_data,
+    profile_data,
+    save_splits,
+    load_split,
+)
 
 
 # # # #
@@ -132,4 +143,91 @@ def test_compare_data_to_schema_notInDomain():
     )
 
 
+@pytest.mark.parametrize("data_format", ["csv", "parquet", "feather", "npy"])
+def test_save_load_splits(tmp_path, data_format):
+    df = pd.DataFrame(
+        {
+            "resale_price": [1.0, 2.5, 3.0],
+            "remaining_lease": pd.Series([60, 70, 80], dtype="int16"),
+            "flat_type": [0, 3, 6],
+            "BEDOK": [0.0, 1.0, 0.0],
+        }
+    )
+    splits = {"train": df, "validation": df.iloc[:2], "test": df.iloc[2:]}
+    paths = save_splits(splits, str(tmp_path), data_format)
+    assert [p.split("/")[-1] for p in paths][-1] == "manifest.json"
+    for name, split in splits.items():
+        loaded = load_split(str(tmp_path), name)
+        pd.testing.assert_frame_equal(loaded, split.reset_index(drop=True))
+
+
+def test_load_split_without_manifest(tmp_path):
+    df = pd.DataFrame({"resale_price": [1.0, 2.0], "flat_type": [1, 2]})
+    df.to_csv(tmp_path / "test.csv", index=False)
+    pd.testing.assert_frame_equal(load_split(str(tmp_path), "test"), df)
+
+
+def test_onehotencode_uint8():
+    data = pd.DataFrame({"numeric": [1.0, 2.0, 3.0], "object": ["foo", "bar", "baz"]})
+    data, ohe_features, _ = onehotencode(data, "object", dtype="uint8")
+    assert (data[ohe_features].dtypes == "uint8").all()
+    assert data["foo"].tolist() == [1, 0, 0]
+
+
+def test_to_csr():
+    df = pd.DataFrame(
+        {"numeric": [1.5, 0.0, 3.0], "a": [0, 1, 0], "b": [0, 0, 1]}
+    ).astype({"a": "uint8", "b": "uint8"})
+    X = to_csr(df)
+    assert X.format == "csr" and X.nnz == 4
+    assert (X.toarray() == df.to_numpy(dtype="float32")).all()
+
+
+def test_profile_data():
+    data = pd.DataFrame(
+        {"numeric": [1.0, None, 3.0], "object": ["foo", "bar", "foo"], "int": [4, 5, 6]}
+    )
+    profile = profile_data(data)
+    assert (profile["numeric"].min, profile["numeric"].max) == (1.0, 3.0)
+    assert profile["object"].domain == {"foo": 2, "bar": 1}
+    assert profile["int"].domain is None
+    assert missing_data(profile) == {"numeric": 1}
+
+
+def test_infer_and_compare_schema_with_profile():
+    data = pd.DataFrame({"numeric": [1.0, 2.0, 3.0], "object": ["foo", "bar", "baz"]})
+    profile = profile_data(data)
+    schema = infer_schema(data, profile)
+    assert schema == infer_schema(data)
+    assert compare_data_to_schema(data, schema, profile) == "Passed"
+    assert missing_data(profile) == {}
+
+
+def test_compare_drift_to_schema():
+    rng = np.random.default_rng(2023)
+    data = pd.DataFrame(
+        {
+            "numeric": rng.normal(100.0, 10.0, 10000),
+            "object": rng.choice(["foo", "bar", "baz"], 10000),
+        }
+    )
+    schema = infer_schema(data, num_bins=5)
+    assert len(schema["numeric"]["bins"]["freqs"]) == 5
+    assert schema["object"]["bins"]["categories"][-1] in ["foo", "bar", "baz"]
+
+    status, scores = compare_drift_to_schema(schema, profile_data(data))
+    assert status == "Passed" and scores["numeric"]["psi"] < 1e-6
+
+    data["numeric"] += 10.0
+    data.loc[:5000, "object"] = "qux"
+    status, scores = compare_drift_to_schema(schema, profile_data(data))
+    assert status == "Failed"
+    assert scores["numeric"]["psi"] > 0.25 and scores["numeric"]["ks"] > 0.25
+    assert scores["object"]["psi"] > 0.25
+    status, scores = compare_drift_to_schema(
+        schema, profile_data(data), exclude=("numeric", "object")
+    )
+    assert status == "Passed" and scores == {}
+
+
 # python -m pytest -s -v ./tests/